@@ -1,15 +1,34 @@
 from fastapi import FastAPI, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterator, List, Optional, Any, Tuple
 import uuid
 import os
 from datetime import datetime, timedelta
 import google.generativeai as genai
-from supabase import create_client, Client
 import asyncio
 from dotenv import load_dotenv
 import re
 import json
+import hashlib
+import weakref
+from cachetools import TTLCache
+from embeddings import embed_text, embed_texts, embedding_cache, EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY
+from chunking import Chunk, batched, iter_chunks
+from llm_client import generate_content, stream_content
+from repository import SupabaseRepository
+from vector_index import LocalVectorIndex, LOCAL_VECTOR_INDEX
+from story_memory import StoryMemory, element_aggregate
+from task_queue import AgentTaskQueue, QueueFullError
+from pipeline import Stage, run_stages
+from structured_output import StructuredOutputError, generate_structured
+from model_registry import get_model, model_summary
+from session_store import create_session_store
+from request_gate import SupersedeGate, SupersededError, AUTO_SUGGEST_DEBOUNCE_MS
+from suggestion_cache import SuggestionCache
+from suggestion_parsing import SuggestionStreamParser, parse_suggestion_line
+from prompt_builder import PromptBuilder, PromptWindow
+from agent_schemas import ContinuityAnalysis, StoryElements
 
 # Load environment variables
 load_dotenv()
@@ -30,108 +49,250 @@ if not gemini_api_key:
 # Configure Gemini
 genai.configure(api_key=gemini_api_key)
 
-supabase: Client = create_client(supabase_url, supabase_key)
+# Shared async data-access layer (one pooled client per worker)
+repository = SupabaseRepository(supabase_url, supabase_key)
 
-# In-memory sessions (can be moved to database later if needed)
-SESSIONS = {}
+# Optional in-process vector search, warm-loaded per user from the embedding table
+local_vector_index = LocalVectorIndex(repository)
+
+# Background workers for long-running agent jobs, backed by the agent_task table
+agent_task_queue = AgentTaskQueue(repository)
+
+# Longest a client may block on GET /agent_task/{task_id}?wait=...
+AGENT_TASK_MAX_WAIT_SECONDS = 60
+
+# Columns /agent_tasks can project; the "result" JSON (analyses, payloads) only when asked for
+AGENT_TASK_FIELDS = ("id", "document_id", "section_id", "task_type", "status", "result", "created_at", "updated_at")
+AGENT_TASK_DEFAULT_FIELDS = ("id", "document_id", "section_id", "task_type", "status", "created_at", "updated_at")
+AGENT_TASK_PAGE_SIZE = 50
+AGENT_TASK_MAX_PAGE_SIZE = 200
+
+# Upper bound for each step of the /analyze_content pipeline
+ANALYSIS_TIMEOUT_SECONDS = float(os.getenv("ANALYSIS_TIMEOUT_SECONDS", "45"))
+
+# Token budget for document chunks sent to the embedding model
+CHUNK_MAX_TOKENS = 512
+CHUNK_OVERLAP_TOKENS = 64
+
+# Story content added through the continuity agent is embedded in smaller chunks,
+# and each continuity check retrieves this many earlier passages
+STORY_CHUNK_MAX_TOKENS = 256
+STORY_CHUNK_OVERLAP_TOKENS = 32
+CONTINUITY_PASSAGE_COUNT = 6
+CONTINUITY_MAX_QUERY_CHUNKS = 8
+
+# Document types accepted by /create_document and PUT /documents/{doc_id}
+VALID_DOCUMENT_TYPES = ["plot", "character", "book_idea", "story"]
+
+# Sessions live in the shared session store (Redis when REDIS_URL is set) with sliding expiry
+session_store = create_session_store()
+
+# Latest-wins /auto_suggest per session: a new request cancels the session's older in-flight one
+# (per process, so with several workers this needs session affinity)
+auto_suggest_gate = SupersedeGate(debounce_seconds=AUTO_SUGGEST_DEBOUNCE_MS / 1000)
+# Recent auto-suggestions per session, reused while the user keeps typing
+suggestion_cache = SuggestionCache()
+# Cursor windows and cached summaries of earlier text for suggestion prompts
+prompt_builder = PromptBuilder()
+
+# Users seen recently, so session-scoped requests skip the user lookup; filled at
+# start_session. No endpoint modifies user rows, so entries simply expire.
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+user_cache = TTLCache(maxsize=10000, ttl=USER_CACHE_TTL_SECONDS)
 
 # Only Creative Domain
 DOMAIN_PROMPT = "You are a creative writing assistant. Help with stories, characters, plots, and imaginative prose."
 
 # Helper functions for text processing and embedding
-def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-    """Split text into overlapping chunks for embedding"""
-    words = text.split()
-    chunks = []
-    
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i + chunk_size])
-        chunks.append(chunk)
-        
-        if i + chunk_size >= len(words):
-            break
-    
-    return chunks
-
 async def generate_embedding(text: str) -> List[float]:
     """Generate embedding using Gemini's embedding model"""
-    try:
-        # Use Gemini's text embedding model
-        result = genai.embed_content(
-            model="models/text-embedding-004",
-            content=text,
-            task_type="retrieval_document"
-        )
-        return result['embedding']
-    except Exception as e:
-        print(f"Error generating embedding: {e}")
-        # Return a zero vector as fallback
-        return [0.0] * 768  # text-embedding-004 produces 768-dimensional vectors
+    vector = await embed_text(text, task_type="retrieval_document")
+    if vector is None:
+        raise RuntimeError("Embedding request failed")
+    return vector
+
+def document_header(title: str, doc_type: str) -> str:
+    """Prefix placed before a document's description when it is chunked"""
+    return f"Title: {title}\nType: {doc_type}\nContent: "
+
+def document_chunks(title: str, description: str, doc_type: str) -> Iterator[Chunk]:
+    """Lazily split a document into the chunks that get embedded"""
+    # Combine title and description for full context
+    full_text = document_header(title, doc_type) + description
+    return iter_chunks(full_text, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
+
+def story_content_hash(text: str) -> str:
+    """sha256 of story content, matching story_chapter.content_hash"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_content_hash(chunk: str, title: str, doc_type: str) -> str:
+    """Hash of everything stored with a chunk, so any change forces a re-embed"""
+    return hashlib.sha256(f"{title}\x00{doc_type}\x00{chunk}".encode("utf-8")).hexdigest()
+
+def chunk_embedding_id(document_id: str, chunk_hash: str, occurrence: int) -> str:
+    """Deterministic embedding row id for the n-th chunk with a given hash"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"embedding:{document_id}:{chunk_hash}:{occurrence}"))
+
+def chunk_embedding_ids(document_id: str, hashes: List[str], seen: Optional[Dict[str, int]] = None) -> List[str]:
+    """Deterministic embedding row ids derived from chunk hashes (repeated chunks get distinct ids)"""
+    seen = {} if seen is None else seen
+    ids = []
+    for chunk_hash in hashes:
+        occurrence = seen.get(chunk_hash, 0)
+        seen[chunk_hash] = occurrence + 1
+        ids.append(chunk_embedding_id(document_id, chunk_hash, occurrence))
+    return ids
+
+def build_embedding_row(embedding_id: str, document_id: str, chunk: Chunk, chunk_hash: str,
+                        vector: Any, title: str, doc_type: str, created_by: str) -> Dict:
+    """Create an embedding record for one chunk"""
+    # Offsets point into the document description so results map back into the editor
+    header_length = len(document_header(title, doc_type))
+    return {
+        "id": embedding_id,
+        "document_id": document_id,
+        "created_by": created_by,  # denormalized owner for filtered vector search
+        "section_id": f"chunk_{chunk.index}",
+        "vector": vector,
+        "metadata": {
+            "chunk_index": chunk.index,
+            "chunk_text": chunk.text,
+            "chunk_hash": chunk_hash,
+            "start_offset": max(0, chunk.start - header_length),
+            "end_offset": max(0, chunk.end - header_length),
+            "document_title": title,
+            "document_type": doc_type,
+            "text_length": len(chunk.text)
+        },
+        "created_at": datetime.now().isoformat(),
+        "updated_at": datetime.now().isoformat()
+    }
 
-async def store_document_embeddings(document_id: str, title: str, description: str, doc_type: str):
+async def store_document_embeddings(document_id: str, title: str, description: str, doc_type: str, created_by: str):
     """Generate and store embeddings for a document"""
     try:
-        # Combine title and description for full context
-        full_text = f"Title: {title}\nType: {doc_type}\nContent: {description}"
-        
-        # Split into chunks
-        chunks = chunk_text(full_text, chunk_size=400, overlap=50)
-        
-        embeddings_to_insert = []
-        
-        for i, chunk in enumerate(chunks):
-            # Generate embedding for this chunk
-            embedding_vector = await generate_embedding(chunk)
+        stored = 0
+        failed = 0
+        occurrences: Dict[str, int] = {}
+        
+        # Work through the document one window of chunks at a time, so a long
+        # manuscript never holds every chunk and vector in memory at once
+        for window in batched(document_chunks(title, description, doc_type), EMBEDDING_BATCH_SIZE * EMBEDDING_CONCURRENCY):
+            hashes = [chunk_content_hash(chunk.text, title, doc_type) for chunk in window]
+            embedding_ids = chunk_embedding_ids(document_id, hashes, occurrences)
             
-            # Create embedding record
-            embedding_data = {
-                "id": str(uuid.uuid4()),
-                "document_id": document_id,
-                "section_id": f"chunk_{i}",
-                "vector": embedding_vector,
-                "metadata": {
-                    "chunk_index": i,
-                    "chunk_text": chunk,
-                    "document_title": title,
-                    "document_type": doc_type,
-                    "text_length": len(chunk)
-                },
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat()
-            }
+            # Embed the window's chunks in concurrent multi-content batches
+            embedding_vectors = await embed_texts([chunk.text for chunk in window], task_type="retrieval_document")
             
-            embeddings_to_insert.append(embedding_data)
-        
-        # Batch insert embeddings
-        if embeddings_to_insert:
-            result = supabase.table("embedding").insert(embeddings_to_insert).execute()
-            return len(embeddings_to_insert)
+            # Chunks whose embedding failed are not stored, so the next update embeds them again
+            embeddings_to_insert = [
+                build_embedding_row(embedding_id, document_id, chunk, chunk_hash, vector, title, doc_type, created_by)
+                for embedding_id, chunk, chunk_hash, vector in zip(embedding_ids, window, hashes, embedding_vectors)
+                if vector is not None
+            ]
+            failed += len(window) - len(embeddings_to_insert)
+            
+            # Batch insert embeddings
+            if embeddings_to_insert:
+                await repository.insert_embeddings(embeddings_to_insert)
+                local_vector_index.add(created_by, embeddings_to_insert)
+            stored += len(embeddings_to_insert)
         
-        return 0
+        if failed:
+            print(f"Error storing embeddings: {failed} chunks could not be embedded")
+        return stored
         
     except Exception as e:
         print(f"Error storing embeddings: {e}")
         return 0
 
+async def update_document_embeddings(document_id: str, title: str, description: str, doc_type: str, created_by: str) -> Dict[str, int]:
+    """Re-chunk an edited document and re-embed only the chunks whose content changed"""
+    chunks = list(document_chunks(title, description, doc_type))
+    hashes = [chunk_content_hash(chunk.text, title, doc_type) for chunk in chunks]
+    embedding_ids = chunk_embedding_ids(document_id, hashes)
+    
+    # Existing rows carry their chunk hash in metadata, so no vectors are downloaded here
+    existing_rows = await repository.list_embedding_chunks(document_id)
+    existing_sections = {row["id"]: row.get("section_id") for row in existing_rows}
+    
+    changed = []  # chunk positions that need a new embedding
+    moved = []    # unchanged chunks that now sit at a different position
+    for i, embedding_id in enumerate(embedding_ids):
+        if embedding_id not in existing_sections:
+            changed.append(i)
+        elif existing_sections[embedding_id] != f"chunk_{i}":
+            moved.append(i)
+    
+    rows_to_upsert = []
+    failed = []   # changed chunks whose embedding failed; left unstored so the next update retries them
+    
+    if moved:
+        # Reuse stored vectors for chunks that only shifted position
+        stored_vectors = await repository.get_embedding_vectors([embedding_ids[i] for i in moved])
+        for i in moved:
+            vector = stored_vectors.get(embedding_ids[i])
+            if vector is None:
+                changed.append(i)
+                continue
+            rows_to_upsert.append(build_embedding_row(embedding_ids[i], document_id, chunks[i], hashes[i], vector, title, doc_type, created_by))
+        moved = [i for i in moved if i not in changed]
+    
+    if changed:
+        vectors = await embed_texts([chunks[i].text for i in changed], task_type="retrieval_document")
+        for i, vector in zip(changed, vectors):
+            if vector is None:
+                failed.append(i)
+                continue
+            rows_to_upsert.append(build_embedding_row(embedding_ids[i], document_id, chunks[i], hashes[i], vector, title, doc_type, created_by))
+    
+    if rows_to_upsert:
+        await repository.upsert_embeddings(rows_to_upsert)
+        local_vector_index.add(created_by, rows_to_upsert)
+    
+    # Drop every row that no longer matches a chunk in one batch
+    current_ids = set(embedding_ids)
+    stale_ids = [embedding_id for embedding_id in existing_sections if embedding_id not in current_ids]
+    deleted = await repository.delete_embeddings(stale_ids)
+    local_vector_index.remove(created_by, stale_ids)
+    
+    return {
+        "total_chunks": len(chunks),
+        "embedded": len(changed) - len(failed),
+        "failed": len(failed),
+        "moved": len(moved),
+        "unchanged": len(chunks) - len(changed) - len(moved),
+        "deleted": deleted
+    }
+
 async def search_similar_content(query: str, user_id: str, limit: int = 5) -> List[Dict]:
     """Search for similar content using vector similarity"""
     try:
         # Generate embedding for the query
         query_embedding = await generate_embedding(query)
         
+        # Small per-user corpora are searched in-process without a network round trip
+        if LOCAL_VECTOR_INDEX and local_vector_index.available:
+            try:
+                return await local_vector_index.search(user_id, query_embedding, limit=limit, match_threshold=0.7)
+            except Exception as e:
+                print(f"Local vector index unavailable, using search_embeddings RPC: {e}")
+        
         # Use pgvector similarity search
         # Note: This requires the pgvector extension and proper vector column setup
-        result = supabase.rpc(
-            'search_embeddings',
-            {
-                'query_embedding': query_embedding,
-                'user_id': user_id,
-                'match_threshold': 0.7,
-                'match_count': limit
-            }
-        ).execute()
-        
-        return result.data if result.data else []
+        try:
+            return await repository.search_embeddings(
+                query_embedding,
+                user_id,
+                match_threshold=0.7,
+                match_count=limit
+            )
+        except Exception as e:
+            # With LOCAL_VECTOR_INDEX on, the local index was already tried above
+            if LOCAL_VECTOR_INDEX or not local_vector_index.available:
+                raise
+            print(f"search_embeddings RPC unavailable, using local vector index: {e}")
+            return await local_vector_index.search(user_id, query_embedding, limit=limit, match_threshold=0.7)
         
     except Exception as e:
         print(f"Error in similarity search: {e}")
@@ -251,6 +412,21 @@ def analyze_writing_context(text: str, cursor_position: Optional[int] = None) ->
     
     return analysis
 
+async def run_analysis_step(coro, fallback: Any, timeout: float = ANALYSIS_TIMEOUT_SECONDS) -> Any:
+    """Await one analysis step, returning a fallback result if it fails or times out.
+
+    A dict fallback gets an "error" entry saying what went wrong.
+    """
+    try:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"Analysis step timed out after {timeout}s")
+        error = "timeout"
+    except Exception as e:
+        print(f"Error in analysis step: {e}")
+        error = str(e)
+    return dict(fallback, error=error) if isinstance(fallback, dict) else fallback
+
 async def analyze_story_structure(text: str, user_context: str) -> Dict:
     """Analyze the story structure, plot, and narrative elements"""
     try:
@@ -274,8 +450,8 @@ async def analyze_story_structure(text: str, user_context: str) -> Dict:
         Format your response as structured feedback with specific examples and actionable suggestions.
         """
 
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(analysis_prompt)
+        model = get_model("analysis")
+        response = await generate_content(model, analysis_prompt)
         
         # Parse the response into structured data
         analysis_text = response.text
@@ -319,8 +495,8 @@ async def generate_plot_improvements(text: str, user_context: str) -> List[str]:
         Format each as a clear, implementable recommendation.
         """
 
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(improvement_prompt)
+        model = get_model("analysis")
+        response = await generate_content(model, improvement_prompt)
         
         # Parse suggestions from response
         suggestions = []
@@ -379,8 +555,8 @@ async def analyze_writing_quality(text: str, user_context: str) -> Dict:
         Be encouraging but constructive in your feedback.
         """
 
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(quality_prompt)
+        model = get_model("analysis")
+        response = await generate_content(model, quality_prompt)
         
         return {
             "detailed_feedback": response.text,
@@ -400,16 +576,20 @@ async def analyze_writing_quality(text: str, user_context: str) -> Dict:
 class PlotContinuityAgent:
     """Database-backed agentic AI that monitors story for continuity issues and plot holes"""
     
-    def __init__(self, supabase_client):
-        self.supabase = supabase_client
+    def __init__(self, repository: SupabaseRepository):
+        self.repository = repository
+        self.memory = StoryMemory(repository)
+        # Stages of this agent's run that fell back to placeholder output
+        self.fallbacks: List[str] = []
         
-    async def add_story_context(self, document_id: str, content: str, chapter_title: str = None):
-        """Add story content and create agent task for analysis"""
+    async def add_story_context(self, document_id: str, content: str, chapter_title: str = None) -> Dict:
+        """Add story content as the document's next chapter and create agent task for analysis"""
         
         # Create document if it doesn't exist
-        existing_doc = self.supabase.table("document").select("*").eq("id", document_id).execute()
-        if not existing_doc.data:
-            self.supabase.table("document").insert({
+        existing_doc = await self.repository.get_document(document_id)
+        created_by = existing_doc["created_by"] if existing_doc else "user"
+        if not existing_doc:
+            await self.repository.insert_document({
                 "id": document_id,
                 "title": chapter_title or "Story Content",
                 "type": "story",
@@ -417,17 +597,40 @@ class PlotContinuityAgent:
                 "created_by": "user",
                 "created_at": datetime.utcnow().isoformat(),
                 "updated_at": datetime.utcnow().isoformat()
-            }).execute()
+            })
+        
+        # Store the chapter text once; tasks only reference it
+        chapter = await self.repository.append_story_chapter(
+            str(uuid.uuid4()), document_id, chapter_title, content, story_content_hash(content), str(uuid.uuid4())
+        )
+        task_id = chapter["context_task_id"]
+        context = {
+            "task_id": task_id,
+            "chapter_id": chapter["id"],
+            "sequence_number": chapter["sequence_number"],
+            "content_hash": chapter["content_hash"],
+            "previous_state_hash": chapter["previous_state_hash"]
+        }
+        
+        # Identical content was added before: reuse its chapter, and re-create the context task
+        # and embeddings if a failure after the chapter insert left them unwritten
+        if chapter["created"] or await self.repository.get_agent_task(task_id) is None:
+            await self._store_context_task(document_id, task_id, chapter, chapter_title, content)
         
-        # Create agent task for story analysis
-        task_id = str(uuid.uuid4())
+        # Embed the chapter so later continuity checks can retrieve just the relevant passages
+        await self._store_story_embeddings(document_id, task_id, chapter_title, content, created_by)
+        return context
+    
+    async def _store_context_task(self, document_id: str, task_id: str, chapter: Dict, chapter_title: Optional[str], content: str):
+        """Record the story_context_added task that references a stored chapter"""
         task = {
             "id": task_id,
             "document_id": document_id,
             "task_type": "story_context_added",
             "status": "completed",
             "result": {
-                "content": content,
+                "chapter_id": chapter["id"],
+                "sequence_number": chapter["sequence_number"],
                 "chapter_title": chapter_title,
                 "timestamp": datetime.utcnow().isoformat(),
                 "length": len(content)
@@ -436,34 +639,120 @@ class PlotContinuityAgent:
             "updated_at": datetime.utcnow().isoformat()
         }
         
-        self.supabase.table("agent_task").insert(task).execute()
-        return task_id
+        await self.repository.upsert_agent_task(task)
     
-    async def analyze_continuity(self, document_id: str, new_content: str) -> dict:
-        """Analyze plot continuity by checking against previous story content"""
-        
-        # Get all previous story context for this document
-        existing_tasks = self.supabase.table("agent_task").select("*").eq("document_id", document_id).eq("task_type", "story_context_added").execute()
+    async def _store_story_embeddings(self, document_id: str, task_id: str, chapter_title: Optional[str], content: str, created_by: str) -> int:
+        """Chunk and embed added story content into the embedding table, skipping chunks already stored"""
+        try:
+            chunks = list(iter_chunks(content, max_tokens=STORY_CHUNK_MAX_TOKENS, overlap_tokens=STORY_CHUNK_OVERLAP_TOKENS))
+            stored = set(await self.repository.list_story_embedding_sections(document_id, task_id))
+            chunks = [chunk for chunk in chunks if f"story_{task_id}_chunk_{chunk.index}" not in stored]
+            if not chunks:
+                return 0
+            vectors = await embed_texts([chunk.text for chunk in chunks], task_type="retrieval_document")
+            
+            rows = [
+                {
+                    "id": str(uuid.uuid4()),
+                    "document_id": document_id,
+                    "created_by": created_by,
+                    "section_id": f"story_{task_id}_chunk_{chunk.index}",
+                    "vector": vector,
+                    "metadata": {
+                        "chunk_index": chunk.index,
+                        "chunk_text": chunk.text,
+                        "start_offset": chunk.start,
+                        "end_offset": chunk.end,
+                        "chapter_title": chapter_title,
+                        "source_task_id": task_id,
+                        "document_title": chapter_title or "Story Content",
+                        "document_type": "story",
+                        "text_length": len(chunk.text)
+                    },
+                    "created_at": datetime.utcnow().isoformat(),
+                    "updated_at": datetime.utcnow().isoformat()
+                }
+                for chunk, vector in zip(chunks, vectors)
+                if vector is not None
+            ]
+            
+            if rows:
+                await self.repository.insert_embeddings(rows)
+                local_vector_index.add(created_by, rows)
+            # Chunks that failed to embed are retried when the same content is added again
+            if len(rows) < len(chunks):
+                self.fallbacks.append("story_embeddings")
+            return len(rows)
+            
+        except Exception as e:
+            print(f"Error storing story embeddings: {e}")
+            self.fallbacks.append("story_embeddings")
+            return 0
+    
+    async def find_relevant_passages(self, document_id: str, new_content: str, exclude_task_id: Optional[str] = None,
+                                     limit: int = CONTINUITY_PASSAGE_COUNT) -> List[str]:
+        """Retrieve the earlier passages of a document most similar to the new content"""
+        try:
+            chunks = list(iter_chunks(new_content, max_tokens=STORY_CHUNK_MAX_TOKENS, overlap_tokens=STORY_CHUNK_OVERLAP_TOKENS))
+            if not chunks:
+                return []
+            
+            # Query with evenly spaced chunks of the new content; vectors are usually
+            # embedding-cache hits because add_story_context just embedded the same chunks
+            step = max(1, len(chunks) // CONTINUITY_MAX_QUERY_CHUNKS)
+            query_chunks = chunks[::step][:CONTINUITY_MAX_QUERY_CHUNKS]
+            query_vectors = await embed_texts([chunk.text for chunk in query_chunks], task_type="retrieval_document")
+            
+            results = await asyncio.gather(*(
+                self.repository.search_document_embeddings(vector, document_id, match_count=limit, exclude_source_task_id=exclude_task_id)
+                for vector in query_vectors
+                if vector is not None
+            ))
+            
+            # Merge per-chunk results, keeping each passage's best similarity
+            best: Dict[str, Dict] = {}
+            for rows in results:
+                for row in rows:
+                    if row["id"] not in best or row.get("similarity", 0) > best[row["id"]].get("similarity", 0):
+                        best[row["id"]] = row
+            
+            ranked = sorted(best.values(), key=lambda row: row.get("similarity", 0), reverse=True)[:limit]
+            passages = []
+            for row in ranked:
+                metadata = row.get("metadata") or {}
+                title = metadata.get("chapter_title") or metadata.get("document_title") or "Earlier content"
+                passages.append(f"{title}: {metadata.get('chunk_text', '')}")
+            return passages
+            
+        except Exception as e:
+            print(f"Error retrieving relevant passages: {e}")
+            return []
+    
+    async def update_story_memory(self, document_id: str, content: str, chapter_title: str = None, source_task_id: str = None,
+                                  chapter_id: Optional[str] = None) -> Dict:
+        """Fold new story content into the document's chapter summaries and story bible"""
+        memory = await self.memory.add_chapter(document_id, chapter_title, content, source_task_id=source_task_id, chapter_id=chapter_id)
+        if not memory["complete"]:
+            self.fallbacks.append("story_memory")
+        return memory
+    
+    async def analyze_continuity(self, document_id: str, new_content: str, memory: Optional[Dict] = None,
+                                 exclude_task_id: Optional[str] = None, chapter_id: Optional[str] = None) -> dict:
+        """Analyze plot continuity by checking against the story memory built from previous content"""
         
-        # Build story history
-        story_history = []
-        for task in existing_tasks.data:
-            if task.get("result"):
-                story_history.append({
-                    "content": task["result"].get("content", ""),
-                    "chapter_title": task["result"].get("chapter_title"),
-                    "timestamp": task["result"].get("timestamp")
-                })
+        # Compact story state (story bible + recent chapter summaries) instead of every previous chapter
+        if memory is None:
+            memory = await self.memory.load(document_id)
         
-        # Sort by timestamp
-        story_history.sort(key=lambda x: x["timestamp"] if x["timestamp"] else "")
+        # Only the top-k earlier passages relevant to the new content, not the whole manuscript
+        relevant_passages = await self.find_relevant_passages(document_id, new_content, exclude_task_id=exclude_task_id)
         
         # Create analysis task
         analysis_task_id = str(uuid.uuid4())
         
         try:
             # Perform continuity analysis using Gemini
-            analysis_result = await self._perform_continuity_analysis(story_history, new_content)
+            analysis_result = await self._perform_continuity_analysis(memory, new_content, relevant_passages)
             
             # Store analysis result
             task = {
@@ -473,15 +762,17 @@ class PlotContinuityAgent:
                 "status": "completed",
                 "result": {
                     "analysis": analysis_result,
-                    "new_content": new_content,
-                    "story_history_count": len(story_history),
+                    "chapter_id": chapter_id,
+                    "content_length": len(new_content),
+                    "story_history_count": memory["chapters_covered"],
+                    "relevant_passage_count": len(relevant_passages),
                     "timestamp": datetime.utcnow().isoformat()
                 },
                 "created_at": datetime.utcnow().isoformat(),
                 "updated_at": datetime.utcnow().isoformat()
             }
             
-            self.supabase.table("agent_task").insert(task).execute()
+            await self.repository.insert_agent_task(task)
             return analysis_result
             
         except Exception as e:
@@ -499,19 +790,17 @@ class PlotContinuityAgent:
                 "updated_at": datetime.utcnow().isoformat()
             }
             
-            self.supabase.table("agent_task").insert(task).execute()
+            await self.repository.insert_agent_task(task)
             raise e
     
-    async def _perform_continuity_analysis(self, story_history: list, new_content: str) -> dict:
+    async def _perform_continuity_analysis(self, memory: Dict, new_content: str, relevant_passages: Optional[List[str]] = None) -> dict:
         """Perform actual continuity analysis using Gemini"""
         
-        # Build context for AI analysis
+        # Build context for AI analysis from the compact story memory
         context = "STORY HISTORY:\n"
-        for i, chapter in enumerate(story_history, 1):
-            title = chapter.get("chapter_title", f"Chapter {i}")
-            context += f"\n=== {title} ===\n{chapter['content']}\n"
+        context += StoryMemory.format_context(memory, relevant_passages)
         
-        context += f"\n=== NEW CONTENT ===\n{new_content}\n"
+        context += f"\n\n=== NEW CONTENT ===\n{new_content}\n"
         
         prompt = f"""You are a professional story editor analyzing plot continuity. 
 
@@ -541,67 +830,85 @@ Provide your analysis in this JSON format:
 }}"""
 
         try:
-            model = genai.GenerativeModel('gemini-pro')
-            response = model.generate_content(prompt)
-            
-            # Extract JSON from response
-            response_text = response.text.strip()
-            if response_text.startswith("```json"):
-                response_text = response_text[7:-3]
-            elif response_text.startswith("```"):
-                response_text = response_text[3:-3]
+            # JSON-mode call validated against the schema, with one repair retry
+            analysis = await generate_structured(get_model("continuity"), prompt, ContinuityAnalysis)
+            return analysis.model_dump()
             
-            analysis = json.loads(response_text)
-            return analysis
-            
-        except json.JSONDecodeError:
-            # Fallback if JSON parsing fails
+        except StructuredOutputError as e:
+            # Fallback if the response is still invalid after repair
+            self.fallbacks.append("continuity")
             return {
                 "issues_found": [],
                 "positive_elements": ["Analysis completed but response format was invalid"],
-                "overall_assessment": f"Raw analysis: {response.text[:500]}..."
+                "overall_assessment": f"Raw analysis: {e.raw_text[:500]}..."
             }
     
-    async def get_continuity_history(self, document_id: str) -> list:
-        """Get all continuity check history for a document"""
-        
-        tasks = self.supabase.table("agent_task").select("*").eq("document_id", document_id).eq("task_type", "plot_continuity_check").order("created_at", desc=True).execute()
+    async def get_continuity_history(self, document_id: str, limit: int = AGENT_TASK_PAGE_SIZE,
+                                     cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+        """Get one page of continuity check history for a document, newest first"""
+        
+        # Only the analysis and count are read from result, never the checked content
+        tasks, next_cursor = await self.repository.page_agent_tasks(
+            document_id,
+            columns="id, status, created_at, analysis:result->analysis, story_history_count:result->story_history_count",
+            task_type="plot_continuity_check",
+            limit=limit,
+            cursor=cursor
+        )
         
         history = []
-        for task in tasks.data:
-            if task.get("result"):
-                history.append({
-                    "id": task["id"],
-                    "timestamp": task["created_at"],
-                    "status": task["status"],
-                    "analysis": task["result"].get("analysis", {}),
-                    "story_history_count": task["result"].get("story_history_count", 0)
-                })
-        
-        return history
+        for task in tasks:
+            history.append({
+                "id": task["id"],
+                "timestamp": task["created_at"],
+                "status": task["status"],
+                "analysis": task.get("analysis") or {},
+                "story_history_count": task.get("story_history_count") or 0
+            })
+        
+        return history, next_cursor
     
-    async def get_story_timeline(self, document_id: str) -> list:
-        """Get complete story timeline for a document"""
+    async def get_story_timeline(self, document_id: str, limit: int = AGENT_TASK_PAGE_SIZE,
+                                 cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+        """Get one page of the story timeline for a document, in chapter order"""
         
-        tasks = self.supabase.table("agent_task").select("*").eq("document_id", document_id).eq("task_type", "story_context_added").order("created_at").execute()
+        # The cursor is the sequence number of the last chapter on the previous page
+        try:
+            after_sequence = int(cursor) if cursor else 0
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        
+        # Chapter text stays in the database; the preview is a generated column
+        chapters = await self.repository.page_story_chapters(document_id, limit=limit + 1, after_sequence=after_sequence)
+        next_cursor = str(chapters[limit - 1]["sequence_number"]) if len(chapters) > limit else None
         
         timeline = []
-        for task in tasks.data:
-            if task.get("result"):
-                timeline.append({
-                    "timestamp": task["created_at"],
-                    "chapter_title": task["result"].get("chapter_title"),
-                    "content_length": task["result"].get("length", 0),
-                    "content_preview": task["result"].get("content", "")[:200] + "..."
-                })
-        
-        return timeline
+        for chapter in chapters[:limit]:
+            timeline.append({
+                "chapter_id": chapter["id"],
+                "sequence_number": chapter["sequence_number"],
+                "timestamp": chapter["created_at"],
+                "chapter_title": chapter.get("title"),
+                "content_length": chapter.get("content_length") or 0,
+                "content_preview": (chapter.get("content_preview") or "") + "..."
+            })
+        
+        return timeline, next_cursor
+    
+    @staticmethod
+    def extraction_task_id(chapter_id: str) -> str:
+        """Deterministic id of a chapter's element extraction, so a retry can't count the chapter twice"""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"story_element_extraction:{chapter_id}"))
     
-    async def analyze_story_elements(self, document_id: str, text: str, chapter_info: str = "") -> Dict:
+    async def analyze_story_elements(self, document_id: str, text: str, chapter_info: str = "", chapter_id: Optional[str] = None) -> Dict:
         """Extract and track story elements from new text"""
         
-        # Create analysis task
-        task_id = str(uuid.uuid4())
+        # One extraction per chapter: a completed one is reused instead of being merged again
+        task_id = self.extraction_task_id(chapter_id) if chapter_id else str(uuid.uuid4())
+        if chapter_id:
+            existing = await self.repository.get_agent_task(task_id)
+            if existing and existing["status"] == "completed":
+                return (existing.get("result") or {}).get("elements") or {}
         
         try:
             extraction_prompt = f"""
@@ -635,12 +942,9 @@ Provide your analysis in this JSON format:
             Only include elements that are clearly mentioned or established in the text.
             """
             
-            model = genai.GenerativeModel('gemini-pro')
-            response = model.generate_content(extraction_prompt)
-            
-            # Parse the JSON response
+            # Validated JSON-mode extraction, with one repair retry
             try:
-                elements = json.loads(response.text)
+                elements = (await generate_structured(get_model("extraction"), extraction_prompt, StoryElements)).model_dump()
                 
                 # Store successful element extraction
                 task = {
@@ -650,6 +954,7 @@ Provide your analysis in this JSON format:
                     "status": "completed",
                     "result": {
                         "elements": elements,
+                        "chapter_id": chapter_id,
                         "text_length": len(text),
                         "chapter_info": chapter_info,
                         "timestamp": datetime.utcnow().isoformat()
@@ -658,10 +963,12 @@ Provide your analysis in this JSON format:
                     "updated_at": datetime.utcnow().isoformat()
                 }
                 
-                self.supabase.table("agent_task").insert(task).execute()
+                # Upsert replaces a failed extraction of the same chapter
+                await self.repository.upsert_agent_task(task)
+                await self._merge_element_summary(document_id, elements)
                 return elements
                 
-            except json.JSONDecodeError:
+            except StructuredOutputError as e:
                 # Store failed element extraction
                 elements = {
                     "characters": [], "timeline_events": [], "locations": [],
@@ -675,14 +982,16 @@ Provide your analysis in this JSON format:
                     "status": "failed",
                     "result": {
                         "error": "JSON parsing failed",
-                        "raw_response": response.text[:500],
+                        "raw_response": e.raw_text[:500],
+                        "chapter_id": chapter_id,
                         "timestamp": datetime.utcnow().isoformat()
                     },
                     "created_at": datetime.utcnow().isoformat(),
                     "updated_at": datetime.utcnow().isoformat()
                 }
                 
-                self.supabase.table("agent_task").insert(task).execute()
+                await self.repository.upsert_agent_task(task)
+                self.fallbacks.append("elements")
                 return elements
                 
         except Exception as e:
@@ -694,77 +1003,216 @@ Provide your analysis in this JSON format:
                 "status": "failed",
                 "result": {
                     "error": str(e),
+                    "chapter_id": chapter_id,
                     "timestamp": datetime.utcnow().isoformat()
                 },
                 "created_at": datetime.utcnow().isoformat(),
                 "updated_at": datetime.utcnow().isoformat()
             }
             
-            self.supabase.table("agent_task").insert(task).execute()
+            await self.repository.upsert_agent_task(task)
+            self.fallbacks.append("elements")
             return {}
     
+    async def _merge_element_summary(self, document_id: str, elements: Dict):
+        """Fold a completed extraction into the document's materialized element aggregate"""
+        if not isinstance(elements, dict):
+            return
+        try:
+            # Make sure the aggregate already covers earlier extractions before merging into it
+            if await self.repository.get_story_element_summary(document_id) is None:
+                await self._rebuild_element_summary(document_id)
+                return
+            
+            aggregate = element_aggregate(elements)
+            await self.repository.merge_story_element_summary(
+                document_id,
+                aggregate["characters"],
+                aggregate["locations"],
+                aggregate["timeline_events"],
+                aggregate["plot_threads"],
+                aggregate["world_rules_count"],
+                aggregate["relationships_count"]
+            )
+        except Exception as e:
+            print(f"Error updating story element summary: {e}")
+    
+    async def _rebuild_element_summary(self, document_id: str) -> Dict:
+        """Aggregate every extraction task for a document and store the result as its element summary"""
+        tasks = await self.repository.list_agent_tasks(document_id, task_type="story_element_extraction")
+        
+        summary = {
+            "document_id": document_id,
+            "characters": {},
+            "locations": {},
+            "timeline_events": 0,
+            "plot_threads": 0,
+            "world_rules_count": 0,
+            "relationships_count": 0,
+            "analysis_tasks_completed": 0
+        }
+        
+        for task in sorted(tasks, key=lambda t: t.get("created_at") or ""):
+            if task["status"] != "completed":
+                continue
+            summary["analysis_tasks_completed"] += 1
+            
+            elements = (task.get("result") or {}).get("elements")
+            if not isinstance(elements, dict):
+                continue
+            
+            aggregate = element_aggregate(elements)
+            for key in ("characters", "locations"):
+                for name, display in aggregate[key].items():
+                    summary[key].setdefault(name, display)
+            for key in ("timeline_events", "plot_threads", "world_rules_count", "relationships_count"):
+                summary[key] += aggregate[key]
+        
+        summary["updated_at"] = datetime.utcnow().isoformat()
+        await self.repository.upsert_story_element_summary(summary)
+        return summary
+    
+    @staticmethod
+    def continuity_run_id(document_id: str, content_hash: str, previous_state_hash: str) -> str:
+        """Deterministic id of the run record for some content checked against a given story state"""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"plot_continuity_run:{document_id}:{content_hash}:{previous_state_hash}"))
+    
+    async def get_cached_check(self, document_id: str, content: str) -> Optional[Dict]:
+        """Return the stored result of an earlier check of the same content against the same story state"""
+        chapter = await self.repository.get_story_chapter_by_hash(document_id, story_content_hash(content))
+        if not chapter or chapter.get("previous_state_hash") is None:
+            return None
+        
+        run = await self.repository.get_agent_task(
+            self.continuity_run_id(document_id, chapter["content_hash"], chapter["previous_state_hash"])
+        )
+        if run and run["status"] == "completed":
+            return (run.get("result") or {}).get("response")
+        return None
+    
+    async def record_pipeline_run(self, document_id: str, context: Dict, durations: Dict[str, float], response: Dict):
+        """Store per-stage timings and the response for one continuity check run, keyed for repeat checks"""
+        try:
+            task = {
+                "id": self.continuity_run_id(document_id, context["content_hash"], context["previous_state_hash"]),
+                "document_id": document_id,
+                "task_type": "plot_continuity_run",
+                "status": "completed",
+                "result": {
+                    "context_task_id": context["task_id"],
+                    "chapter_id": context["chapter_id"],
+                    "stage_durations_ms": durations,
+                    "response": response,
+                    "timestamp": datetime.utcnow().isoformat()
+                },
+                "created_at": datetime.utcnow().isoformat(),
+                "updated_at": datetime.utcnow().isoformat()
+            }
+            
+            await self.repository.upsert_agent_task(task)
+            
+        except Exception as e:
+            print(f"Error recording continuity run: {e}")
+    
     async def get_story_summary(self, document_id: str) -> Dict:
         """Get a summary of tracked story elements for a document"""
         
-        # Get all element extraction tasks for this document
-        tasks = self.supabase.table("agent_task").select("*").eq("document_id", document_id).eq("task_type", "story_element_extraction").execute()
+        # Read the materialized aggregate; build it once from extraction tasks if it doesn't exist yet
+        summary = await self.repository.get_story_element_summary(document_id)
+        if summary is None:
+            summary = await self._rebuild_element_summary(document_id)
         
-        # Aggregate all story elements
-        all_characters = set()
-        all_locations = set()
-        timeline_events = 0
-        plot_threads = 0
-        world_rules = 0
-        relationships = 0
-        
-        for task in tasks.data:
-            if task.get("result") and task["result"].get("elements"):
-                elements = task["result"]["elements"]
-                
-                for char in elements.get("characters", []):
-                    all_characters.add(char.get("name", "Unknown"))
-                
-                for loc in elements.get("locations", []):
-                    all_locations.add(loc.get("name", "Unknown"))
-                
-                timeline_events += len(elements.get("timeline_events", []))
-                plot_threads += len(elements.get("plot_threads", []))
-                world_rules += len(elements.get("world_rules", []))
-                relationships += len(elements.get("relationships", []))
+        characters = list((summary.get("characters") or {}).values())
+        locations = list((summary.get("locations") or {}).values())
         
         return {
-            "characters_count": len(all_characters),
-            "characters": list(all_characters),
-            "locations_count": len(all_locations),
-            "locations": list(all_locations),
-            "timeline_events": timeline_events,
-            "plot_threads": plot_threads,
-            "world_rules_count": world_rules,
-            "relationships_count": relationships,
-            "analysis_tasks_completed": len([t for t in tasks.data if t["status"] == "completed"])
+            "characters_count": len(characters),
+            "characters": characters,
+            "locations_count": len(locations),
+            "locations": locations,
+            "timeline_events": summary.get("timeline_events", 0),
+            "plot_threads": summary.get("plot_threads", 0),
+            "world_rules_count": summary.get("world_rules_count", 0),
+            "relationships_count": summary.get("relationships_count", 0),
+            "analysis_tasks_completed": summary.get("analysis_tasks_completed", 0)
         }
 
+# Continuity checks currently running in this process, by document and content hash
+_continuity_checks_in_flight: Dict[str, asyncio.Task] = {}
+# One check per document at a time: story memory updates read, call the LLM and write back,
+# so two concurrent checks of one document would lose a chapter's update. Entries go away
+# once no check holds or waits for the lock.
+_document_locks = weakref.WeakValueDictionary()
+
+def document_lock(document_id: str) -> asyncio.Lock:
+    lock = _document_locks.get(document_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _document_locks[document_id] = lock
+    return lock
+
 async def plot_continuity_agent(story_text: str, document_id: str, chapter_info: str = "current") -> Dict:
-    """Main function to run the Plot Continuity Agent with database persistence"""
+    """Main function to run the Plot Continuity Agent with database persistence.
+
+    A submission identical to one already running joins that run instead of
+    starting another, so double submits share one result.
+    """
+    key = f"{document_id}:{story_content_hash(story_text)}"
+    task = _continuity_checks_in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_run_plot_continuity_agent(story_text, document_id, chapter_info))
+        _continuity_checks_in_flight[key] = task
+        task.add_done_callback(lambda _: _continuity_checks_in_flight.pop(key, None))
+    # Shielded so one caller disconnecting doesn't cancel the run for the others
+    return await asyncio.shield(task)
+
+async def _run_plot_continuity_agent(story_text: str, document_id: str, chapter_info: str) -> Dict:
+    # Checks of the same document (from the endpoint or queue workers) run one after another
+    async with document_lock(document_id):
+        return await _run_plot_continuity_pipeline(story_text, document_id, chapter_info)
+
+async def _run_plot_continuity_pipeline(story_text: str, document_id: str, chapter_info: str) -> Dict:
     try:
         # Create agent with database connection
-        agent = PlotContinuityAgent(supabase)
-        
-        # Add story context to database
-        await agent.add_story_context(document_id, story_text, chapter_info)
-        
-        # Analyze continuity against previous story content
-        continuity_analysis = await agent.analyze_continuity(document_id, story_text)
-        
-        # Extract story elements for tracking
-        story_elements = await agent.analyze_story_elements(document_id, story_text, chapter_info)
-        
-        # Get story summary
-        summary = await agent.get_story_summary(document_id)
-        
-        return {
+        agent = PlotContinuityAgent(repository)
+        
+        # Content already checked against the same story state returns its stored result
+        cached = await agent.get_cached_check(document_id, story_text)
+        if cached:
+            return dict(cached, cached=True)
+        
+        # Independent stages run concurrently; each starts once the stages it depends on finish
+        results, durations = await run_stages([
+            # Snapshot story memory before this content is folded into it
+            Stage("memory", lambda r: agent.memory.load(document_id)),
+            # Add story context to database
+            Stage("context", lambda r: agent.add_story_context(document_id, story_text, chapter_info)),
+            # Analyze continuity against previous story content
+            Stage("continuity", lambda r: agent.analyze_continuity(
+                document_id, story_text, memory=r["memory"],
+                exclude_task_id=r["context"]["task_id"], chapter_id=r["context"]["chapter_id"]
+            ), depends_on=("memory", "context")),
+            # Extract story elements for tracking (once per chapter, so retries don't double count)
+            Stage("elements", lambda r: agent.analyze_story_elements(
+                document_id, story_text, chapter_info, chapter_id=r["context"]["chapter_id"]
+            ), depends_on=("context",)),
+            # Update chapter summaries and the story bible for future checks (also once per chapter)
+            Stage("story_memory", lambda r: agent.update_story_memory(
+                document_id, story_text, chapter_info, source_task_id=r["context"]["task_id"],
+                chapter_id=r["context"]["chapter_id"]
+            ), depends_on=("memory", "context")),
+            # Get story summary once this content's elements are merged into it
+            Stage("summary", lambda r: agent.get_story_summary(document_id), depends_on=("elements",))
+        ])
+        
+        continuity_analysis = results["continuity"]
+        story_elements = results["elements"]
+        summary = results["summary"]
+        
+        response = {
             "continuity_analysis": continuity_analysis,
             "story_summary": summary,
+            "stage_durations_ms": durations,
             "new_elements_found": {
                 "characters": len(story_elements.get("characters", [])),
                 "plot_threads": len(story_elements.get("plot_threads", [])),
@@ -781,6 +1229,13 @@ async def plot_continuity_agent(story_text: str, document_id: str, chapter_info:
             ]
         }
         
+        # Record stage timings and the response so repeat checks can return it; a run with
+        # placeholder output isn't recorded, so the same content can be checked again
+        if not agent.fallbacks:
+            await agent.record_pipeline_run(document_id, results["context"], durations, response)
+        
+        return dict(response, cached=False)
+        
     except Exception as e:
         return {
             "error": f"Plot continuity agent error: {str(e)}",
@@ -788,6 +1243,27 @@ async def plot_continuity_agent(story_text: str, document_id: str, chapter_info:
             "document_id": document_id
         }
 
+async def run_plot_continuity_job(payload: Dict) -> Dict:
+    """Queue handler for continuity checks submitted in the background"""
+    result = await plot_continuity_agent(
+        story_text=payload["story_text"],
+        document_id=payload["document_id"],
+        chapter_info=payload.get("chapter_info") or "current"
+    )
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result
+
+agent_task_queue.register("plot_continuity_job", run_plot_continuity_job)
+
+@app.on_event("startup")
+async def start_agent_task_queue():
+    await agent_task_queue.start()
+
+@app.on_event("shutdown")
+async def stop_agent_task_queue():
+    await agent_task_queue.stop()
+
 # Pydantic Models matching exact database schema
 class Document(BaseModel):
     id: str
@@ -826,6 +1302,11 @@ class DocumentCreate(BaseModel):
     description: str
     created_by: str
 
+class DocumentUpdate(BaseModel):
+    title: Optional[str] = None
+    type: Optional[str] = None
+    description: Optional[str] = None
+
 class CreativeDomainRequest(BaseModel):
     user_id: str
 
@@ -911,6 +1392,14 @@ class PlotContinuityResponse(BaseModel):
     agent_status: str  # "active", "error", "idle"
     document_id: str  # ID of the story document
     recommendations: List[str]  # Proactive suggestions for better continuity
+    stage_durations_ms: Dict[str, float] = {}  # Wall time of each agent pipeline stage
+    cached: bool = False  # True when an identical earlier check's result was returned
+
+class AgentTaskQueuedResponse(BaseModel):
+    message: str
+    task_id: str  # Poll GET /agent_task/{task_id} for the result
+    document_id: str
+    status: str  # "pending"
 
 # API Endpoints
 
@@ -922,8 +1411,8 @@ async def create_user(user_data: UserCreate):
     
     try:
         # Check if email already exists
-        existing_user = supabase.table("user").select("*").eq("email", user_data.email).execute()
-        if existing_user.data:
+        existing_user = await repository.get_user_by_email(user_data.email)
+        if existing_user:
             raise HTTPException(status_code=400, detail="Email already exists")
         
         # Create user in database
@@ -935,9 +1424,9 @@ async def create_user(user_data: UserCreate):
             "updated_at": now.isoformat()
         }
         
-        result = supabase.table("user").insert(user_data_db).execute()
+        inserted = await repository.insert_user(user_data_db)
         
-        if not result.data:
+        if not inserted:
             raise HTTPException(status_code=500, detail="Failed to create user")
         
         user = User(
@@ -965,23 +1454,24 @@ async def select_creative_domain(req: CreativeDomainRequest):
     
     try:
         # Validate user exists in database
-        user_result = supabase.table("user").select("*").eq("id", user_id).execute()
-        if not user_result.data:
+        user = await repository.get_user(user_id)
+        if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        user = user_result.data[0]
+        # Warm the user cache for the session's requests
+        user_cache[user_id] = user
         
         # Generate a new session id
         session_id = str(uuid.uuid4())
         
-        # Store session (in-memory for now, can be moved to DB later)
-        SESSIONS[session_id] = {
+        # Store session in the shared store so any worker can serve it
+        await session_store.create({
             "id": session_id,
             "user_id": user_id,
             "domain": "creative",
             "system_prompt": DOMAIN_PROMPT,
-            "created_at": datetime.now()
-        }
+            "created_at": datetime.now().isoformat()
+        })
         
         return CreativeSessionResponse(
             message=f"Creative domain selected for user {user['name']}",
@@ -1001,16 +1491,15 @@ async def create_document(doc_data: DocumentCreate):
     """Create a new creative document (plot, character, book_idea, story)"""
     try:
         # Validate user exists in database
-        user_result = supabase.table("user").select("*").eq("id", doc_data.created_by).execute()
-        if not user_result.data:
+        user = await repository.get_user(doc_data.created_by)
+        if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
         # Validate document type for creative writing
-        valid_types = ["plot", "character", "book_idea", "story"]
-        if doc_data.type not in valid_types:
+        if doc_data.type not in VALID_DOCUMENT_TYPES:
             raise HTTPException(
                 status_code=400, 
-                detail=f"Invalid document type. Choose from: {', '.join(valid_types)}"
+                detail=f"Invalid document type. Choose from: {', '.join(VALID_DOCUMENT_TYPES)}"
             )
         
         # Generate document ID
@@ -1028,9 +1517,9 @@ async def create_document(doc_data: DocumentCreate):
             "updated_at": now.isoformat()
         }
         
-        result = supabase.table("document").insert(document_data_db).execute()
+        inserted = await repository.insert_document(document_data_db)
         
-        if not result.data:
+        if not inserted:
             raise HTTPException(status_code=500, detail="Failed to create document")
         
         # Create document object for response
@@ -1049,7 +1538,8 @@ async def create_document(doc_data: DocumentCreate):
             document_id=doc_id,
             title=doc_data.title,
             description=doc_data.description,
-            doc_type=doc_data.type
+            doc_type=doc_data.type,
+            created_by=doc_data.created_by
         )
         
         return DocumentResponse(
@@ -1067,16 +1557,16 @@ async def get_user_documents(user_id: str):
     """Get all creative documents for a specific user"""
     try:
         # Validate user exists in database
-        user_result = supabase.table("user").select("*").eq("id", user_id).execute()
-        if not user_result.data:
+        user = await repository.get_user(user_id)
+        if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
         # Get all documents for this user
-        documents_result = supabase.table("document").select("*").eq("created_by", user_id).execute()
+        documents = await repository.list_user_documents(user_id)
         
         # Convert to Document objects
         user_docs = []
-        for doc_data in documents_result.data:
+        for doc_data in documents:
             document = Document(
                 id=doc_data["id"],
                 title=doc_data["title"],
@@ -1100,13 +1590,11 @@ async def get_document(doc_id: str):
     """Get a specific document by ID"""
     try:
         # Get document from database
-        document_result = supabase.table("document").select("*").eq("id", doc_id).execute()
+        doc_data = await repository.get_document(doc_id)
         
-        if not document_result.data:
+        if not doc_data:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        doc_data = document_result.data[0]
-        
         # Convert to Document object
         document = Document(
             id=doc_data["id"],
@@ -1125,6 +1613,72 @@ async def get_document(doc_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+@app.put("/documents/{doc_id}", response_model=DocumentResponse)
+async def update_document(doc_id: str, doc_update: DocumentUpdate):
+    """Update a document and incrementally refresh its embeddings"""
+    try:
+        doc_data = await repository.get_document(doc_id)
+        
+        if not doc_data:
+            raise HTTPException(status_code=404, detail="Document not found")
+        
+        if doc_update.type is not None and doc_update.type not in VALID_DOCUMENT_TYPES:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Invalid document type. Choose from: {', '.join(VALID_DOCUMENT_TYPES)}"
+            )
+        
+        # Only send the fields that were provided
+        changes = doc_update.model_dump(exclude_none=True)
+        now = datetime.now()
+        
+        if changes:
+            changes["updated_at"] = now.isoformat()
+            await repository.update_document(doc_id, changes)
+            doc_data.update(changes)
+        
+        # Re-embed only the chunks whose content changed
+        embedding_changes = await update_document_embeddings(
+            document_id=doc_id,
+            title=doc_data["title"],
+            description=doc_data["description"],
+            doc_type=doc_data["type"],
+            created_by=doc_data["created_by"]
+        )
+        
+        document = Document(
+            id=doc_data["id"],
+            title=doc_data["title"],
+            type=doc_data["type"],
+            description=doc_data["description"],
+            created_by=doc_data["created_by"],
+            created_at=datetime.fromisoformat(doc_data["created_at"].replace('Z', '+00:00')),
+            updated_at=now if changes else datetime.fromisoformat(doc_data["updated_at"].replace('Z', '+00:00'))
+        )
+        
+        return DocumentResponse(
+            message=(
+                f"Document '{doc_data['title']}' updated: {embedding_changes['embedded']} chunks re-embedded, "
+                f"{embedding_changes['unchanged'] + embedding_changes['moved']} reused, {embedding_changes['deleted']} removed"
+                + (f", {embedding_changes['failed']} failed to embed" if embedding_changes['failed'] else "")
+            ),
+            document=document
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+@app.get("/cache_stats")
+def get_cache_stats():
+    """Get hit/miss counters for the embedding, suggestion and summary caches"""
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "suggestion_cache": suggestion_cache.stats(),
+        "prompt_summaries": prompt_builder.stats()
+    }
+
 @app.get("/creative_info")
 def get_creative_info():
     """Get information about creative writing types"""
@@ -1148,130 +1702,307 @@ def get_creative_info():
                 "type": "story",
                 "description": "Complete story content and narrative"
             }
-        ]
+        ],
+        "models": model_summary()
+    }
+
+async def get_user_cached(user_id: str) -> Optional[Dict]:
+    """Fetch a user through the short-TTL user cache"""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await repository.get_user(user_id)
+        if user:
+            user_cache[user_id] = user
+    return user
+
+async def validate_session(session_id: str, user_id: str) -> Tuple[Dict, Dict]:
+    """Check that a session exists, belongs to the user and the user exists; returns (session, user)"""
+    session = await session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    if session["user_id"] != user_id:
+        raise HTTPException(status_code=403, detail="Session does not belong to user")
+    
+    user = await get_user_cached(user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return session, user
+
+def sse_event(event: str, data: Dict) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def prepare_writing_assist(req: WritingAssistRequest) -> Dict:
+    """Validate the session and build the RAG prompt for a writing assist request"""
+    # Validate the session and its user (cached, no database round trip when warm)
+    session, user = await validate_session(req.session_id, req.user_id)
+    
+    # Get relevant context from user's documents
+    context = await get_context_for_writing(req.user_id, req.prompt)
+    
+    # Create enhanced prompt for Gemini
+    enhanced_prompt = f"""
+    {DOMAIN_PROMPT}
+    
+    User's Writing Request: {req.prompt}
+    
+    Relevant Context from User's Documents:
+    {context}
+    
+    Please provide creative writing assistance based on the user's request and their existing documents. 
+    Use the context to maintain consistency with their established characters, plots, and story elements.
+    Be creative and helpful while staying true to their established creative universe.
+    """
+
+    return {
+        "prompt": enhanced_prompt,
+        "context": context
     }
 
 @app.post("/writing_assist", response_model=WritingAssistResponse)
 async def writing_assist(req: WritingAssistRequest):
     """Get AI writing assistance based on user's documents (RAG)"""
     try:
-        # Validate session exists
-        if req.session_id not in SESSIONS:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        session = SESSIONS[req.session_id]
-        if session["user_id"] != req.user_id:
-            raise HTTPException(status_code=403, detail="Session does not belong to user")
-        
-        # Validate user exists
-        user_result = supabase.table("user").select("*").eq("id", req.user_id).execute()
-        if not user_result.data:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Get relevant context from user's documents
-        context = await get_context_for_writing(req.user_id, req.prompt)
-        
-        # Create enhanced prompt for Gemini
-        enhanced_prompt = f"""
-        {DOMAIN_PROMPT}
-        
-        User's Writing Request: {req.prompt}
-        
-        Relevant Context from User's Documents:
-        {context}
-        
-        Please provide creative writing assistance based on the user's request and their existing documents. 
-        Use the context to maintain consistency with their established characters, plots, and story elements.
-        Be creative and helpful while staying true to their established creative universe.
-        """
+        prepared = await prepare_writing_assist(req)
         
         # Generate response using Gemini
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(enhanced_prompt)
+        model = get_model("writing")
+        response = await generate_content(model, prepared["prompt"])
         
         return WritingAssistResponse(
             message="Writing assistance generated successfully",
             writing_suggestion=response.text,
-            context_used=context,
+            context_used=prepared["context"],
             session_id=req.session_id
         )
         
+    except HTTPException:
+        raise
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out generating writing assistance")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating writing assistance: {str(e)}")
+
+@app.post("/writing_assist_stream")
+async def writing_assist_stream(req: WritingAssistRequest):
+    """Stream AI writing assistance as server-sent events while Gemini generates it"""
+    try:
+        prepared = await prepare_writing_assist(req)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating writing assistance: {str(e)}")
+    
+    async def events():
+        yield sse_event("context", {"context_used": prepared["context"], "session_id": req.session_id})
+        try:
+            model = get_model("writing")
+            async for text in stream_content(model, prepared["prompt"]):
+                yield sse_event("token", {"text": text})
+            yield sse_event("done", {"session_id": req.session_id})
+        except asyncio.TimeoutError:
+            yield sse_event("error", {"detail": "Timed out generating writing assistance"})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Error generating writing assistance: {str(e)}"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+async def prepare_auto_suggestion(req: AutoSuggestionRequest) -> Dict:
+    """Validate the session, gather context and build the prompt for an auto-suggestion request"""
+    # Validate the session and its user (cached, no database round trip when warm)
+    session, user = await validate_session(req.session_id, req.user_id)
+    
+    # Appending text to a recent request can reuse its suggestions or its retrieval context
+    cached = suggestion_cache.get(req.session_id, req.current_text, req.cursor_position)
+    if cached is not None:
+        entry, completions = cached
+        writing_analysis = analyze_writing_context(req.current_text, req.cursor_position)
+        
+        # The user is typing one of the cached suggestions: offer the rest of it
+        if completions:
+            return {
+                "completions": completions,
+                "context_text": entry["context_text"],
+                "writing_analysis": writing_analysis
+            }
+        
+        # Otherwise reuse the retrieval context and only regenerate
+        return {
+            "prompt": create_suggestion_prompt(
+                prompt_builder.window(req.current_text, req.cursor_position),
+                writing_analysis['type'],
+                entry["context_text"]
+            ),
+            "context_text": entry["context_text"],
+            "writing_analysis": writing_analysis
+        }
+    
+    # Get intelligent context based on what user is writing
+    context_data = await get_intelligent_context(
+        req.user_id, 
+        req.current_text, 
+        req.cursor_position
+    )
+    
+    writing_analysis = context_data['writing_analysis']
+    relevant_context = context_data['relevant_context']
+    
+    # Create context string for Gemini
+    context_text = ""
+    if relevant_context:
+        context_parts = []
+        for ctx in relevant_context[:3]:  # Use top 3 most relevant
+            context_parts.append(f"From {ctx['source']}: {ctx['text'][:300]}...")
+        context_text = "\n\n".join(context_parts)
+    
+    # Create specialized prompt based on writing type
+    suggestion_prompt = create_suggestion_prompt(
+        prompt_builder.window(req.current_text, req.cursor_position),
+        writing_analysis['type'],
+        context_text
+    )
+    
+    return {
+        "prompt": suggestion_prompt,
+        "context_text": context_text,
+        "writing_analysis": writing_analysis
+    }
 
 @app.post("/auto_suggest", response_model=AutoSuggestionResponse)
 async def auto_suggest(req: AutoSuggestionRequest):
-    """Get automatic writing suggestions based on current text (real-time)"""
+    """Get automatic writing suggestions based on current text (real-time).
+
+    A newer request for the same session cancels this one, which then returns 409.
+    """
     try:
-        # Validate session exists
-        if req.session_id not in SESSIONS:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        session = SESSIONS[req.session_id]
-        if session["user_id"] != req.user_id:
-            raise HTTPException(status_code=403, detail="Session does not belong to user")
-        
-        # Validate user exists
-        user_result = supabase.table("user").select("*").eq("id", req.user_id).execute()
-        if not user_result.data:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Get intelligent context based on what user is writing
-        context_data = await get_intelligent_context(
-            req.user_id, 
-            req.current_text, 
-            req.cursor_position
-        )
-        
-        writing_analysis = context_data['writing_analysis']
-        relevant_context = context_data['relevant_context']
-        
-        # Create context string for Gemini
-        context_text = ""
-        if relevant_context:
-            context_parts = []
-            for ctx in relevant_context[:3]:  # Use top 3 most relevant
-                context_parts.append(f"From {ctx['source']}: {ctx['text'][:300]}...")
-            context_text = "\n\n".join(context_parts)
-        
-        # Create specialized prompt based on writing type
-        suggestion_prompt = create_suggestion_prompt(
-            req.current_text,
-            writing_analysis['type'],
-            context_text,
-            req.cursor_position
-        )
-        
-        # Generate suggestions using Gemini
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(suggestion_prompt)
-        
-        # Parse multiple suggestions from response
-        suggestions = parse_suggestions(response.text, writing_analysis['type'])
+        with auto_suggest_gate.claim(req.session_id) as claim:
+            await claim.debounce()
+            prepared = await claim.run(prepare_auto_suggestion(req))
+            writing_analysis = prepared["writing_analysis"]
+            
+            if "completions" in prepared:
+                suggestions = prepared["completions"]
+            else:
+                # Generate suggestions using Gemini
+                model = get_model("suggestions")
+                response = await claim.run(generate_content(model, prepared["prompt"]))
+                
+                # Parse multiple suggestions from response
+                suggestions = parse_suggestions(response.text, writing_analysis['type'])
+                suggestion_cache.store(req.session_id, req.current_text, prepared["context_text"], suggestions)
         
         return AutoSuggestionResponse(
             suggestions=suggestions,
-            context_used=context_text,
+            context_used=prepared["context_text"],
             confidence_score=writing_analysis['confidence'],
             suggestion_type=writing_analysis['type'],
             session_id=req.session_id
         )
         
+    except SupersededError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except HTTPException:
         raise
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out generating auto-suggestions")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating auto-suggestions: {str(e)}")
 
-def create_suggestion_prompt(current_text: str, writing_type: str, context: str, cursor_position: Optional[int]) -> str:
-    """Create a specialized prompt for different types of writing"""
+@app.post("/auto_suggest_stream")
+async def auto_suggest_stream(req: AutoSuggestionRequest):
+    """Stream auto-suggestions as server-sent events, emitting each one as soon as its line is complete.
+
+    A newer request for the same session stops this stream with a "superseded" event.
+    """
+    claim = auto_suggest_gate.claim(req.session_id)
+    try:
+        await claim.debounce()
+        prepared = await claim.run(prepare_auto_suggestion(req))
+    except SupersededError as e:
+        claim.release()
+        raise HTTPException(status_code=409, detail=str(e))
+    except HTTPException:
+        claim.release()
+        raise
+    except Exception as e:
+        claim.release()
+        raise HTTPException(status_code=500, detail=f"Error generating auto-suggestions: {str(e)}")
+    
+    writing_analysis = prepared["writing_analysis"]
+    
+    async def events():
+        yield sse_event("meta", {
+            "context_used": prepared["context_text"],
+            "confidence_score": writing_analysis['confidence'],
+            "suggestion_type": writing_analysis['type'],
+            "session_id": req.session_id
+        })
+        
+        # Completions of a cached suggestion need no model call
+        if "completions" in prepared:
+            for index, suggestion in enumerate(prepared["completions"]):
+                yield sse_event("suggestion", {"index": index, "text": suggestion})
+            yield sse_event("done", {"suggestions": prepared["completions"], "session_id": req.session_id})
+            claim.release()
+            return
+        
+        parser = SuggestionStreamParser()
+        stream = stream_content(get_model("suggestions"), prepared["prompt"])
+        try:
+            async for text in stream:
+                # Stop reading (and let the producer stop after its current chunk) once a newer request takes over
+                if not claim.current:
+                    yield sse_event("superseded", {"detail": "Superseded by a newer request", "session_id": req.session_id})
+                    return
+                for index, suggestion in parser.feed(text):
+                    yield sse_event("suggestion", {"index": index, "text": suggestion})
+            for index, suggestion in parser.close():
+                yield sse_event("suggestion", {"index": index, "text": suggestion})
+            
+            # Final list uses the same parsing and padding rules as /auto_suggest
+            suggestions = parse_suggestions(parser.text, writing_analysis['type'])
+            suggestion_cache.store(req.session_id, req.current_text, prepared["context_text"], suggestions)
+            yield sse_event("done", {
+                "suggestions": suggestions,
+                "session_id": req.session_id
+            })
+        except asyncio.TimeoutError:
+            yield sse_event("error", {"detail": "Timed out generating auto-suggestions"})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Error generating auto-suggestions: {str(e)}"})
+        finally:
+            await stream.aclose()
+            claim.release()
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+def create_suggestion_prompt(window: PromptWindow, writing_type: str, context: str) -> str:
+    """Create a specialized prompt for different types of writing from the text around the cursor"""
+    # Only a window around the cursor is sent verbatim; earlier text is summarized
+    earlier_text = ""
+    if window.summary:
+        earlier_text = f"""Summary of the earlier text:
+{window.summary}
+
+"""
+    elif window.omitted_chars:
+        earlier_text = "(Earlier text omitted.)\n\n"
+    
+    # With text after the cursor, suggestions fill the gap at [CURSOR]
+    if window.after.strip():
+        current_text = f"{window.before}[CURSOR]{window.after}"
+        placement = "\nSuggestions will be inserted at [CURSOR] and must lead naturally into the text that follows it.\n"
+    else:
+        current_text = window.before
+        placement = ""
     
     base_prompt = f"""You are a creative writing assistant. Provide helpful writing suggestions based on the user's current text and their established story context.
 
-Current text being written:
+{earlier_text}Current text being written:
 {current_text}
-
+{placement}
 Relevant context from user's documents:
 {context}
 
@@ -1308,13 +2039,9 @@ def parse_suggestions(response_text: str, writing_type: str) -> List[str]:
         suggestions = []
         
         for line in lines:
-            line = line.strip()
-            # Look for numbered suggestions
-            if line and (line.startswith('1.') or line.startswith('2.') or line.startswith('3.')):
-                # Remove the number prefix
-                suggestion = line[2:].strip()
-                if suggestion:
-                    suggestions.append(suggestion)
+            suggestion = parse_suggestion_line(line)
+            if suggestion:
+                suggestions.append(suggestion)
         
         # If parsing failed, split by double newlines and take first 3 paragraphs
         if len(suggestions) == 0:
@@ -1336,12 +2063,7 @@ async def analyze_story(req: StoryAnalysisRequest):
     """Analyze story structure, plot, and provide improvement suggestions"""
     try:
         # Validate session
-        if req.session_id not in SESSIONS:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        session = SESSIONS[req.session_id]
-        if session["user_id"] != req.user_id:
-            raise HTTPException(status_code=403, detail="Session does not belong to user")
+        session, user = await validate_session(req.session_id, req.user_id)
         
         # Get user's story context
         context_data = await get_intelligent_context(req.user_id, req.text_chunk)
@@ -1352,10 +2074,22 @@ async def analyze_story(req: StoryAnalysisRequest):
                 context_parts.append(f"From {ctx['source']}: {ctx['text'][:200]}...")
             context_text = "\n\n".join(context_parts)
         
-        # Perform comprehensive story analysis
-        story_structure = await analyze_story_structure(req.text_chunk, context_text)
-        plot_improvements = await generate_plot_improvements(req.text_chunk, context_text)
-        quality_analysis = await analyze_writing_quality(req.text_chunk, context_text)
+        # Perform comprehensive story analysis - the three analyses are independent,
+        # so run them concurrently and keep whatever finishes if one fails or times out
+        story_structure, plot_improvements, quality_analysis = await asyncio.gather(
+            run_analysis_step(
+                analyze_story_structure(req.text_chunk, context_text),
+                {"raw_analysis": "Unable to analyze story at this time.", "word_count": len(req.text_chunk.split())}
+            ),
+            run_analysis_step(
+                generate_plot_improvements(req.text_chunk, context_text),
+                ["Unable to generate plot suggestions at this time."]
+            ),
+            run_analysis_step(
+                analyze_writing_quality(req.text_chunk, context_text),
+                {"detailed_feedback": "Unable to analyze writing quality at this time."}
+            )
+        )
         
         # Calculate overall score (simplified)
         word_count = len(req.text_chunk.split())
@@ -1381,12 +2115,7 @@ async def writing_feedback(req: WritingFeedbackRequest):
     """Get comprehensive writing feedback and suggestions like a writing coach"""
     try:
         # Validate session
-        if req.session_id not in SESSIONS:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        session = SESSIONS[req.session_id]
-        if session["user_id"] != req.user_id:
-            raise HTTPException(status_code=403, detail="Session does not belong to user")
+        session, user = await validate_session(req.session_id, req.user_id)
         
         # Get contextual information
         context_data = await get_intelligent_context(req.user_id, req.current_text)
@@ -1421,8 +2150,8 @@ async def writing_feedback(req: WritingFeedbackRequest):
         Reference specific examples from the text when possible.
         """
 
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(feedback_prompt)
+        model = get_model("analysis")
+        response = await generate_content(model, feedback_prompt)
         
         # Parse the structured feedback
         feedback_text = response.text
@@ -1512,7 +2241,9 @@ async def plot_continuity_check(req: PlotContinuityRequest):
             new_elements_found=agent_result["new_elements_found"],
             agent_status=agent_result["agent_status"],
             document_id=agent_result["document_id"],
-            recommendations=agent_result["recommendations"]
+            recommendations=agent_result["recommendations"],
+            stage_durations_ms=agent_result.get("stage_durations_ms", {}),
+            cached=agent_result.get("cached", False)
         )
         
     except HTTPException:
@@ -1520,55 +2251,148 @@ async def plot_continuity_check(req: PlotContinuityRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Plot Continuity Agent error: {str(e)}")
 
-@app.get("/agent_tasks/{document_id}")
-async def get_agent_tasks(document_id: str, task_type: Optional[str] = None):
-    """Get all agent tasks for a document, optionally filtered by task type"""
+@app.post("/plot_continuity_check_async", response_model=AgentTaskQueuedResponse, status_code=202)
+async def plot_continuity_check_async(req: PlotContinuityRequest):
+    """Queue a continuity check and return its task id without waiting for the agent"""
     try:
-        query = supabase.table("agent_task").select("*").eq("document_id", document_id)
+        task_id = await agent_task_queue.enqueue("plot_continuity_job", req.document_id, {
+            "document_id": req.document_id,
+            "story_text": req.story_text,
+            "chapter_info": req.chapter_info
+        })
+        
+        return AgentTaskQueuedResponse(
+            message="Continuity check queued",
+            task_id=task_id,
+            document_id=req.document_id,
+            status="pending"
+        )
         
-        if task_type:
-            query = query.eq("task_type", task_type)
-            
-        tasks = query.order("created_at", desc=True).execute()
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error queueing continuity check: {str(e)}")
+
+@app.get("/agent_task/{task_id}")
+async def get_agent_task(task_id: str, wait: float = 0):
+    """Get one agent task; with ?wait=N, hold the request up to N seconds until it completes or fails"""
+    try:
+        wait = max(0.0, min(wait, AGENT_TASK_MAX_WAIT_SECONDS))
+        if wait:
+            task = await agent_task_queue.wait(task_id, wait)
+        else:
+            task = await repository.get_agent_task(task_id)
+        
+        if not task:
+            raise HTTPException(status_code=404, detail="Agent task not found")
+        
+        return task
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving agent task: {str(e)}")
+
+@app.get("/story_chapter/{chapter_id}")
+async def get_story_chapter(chapter_id: str):
+    """Get a stored story chapter with its full content"""
+    try:
+        chapter = await repository.get_story_chapter(chapter_id)
+        
+        if not chapter:
+            raise HTTPException(status_code=404, detail="Story chapter not found")
+        
+        return chapter
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving story chapter: {str(e)}")
+
+def parse_agent_task_fields(fields: Optional[str]) -> str:
+    """Turn a comma-separated ?fields= value into a PostgREST select list, always keeping the cursor columns"""
+    if not fields:
+        selected = list(AGENT_TASK_DEFAULT_FIELDS)
+    else:
+        selected = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in selected if field not in AGENT_TASK_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown agent task fields: {', '.join(unknown)}")
+    for field in ("created_at", "id"):
+        if field not in selected:
+            selected.append(field)
+    return ", ".join(selected)
+
+def page_size(limit: int) -> int:
+    """Clamp a requested page size to the allowed range"""
+    return max(1, min(limit, AGENT_TASK_MAX_PAGE_SIZE))
+
+@app.get("/agent_tasks/{document_id}")
+async def get_agent_tasks(document_id: str, task_type: Optional[str] = None, fields: Optional[str] = None,
+                          limit: int = AGENT_TASK_PAGE_SIZE, cursor: Optional[str] = None):
+    """Get one page of agent tasks for a document, newest first, optionally filtered by task type.
+
+    Pass ?fields=id,status,result,... to choose columns (result is left out by
+    default) and the returned next_cursor as ?cursor= for the next page.
+    """
+    try:
+        tasks, next_cursor = await repository.page_agent_tasks(
+            document_id,
+            columns=parse_agent_task_fields(fields),
+            task_type=task_type,
+            limit=page_size(limit),
+            cursor=cursor
+        )
         
         return {
             "document_id": document_id,
-            "task_count": len(tasks.data),
-            "tasks": tasks.data
+            "task_count": len(tasks),
+            "tasks": tasks,
+            "next_cursor": next_cursor
         }
         
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving agent tasks: {str(e)}")
 
 @app.get("/agent_continuity_history/{document_id}")
-async def get_continuity_history(document_id: str):
-    """Get continuity check history for a document"""
+async def get_continuity_history(document_id: str, limit: int = AGENT_TASK_PAGE_SIZE, cursor: Optional[str] = None):
+    """Get one page of continuity check history for a document"""
     try:
-        agent = PlotContinuityAgent(supabase)
-        history = await agent.get_continuity_history(document_id)
+        agent = PlotContinuityAgent(repository)
+        history, next_cursor = await agent.get_continuity_history(document_id, limit=page_size(limit), cursor=cursor)
         
         return {
             "document_id": document_id,
             "history_count": len(history),
-            "continuity_history": history
+            "continuity_history": history,
+            "next_cursor": next_cursor
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving continuity history: {str(e)}")
 
 @app.get("/agent_story_timeline/{document_id}")
-async def get_story_timeline(document_id: str):
-    """Get story timeline for a document"""
+async def get_story_timeline(document_id: str, limit: int = AGENT_TASK_PAGE_SIZE, cursor: Optional[str] = None):
+    """Get one page of the story timeline for a document"""
     try:
-        agent = PlotContinuityAgent(supabase)
-        timeline = await agent.get_story_timeline(document_id)
+        agent = PlotContinuityAgent(repository)
+        timeline, next_cursor = await agent.get_story_timeline(document_id, limit=page_size(limit), cursor=cursor)
         
         return {
             "document_id": document_id,
             "timeline_count": len(timeline),
-            "story_timeline": timeline
+            "story_timeline": timeline,
+            "next_cursor": next_cursor
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving story timeline: {str(e)}")
 
@@ -1576,7 +2400,7 @@ async def get_story_timeline(document_id: str):
 async def get_agent_story_summary(document_id: str):
     """Get story summary from agent analysis"""
     try:
-        agent = PlotContinuityAgent(supabase)
+        agent = PlotContinuityAgent(repository)
         summary = await agent.get_story_summary(document_id)
         
         return {
@@ -0,0 +1,96 @@
+from typing import List, Optional, Union
+
+from pydantic import BaseModel
+
+# Response schemas for the continuity agent's JSON-mode calls. Fields are
+# deliberately lenient (loose strings, defaults) so small wording differences
+# don't trigger a repair call; anything unexpected is dropped.
+
+Scalar = Union[str, int, float]
+
+
+class ContinuityIssue(BaseModel):
+    type: str = "plot_continuity"  # character_consistency|timeline|plot_continuity|world_building
+    severity: str = "medium"       # low|medium|high
+    description: str
+    suggestion: str = ""
+
+
+class ContinuityAnalysis(BaseModel):
+    issues_found: List[ContinuityIssue] = []
+    positive_elements: List[str] = []
+    overall_assessment: str = ""
+
+
+class StoryCharacter(BaseModel):
+    name: str
+    age: Optional[Scalar] = None
+    traits: List[str] = []
+    details: Optional[str] = None
+
+
+class TimelineEvent(BaseModel):
+    event: str
+    time_reference: Optional[str] = None
+    chapter: Optional[str] = None
+
+
+class StoryLocation(BaseModel):
+    name: str
+    description: Optional[str] = None
+    features: List[str] = []
+
+
+class PlotThread(BaseModel):
+    thread: str
+    status: Optional[str] = None
+    details: Optional[str] = None
+
+
+class WorldRule(BaseModel):
+    rule: str
+    description: Optional[str] = None
+
+
+class Relationship(BaseModel):
+    character1: str
+    character2: str
+    relationship: Optional[str] = None
+
+
+class StoryElements(BaseModel):
+    characters: List[StoryCharacter] = []
+    timeline_events: List[TimelineEvent] = []
+    locations: List[StoryLocation] = []
+    plot_threads: List[PlotThread] = []
+    world_rules: List[WorldRule] = []
+    relationships: List[Relationship] = []
+
+
+class BibleEntry(BaseModel):
+    name: str
+    description: str = ""
+
+
+class BibleRule(BaseModel):
+    rule: str
+    description: str = ""
+
+
+class BibleThread(BaseModel):
+    thread: str
+    status: str = "ongoing"
+    details: str = ""
+
+
+class StoryBible(BaseModel):
+    arc_summary: str = ""
+    characters: List[BibleEntry] = []
+    locations: List[BibleEntry] = []
+    world_rules: List[BibleRule] = []
+    plot_threads: List[BibleThread] = []
+
+
+class ChapterMemoryUpdate(BaseModel):
+    chapter_summary: str
+    bible: StoryBible
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the search_embeddings RPC.
+
+Seeds synthetic embeddings in growing steps into a table shared by several
+owners, then measures query latency and recall@k for one measured user at
+each table size, and removes everything it created. The measured user owns
+only --owner-share of the rows, as in a multi-tenant table, so a search that
+filters by owner after an approximate scan shows up as lost recall.
+Run the migrations (001 and 007) first. search_embeddings searches owners
+with up to 10000 rows exactly, so the HNSW path is only exercised once the
+measured user owns more than that (e.g. --sizes 250000 with the default share).
+
+Usage: python benchmark_search_embeddings.py [--sizes 1000 5000 20000] [--queries 50]
+                                             [--owner-share 0.05] [--other-owners 20]
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from embeddings import EMBEDDING_DIMENSIONS
+from repository import SupabaseRepository
+
+INSERT_BATCH_SIZE = 500
+MATCH_COUNT = 5
+
+
+def random_unit_vector(dimensions: int = EMBEDDING_DIMENSIONS):
+    """Random normalized vector, close enough to real embeddings for latency tests"""
+    vector = [random.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector]
+
+
+async def seed_embeddings(repository: SupabaseRepository, document_id: str, owners, start: int, count: int, owned_vectors):
+    """Insert synthetic embedding rows in batches, cycling through owners.
+
+    Rows for the measured user (owners[0]) are also kept in ``owned_vectors``
+    so exact results can be computed locally.
+    """
+    for offset in range(start, start + count, INSERT_BATCH_SIZE):
+        rows = []
+        for i in range(offset, min(offset + INSERT_BATCH_SIZE, start + count)):
+            row_id = str(uuid.uuid4())
+            owner = owners[i % len(owners)]
+            vector = random_unit_vector()
+            if owner == owners[0]:
+                owned_vectors[row_id] = vector
+            rows.append({
+                "id": row_id,
+                "document_id": document_id,
+                "created_by": owner,
+                "section_id": f"chunk_{i}",
+                "vector": vector,
+                "metadata": {"chunk_index": i, "chunk_text": f"benchmark chunk {i}", "document_title": "Benchmark", "document_type": "story"},
+                "created_at": datetime.now().isoformat(),
+                "updated_at": datetime.now().isoformat()
+            })
+        await repository.insert_embeddings(rows)
+
+
+def exact_top_ids(query_embedding, owned_vectors, k: int = MATCH_COUNT):
+    """Ids of the k most similar owned rows (vectors are unit length, so cosine is a dot product)"""
+    scored = sorted(
+        owned_vectors.items(),
+        key=lambda item: sum(q * v for q, v in zip(query_embedding, item[1])),
+        reverse=True
+    )
+    return {row_id for row_id, _ in scored[:k]}
+
+
+async def measure_queries(repository: SupabaseRepository, user_id: str, queries: int, owned_vectors=None):
+    """Run the RPC repeatedly; returns latencies in milliseconds and per-query recall@k"""
+    latencies = []
+    recalls = []
+    for _ in range(queries):
+        query_embedding = random_unit_vector()
+        started = time.perf_counter()
+        # A threshold of -1 keeps every candidate, so recall measures the search alone
+        results = await repository.search_embeddings(query_embedding, user_id, match_threshold=-1.0, match_count=MATCH_COUNT)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        if owned_vectors:
+            expected = exact_top_ids(query_embedding, owned_vectors)
+            found = {row["id"] for row in results}
+            recalls.append(len(found & expected) / len(expected))
+    return latencies, recalls
+
+
+async def run_benchmark(sizes, queries: int, owner_share: float, other_owners: int):
+    load_dotenv()
+    repository = SupabaseRepository(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+
+    print("📊 search_embeddings latency and recall benchmark")
+    print("=" * 60)
+
+    user_id = str(uuid.uuid4())
+    document_id = str(uuid.uuid4())
+    now = datetime.now().isoformat()
+
+    await repository.insert_user({
+        "id": user_id,
+        "name": "Benchmark User",
+        "email": f"benchmark-{user_id}@example.com",
+        "created_at": now,
+        "updated_at": now
+    })
+    await repository.insert_document({
+        "id": document_id,
+        "title": "Benchmark",
+        "type": "story",
+        "description": "Synthetic embeddings for search benchmarking",
+        "created_by": user_id,
+        "created_at": now,
+        "updated_at": now
+    })
+
+    # Rows are assigned by cycling through 100 owner slots; the measured user gets owner_share of them
+    measured_slots = max(1, min(100, round(owner_share * 100)))
+    owners = [user_id] * measured_slots
+    if other_owners > 0:
+        other_ids = [f"benchmark-owner-{uuid.uuid4()}" for _ in range(other_owners)]
+        owners += [other_ids[i % other_owners] for i in range(100 - measured_slots)]
+    owned_vectors = {}
+
+    print(f"Measured user owns ~{measured_slots / len(owners):.0%} of rows; {other_owners} other owners")
+    try:
+        seeded = 0
+        print(f"{'rows':>10} {'owned':>8} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {f'recall@{MATCH_COUNT}':>10}")
+        for size in sorted(sizes):
+            if size > seeded:
+                await seed_embeddings(repository, document_id, owners, seeded, size - seeded, owned_vectors)
+                seeded = size
+
+            # Warm up connections and caches before measuring
+            await measure_queries(repository, user_id, 3)
+            latencies, recalls = await measure_queries(repository, user_id, queries, owned_vectors)
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            print(
+                f"{size:>10} {len(owned_vectors):>8} {statistics.median(latencies):>10.1f} {p95:>10.1f} "
+                f"{latencies[-1]:>10.1f} {statistics.mean(recalls):>10.3f}"
+            )
+    finally:
+        print("\n🧹 Cleaning up benchmark data...")
+        embedding_table = await repository.table("embedding")
+        await embedding_table.delete().eq("document_id", document_id).execute()
+        document_table = await repository.table("document")
+        await document_table.delete().eq("id", document_id).execute()
+        user_table = await repository.table("user")
+        await user_table.delete().eq("id", user_id).execute()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the search_embeddings RPC against table size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--owner-share", type=float, default=0.05, help="fraction of rows owned by the measured user")
+    parser.add_argument("--other-owners", type=int, default=20, help="owners of the remaining rows")
+    args = parser.parse_args()
+
+    asyncio.run(run_benchmark(args.sizes, args.queries, args.owner_share, args.other_owners))
@@ -0,0 +1,114 @@
+import re
+from itertools import islice
+from typing import Iterable, Iterator, List, NamedTuple, Tuple
+
+# Rough characters-per-token ratio for English prose with Gemini tokenizers
+CHARS_PER_TOKEN = 4
+
+# A blank line ends a paragraph; sentence-ending punctuation (plus any closing
+# quotes/brackets) followed by whitespace ends a sentence.
+_BOUNDARY = re.compile(r'(\n[ \t]*\n)\s*|[.!?]["\'”’)\]]*(\s+)')
+_BLANK_LINE = re.compile(r'\n[ \t]*\n')
+
+
+class Chunk(NamedTuple):
+    index: int
+    text: str
+    start: int  # offset of the first character in the source text
+    end: int    # offset one past the last character
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the number of tokens in a piece of text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _iter_segments(text: str, max_chars: int) -> Iterator[Tuple[int, int, bool]]:
+    """Yield (start, end, ends_paragraph) spans for each sentence in a single pass.
+
+    Sentences longer than ``max_chars`` are split at the last whitespace that
+    fits, or hard-split if there is none.
+    """
+    def split_long(start: int, end: int, ends_paragraph: bool):
+        while end - start > max_chars:
+            cut = text.rfind(' ', start + 1, start + max_chars)
+            if cut <= start:
+                cut = start + max_chars
+            yield start, cut, False
+            start = cut
+            while start < end and text[start].isspace():
+                start += 1
+        if end > start:
+            yield start, end, ends_paragraph
+
+    pos = len(text) - len(text.lstrip())
+    for match in _BOUNDARY.finditer(text, pos):
+        if match.group(1) is not None:
+            end, ends_paragraph = match.start(1), True
+        else:
+            # Whitespace after the sentence may itself contain the blank line that ends the paragraph
+            end, ends_paragraph = match.start(2), _BLANK_LINE.search(match.group(2)) is not None
+        if end > pos:
+            yield from split_long(pos, end, ends_paragraph)
+        pos = match.end()
+
+    end = len(text.rstrip())
+    if end > pos:
+        yield from split_long(pos, end, True)
+
+
+def iter_chunks(text: str, max_tokens: int = 400, overlap_tokens: int = 50) -> Iterator[Chunk]:
+    """Split text into chunks of whole sentences within an approximate token budget.
+
+    Chunks are produced lazily from one pass over the text and carry their
+    start/end offsets. Consecutive chunks share up to ``overlap_tokens`` of
+    trailing sentences, except across paragraph breaks, and a chunk that is at
+    least half full is closed at the end of a paragraph.
+    """
+    max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+    overlap_chars = max(0, overlap_tokens * CHARS_PER_TOKEN)
+
+    index = 0
+    window: List[Tuple[int, int]] = []  # sentence spans in the current chunk
+
+    def emit() -> Chunk:
+        start, end = window[0][0], window[-1][1]
+        return Chunk(index, text[start:end], start, end)
+
+    def overlap_tail() -> List[Tuple[int, int]]:
+        tail: List[Tuple[int, int]] = []
+        for span in reversed(window):
+            if window[-1][1] - span[0] > overlap_chars:
+                break
+            tail.insert(0, span)
+        # Never carry the whole chunk over, or the next one could repeat it
+        return tail if len(tail) < len(window) else []
+
+    for start, end, ends_paragraph in _iter_segments(text, max_chars):
+        if window and end - window[0][0] > max_chars:
+            yield emit()
+            index += 1
+            window = overlap_tail()
+            # Drop overlap that would leave no room for the new sentence
+            while window and end - window[0][0] > max_chars:
+                window.pop(0)
+
+        window.append((start, end))
+
+        if ends_paragraph and window[-1][1] - window[0][0] >= max_chars // 2:
+            yield emit()
+            index += 1
+            window = []
+
+    if window:
+        yield emit()
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """Group an iterable into lists of at most ``size`` items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
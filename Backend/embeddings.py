@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Sequence
+
+from cachetools import LRUCache
+
+from llm_client import embed_content
+
+# Gemini text embedding model and its output size
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_DIMENSIONS = 768
+
+# Gemini accepts at most 100 contents per batch embedding request
+MAX_BATCH_SIZE = 100
+
+EMBEDDING_BATCH_SIZE = min(int(os.getenv("EMBEDDING_BATCH_SIZE", "32")), MAX_BATCH_SIZE)
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_TTL_SECONDS = int(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+REDIS_URL = os.getenv("REDIS_URL")
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache with an in-process LRU tier and an optional Redis tier"""
+
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE, redis_url: Optional[str] = REDIS_URL,
+                 ttl_seconds: int = EMBEDDING_CACHE_TTL_SECONDS):
+        self.memory = LRUCache(maxsize=max_size)
+        self.ttl_seconds = ttl_seconds
+        self.redis = None
+        if redis_url:
+            import redis.asyncio as redis
+            self.redis = redis.from_url(redis_url)
+
+        self.memory_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str, task_type: str, model: str = EMBEDDING_MODEL) -> str:
+        """Cache key: hash of model, task type and text"""
+        digest = hashlib.sha256(f"{model}\x00{task_type}\x00{text}".encode("utf-8")).hexdigest()
+        return f"embedding:{digest}"
+
+    async def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Look up keys in memory, then Redis; returns only the keys that were found"""
+        found = {}
+        remote_keys = []
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                found[key] = vector
+                self.memory_hits += 1
+            else:
+                remote_keys.append(key)
+
+        if remote_keys and self.redis is not None:
+            try:
+                values = await self.redis.mget(remote_keys)
+                for key, value in zip(remote_keys, values):
+                    if value is not None:
+                        vector = json.loads(value)
+                        self.memory[key] = vector
+                        found[key] = vector
+                        self.redis_hits += 1
+            except Exception as e:
+                print(f"Error reading embedding cache from Redis: {e}")
+
+        self.misses += len(keys) - len(found)
+        return found
+
+    async def set_many(self, items: Dict[str, List[float]]):
+        """Store vectors in memory and, when configured, in Redis"""
+        for key, vector in items.items():
+            self.memory[key] = vector
+
+        if items and self.redis is not None:
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for key, vector in items.items():
+                        pipe.set(key, json.dumps(vector), ex=self.ttl_seconds)
+                    await pipe.execute()
+            except Exception as e:
+                print(f"Error writing embedding cache to Redis: {e}")
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for monitoring"""
+        hits = self.memory_hits + self.redis_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "redis_enabled": self.redis is not None
+        }
+
+
+embedding_cache = EmbeddingCache()
+
+
+async def _embed_batch(texts: List[str], task_type: str, semaphore: asyncio.Semaphore) -> Optional[List[List[float]]]:
+    """Embed one batch while holding a concurrency slot; returns None if the request fails"""
+    async with semaphore:
+        try:
+            # One multi-content request embeds the whole batch
+            result = await embed_content(
+                model=EMBEDDING_MODEL,
+                content=texts,
+                task_type=task_type
+            )
+            return result['embedding']
+        except Exception as e:
+            print(f"Error generating embeddings for batch of {len(texts)}: {e}")
+            return None
+
+
+async def embed_texts(
+    texts: Sequence[str],
+    task_type: str = "retrieval_document",
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    concurrency: int = EMBEDDING_CONCURRENCY
+) -> List[Optional[List[float]]]:
+    """Embed many texts, grouping them into batches and running batches concurrently.
+
+    Results are returned in the same order as ``texts``. Cached vectors are
+    reused and duplicate texts are embedded once. A failed batch yields None
+    for its texts instead of failing the whole call, so callers can skip them
+    and retry later.
+    """
+    if not texts:
+        return []
+
+    keys = [embedding_cache.key(text, task_type) for text in texts]
+    vectors = await embedding_cache.get_many(list(dict.fromkeys(keys)))
+
+    # Embed each uncached text once, even if it appears several times
+    pending = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors and key not in pending:
+            pending[key] = text
+
+    if pending:
+        pending_keys = list(pending)
+        pending_texts = list(pending.values())
+
+        batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        batches = [(pending_keys[i:i + batch_size], pending_texts[i:i + batch_size])
+                   for i in range(0, len(pending_texts), batch_size)]
+        results = await asyncio.gather(*(_embed_batch(batch_texts, task_type, semaphore) for _, batch_texts in batches))
+
+        fresh = {}
+        for (batch_keys, _), batch_vectors in zip(batches, results):
+            if batch_vectors is None:
+                continue
+            fresh.update(zip(batch_keys, batch_vectors))
+
+        await embedding_cache.set_many(fresh)
+        vectors.update(fresh)
+
+    return [vectors.get(key) for key in keys]
+
+
+async def embed_text(text: str, task_type: str = "retrieval_document") -> Optional[List[float]]:
+    """Embed a single text; None if the request failed"""
+    vectors = await embed_texts([text], task_type=task_type)
+    return vectors[0]
@@ -0,0 +1,68 @@
+import asyncio
+import os
+from typing import Any, AsyncIterator, Dict, Optional
+
+import google.generativeai as genai
+
+# Every call goes through the SDK's native async API, so waiting on Gemini never
+# blocks the event loop and cancelling a caller (a timeout, or a superseded
+# /auto_suggest request) cancels the request itself and frees its slot at once.
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "16"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+# Separate slots for background work nobody is waiting on (e.g. prompt summaries)
+LLM_BACKGROUND_CONCURRENCY = int(os.getenv("LLM_BACKGROUND_CONCURRENCY", "2"))
+
+_semaphores: Dict[bool, asyncio.Semaphore] = {}
+
+
+def _get_semaphore(background: bool = False) -> asyncio.Semaphore:
+    """Create the concurrency limiters lazily so they bind to the running event loop"""
+    semaphore = _semaphores.get(background)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(LLM_BACKGROUND_CONCURRENCY if background else LLM_CONCURRENCY)
+        _semaphores[background] = semaphore
+    return semaphore
+
+
+async def generate_content(model: genai.GenerativeModel, prompt: Any, timeout: Optional[float] = None,
+                           background: bool = False, **kwargs) -> Any:
+    """Async wrapper around GenerativeModel.generate_content with a concurrency limit and timeout.
+
+    Raises asyncio.TimeoutError if the call does not finish within ``timeout``
+    seconds (LLM_TIMEOUT_SECONDS by default). ``background`` calls use their own
+    LLM_BACKGROUND_CONCURRENCY slots, so they never hold up interactive requests.
+    """
+    timeout = LLM_TIMEOUT_SECONDS if timeout is None else timeout
+    kwargs.setdefault("request_options", {"timeout": timeout})
+    async with _get_semaphore(background):
+        return await asyncio.wait_for(model.generate_content_async(prompt, **kwargs), timeout=timeout)
+
+
+async def embed_content(timeout: Optional[float] = None, **kwargs) -> Any:
+    """Async wrapper around genai.embed_content"""
+    timeout = LLM_TIMEOUT_SECONDS if timeout is None else timeout
+    kwargs.setdefault("request_options", {"timeout": timeout})
+    async with _get_semaphore():
+        return await asyncio.wait_for(genai.embed_content_async(**kwargs), timeout=timeout)
+
+
+async def stream_content(model: genai.GenerativeModel, prompt: Any, timeout: Optional[float] = None, **kwargs) -> AsyncIterator[str]:
+    """Stream text chunks from GenerativeModel.generate_content as the model produces them.
+
+    ``timeout`` bounds the wait for each chunk, not the whole response. The
+    concurrency slot is held while the stream is open; closing the generator
+    early cancels the request and releases the slot.
+    """
+    timeout = LLM_TIMEOUT_SECONDS if timeout is None else timeout
+    kwargs.setdefault("request_options", {"timeout": timeout})
+    async with _get_semaphore():
+        response = await asyncio.wait_for(model.generate_content_async(prompt, stream=True, **kwargs), timeout=timeout)
+        chunks = response.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+            except StopAsyncIteration:
+                break
+            text = chunk.text
+            if text:
+                yield text
@@ -0,0 +1,85 @@
+-- Migration 001: approximate nearest-neighbour search for embeddings
+--
+-- * Denormalizes the document owner onto "embedding" so searches can filter
+--   by user without joining "document"
+-- * Adds an HNSW index on "embedding"."vector" (cosine distance)
+-- * Rewrites search_embeddings to compute the distance once per row and let
+--   the index drive the ORDER BY ... LIMIT
+--
+-- Safe to run more than once.
+
+-- Owner column, backfilled from the parent document
+ALTER TABLE "embedding" ADD COLUMN IF NOT EXISTS "created_by" TEXT;
+
+UPDATE "embedding" e
+SET "created_by" = d."created_by"
+FROM "document" d
+WHERE e."document_id" = d."id"
+AND e."created_by" IS NULL;
+
+-- Fill the owner on insert when the writer does not provide it
+CREATE OR REPLACE FUNCTION set_embedding_created_by()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.created_by IS NULL THEN
+        SELECT d.created_by INTO NEW.created_by FROM "document" d WHERE d.id = NEW.document_id;
+    END IF;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS set_embedding_created_by ON "embedding";
+CREATE TRIGGER set_embedding_created_by BEFORE INSERT OR UPDATE OF "document_id" ON "embedding"
+    FOR EACH ROW EXECUTE FUNCTION set_embedding_created_by();
+
+-- HNSW indexes need a fixed dimension (text-embedding-004 produces 768)
+ALTER TABLE "embedding" ALTER COLUMN "vector" TYPE vector(768);
+
+CREATE INDEX IF NOT EXISTS "embedding_created_by_idx" ON "embedding" ("created_by");
+CREATE INDEX IF NOT EXISTS "embedding_vector_hnsw_idx" ON "embedding"
+    USING hnsw ("vector" vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+-- Vector similarity search: one distance computation per row, owner filtered
+-- on the embedding table, threshold applied to the top candidates only
+CREATE OR REPLACE FUNCTION search_embeddings(
+    query_embedding vector,
+    user_id text,
+    match_threshold float DEFAULT 0.7,
+    match_count int DEFAULT 5
+)
+RETURNS TABLE (
+    id text,
+    document_id text,
+    section_id text,
+    metadata json,
+    similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Widen the HNSW candidate list so enough rows survive the owner filter
+    PERFORM set_config('hnsw.ef_search', greatest(40, match_count * 4)::text, true);
+
+    RETURN QUERY
+    SELECT
+        nearest.id,
+        nearest.document_id,
+        nearest.section_id,
+        nearest.metadata,
+        1 - nearest.distance as similarity
+    FROM (
+        SELECT
+            e.id,
+            e.document_id,
+            e.section_id,
+            e.metadata,
+            e.vector <=> query_embedding as distance
+        FROM embedding e
+        WHERE e.created_by = search_embeddings.user_id
+        ORDER BY distance
+        LIMIT match_count
+    ) nearest
+    WHERE nearest.distance < 1 - match_threshold
+    ORDER BY nearest.distance;
+END;
+$$;
@@ -0,0 +1,54 @@
+-- Migration 002: per-document passage search for the continuity agent
+--
+-- Story chapters added through the continuity agent are embedded into
+-- "embedding" with metadata.source_task_id pointing at their
+-- story_context_added task. Continuity checks pull only the most relevant
+-- earlier passages of the same document.
+--
+-- Safe to run more than once.
+
+CREATE OR REPLACE FUNCTION search_document_embeddings(
+    query_embedding vector,
+    doc_id text,
+    match_count int DEFAULT 5,
+    exclude_source_task_id text DEFAULT NULL
+)
+RETURNS TABLE (
+    id text,
+    document_id text,
+    section_id text,
+    metadata json,
+    similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Exact search over one document's rows: the document_id index narrows the
+    -- scan, and materializing keeps the planner off the global HNSW index,
+    -- which could drop matches when post-filtering by document
+    RETURN QUERY
+    WITH document_rows AS MATERIALIZED (
+        SELECT e.id, e.document_id, e.section_id, e.metadata, e.vector
+        FROM embedding e
+        WHERE e.document_id = doc_id
+        AND (exclude_source_task_id IS NULL OR e.metadata->>'source_task_id' IS DISTINCT FROM exclude_source_task_id)
+    )
+    SELECT
+        nearest.id,
+        nearest.document_id,
+        nearest.section_id,
+        nearest.metadata,
+        1 - nearest.distance as similarity
+    FROM (
+        SELECT
+            r.id,
+            r.document_id,
+            r.section_id,
+            r.metadata,
+            r.vector <=> query_embedding as distance
+        FROM document_rows r
+    ) nearest
+    ORDER BY nearest.distance
+    LIMIT match_count;
+END;
+$$;
@@ -0,0 +1,55 @@
+-- Migration 003: materialized story-element aggregate per document
+--
+-- get_story_summary used to re-read every story_element_extraction task and
+-- re-aggregate in Python. This table holds the running aggregate, merged
+-- atomically each time an extraction completes. Characters and locations
+-- are JSONB objects keyed by normalized name, with the first-seen display
+-- name as the value.
+--
+-- Safe to run more than once.
+
+CREATE TABLE IF NOT EXISTS "story_element_summary" (
+    "document_id" TEXT PRIMARY KEY REFERENCES "document"("id") ON DELETE CASCADE,
+    "characters" JSONB NOT NULL DEFAULT '{}'::jsonb,
+    "locations" JSONB NOT NULL DEFAULT '{}'::jsonb,
+    "timeline_events" INTEGER NOT NULL DEFAULT 0,
+    "plot_threads" INTEGER NOT NULL DEFAULT 0,
+    "world_rules_count" INTEGER NOT NULL DEFAULT 0,
+    "relationships_count" INTEGER NOT NULL DEFAULT 0,
+    "analysis_tasks_completed" INTEGER NOT NULL DEFAULT 0,
+    "updated_at" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- Merge one extraction into the aggregate in a single statement, so
+-- concurrent extractions for the same document never lose updates
+CREATE OR REPLACE FUNCTION merge_story_element_summary(
+    doc_id text,
+    new_characters jsonb,
+    new_locations jsonb,
+    new_timeline_events int,
+    new_plot_threads int,
+    new_world_rules int,
+    new_relationships int
+)
+RETURNS void
+LANGUAGE sql
+AS $$
+    INSERT INTO story_element_summary AS s (
+        document_id, characters, locations, timeline_events, plot_threads,
+        world_rules_count, relationships_count, analysis_tasks_completed, updated_at
+    )
+    VALUES (
+        doc_id, new_characters, new_locations, new_timeline_events, new_plot_threads,
+        new_world_rules, new_relationships, 1, NOW()
+    )
+    ON CONFLICT (document_id) DO UPDATE SET
+        -- Existing keys win, so the first-seen display name is kept
+        characters = EXCLUDED.characters || s.characters,
+        locations = EXCLUDED.locations || s.locations,
+        timeline_events = s.timeline_events + EXCLUDED.timeline_events,
+        plot_threads = s.plot_threads + EXCLUDED.plot_threads,
+        world_rules_count = s.world_rules_count + EXCLUDED.world_rules_count,
+        relationships_count = s.relationships_count + EXCLUDED.relationships_count,
+        analysis_tasks_completed = s.analysis_tasks_completed + 1,
+        updated_at = NOW();
+$$;
@@ -0,0 +1,19 @@
+-- Migration 004: paginated, projected reads of agent_task
+--
+-- Agent task listings page by (created_at, id) keyset cursors and no longer
+-- return the full "result" JSON by default. story_context_added rows keep
+-- whole chapter texts in result.content, so a short preview is stored as a
+-- generated column that listings can select instead.
+--
+-- Safe to run more than once.
+
+ALTER TABLE "agent_task"
+    ADD COLUMN IF NOT EXISTS "content_preview" TEXT
+    GENERATED ALWAYS AS (left("result"->>'content', 200)) STORED;
+
+-- Keyset pagination per document, with and without a task_type filter
+CREATE INDEX IF NOT EXISTS agent_task_document_created_idx
+    ON "agent_task" ("document_id", "created_at" DESC, "id" DESC);
+
+CREATE INDEX IF NOT EXISTS agent_task_document_type_created_idx
+    ON "agent_task" ("document_id", "task_type", "created_at" DESC, "id" DESC);
@@ -0,0 +1,85 @@
+-- Migration 005: store story chapters once, outside agent_task
+--
+-- add_story_context used to keep each chapter's full text in
+-- agent_task.result, and continuity checks copied it again as new_content.
+-- Chapters now live in story_chapter, ordered per document by
+-- sequence_number, and agent tasks reference them by chapter_id.
+-- The (document_id, task_type, created_at) index backing agent task
+-- queries is created in 004_agent_task_pagination.sql.
+--
+-- Safe to run more than once.
+
+CREATE TABLE IF NOT EXISTS "story_chapter" (
+    "id" TEXT PRIMARY KEY,
+    "document_id" TEXT NOT NULL REFERENCES "document"("id") ON DELETE CASCADE,
+    "sequence_number" INTEGER NOT NULL,
+    "title" TEXT,
+    "content" TEXT NOT NULL,
+    "content_length" INTEGER GENERATED ALWAYS AS (char_length("content")) STORED,
+    "content_preview" TEXT GENERATED ALWAYS AS (left("content", 200)) STORED,
+    "created_at" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    "updated_at" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    -- Also the index for reading a document's chapters in order
+    UNIQUE ("document_id", "sequence_number")
+);
+
+-- Append a chapter with the next sequence number; the per-document advisory
+-- lock keeps concurrent appends from taking the same number
+CREATE OR REPLACE FUNCTION append_story_chapter(
+    chapter_id text,
+    doc_id text,
+    chapter_title text,
+    chapter_content text
+)
+RETURNS TABLE (
+    id text,
+    sequence_number integer
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('story_chapter:' || doc_id));
+
+    RETURN QUERY
+    INSERT INTO story_chapter AS c (id, document_id, sequence_number, title, content)
+    SELECT
+        chapter_id,
+        doc_id,
+        COALESCE(MAX(existing.sequence_number), 0) + 1,
+        chapter_title,
+        chapter_content
+    FROM story_chapter existing
+    WHERE existing.document_id = doc_id
+    RETURNING c.id, c.sequence_number;
+END;
+$$;
+
+-- Move chapter text out of existing story_context_added tasks, reusing the
+-- task id as the chapter id
+INSERT INTO story_chapter (id, document_id, sequence_number, title, content, created_at, updated_at)
+SELECT
+    t.id,
+    t.document_id,
+    ROW_NUMBER() OVER (PARTITION BY t.document_id ORDER BY t.created_at, t.id)
+        + COALESCE((SELECT MAX(c.sequence_number) FROM story_chapter c WHERE c.document_id = t.document_id), 0),
+    t.result->>'chapter_title',
+    t.result->>'content',
+    t.created_at,
+    t.updated_at
+FROM agent_task t
+WHERE t.task_type = 'story_context_added'
+  AND t.document_id IS NOT NULL
+  AND t.result->>'content' IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM story_chapter c WHERE c.id = t.id)
+ORDER BY t.document_id, t.created_at;
+
+UPDATE agent_task
+SET result = ((result::jsonb - 'content') || jsonb_build_object('chapter_id', id))::json
+WHERE task_type = 'story_context_added'
+  AND result->>'content' IS NOT NULL;
+
+-- Continuity checks reference the checked chapter instead of repeating its text
+UPDATE agent_task
+SET result = (result::jsonb - 'new_content')::json
+WHERE task_type = 'plot_continuity_check'
+  AND result->>'new_content' IS NOT NULL;
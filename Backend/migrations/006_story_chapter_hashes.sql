@@ -0,0 +1,111 @@
+-- Migration 006: content hashes for idempotent chapter ingestion
+--
+-- Each chapter records the sha256 of its content and a hash chain of the
+-- story up to and including it (state_hash = sha256(previous_state_hash ||
+-- ':' || content_hash)). A repeated continuity check for the same text finds
+-- the existing chapter by (document_id, content_hash) instead of appending it
+-- again, and its cached result is keyed by content_hash plus
+-- previous_state_hash, the story state it was checked against.
+--
+-- Safe to run more than once.
+
+ALTER TABLE "story_chapter" ADD COLUMN IF NOT EXISTS "content_hash" TEXT;
+ALTER TABLE "story_chapter" ADD COLUMN IF NOT EXISTS "previous_state_hash" TEXT;
+ALTER TABLE "story_chapter" ADD COLUMN IF NOT EXISTS "state_hash" TEXT;
+ALTER TABLE "story_chapter" ADD COLUMN IF NOT EXISTS "context_task_id" TEXT;
+
+-- Backfill hashes for chapters stored before this migration; chapters moved
+-- out of agent_task by migration 005 reuse their task id as chapter id
+UPDATE story_chapter
+SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')
+WHERE content_hash IS NULL;
+
+UPDATE story_chapter
+SET context_task_id = id
+WHERE context_task_id IS NULL;
+
+WITH RECURSIVE chain AS (
+    SELECT c.id, c.document_id, c.sequence_number, ''::text AS previous_state_hash,
+           encode(sha256(convert_to(':' || c.content_hash, 'UTF8')), 'hex') AS state_hash
+    FROM story_chapter c
+    WHERE c.sequence_number = 1
+    UNION ALL
+    SELECT c.id, c.document_id, c.sequence_number, chain.state_hash,
+           encode(sha256(convert_to(chain.state_hash || ':' || c.content_hash, 'UTF8')), 'hex')
+    FROM story_chapter c
+    JOIN chain ON c.document_id = chain.document_id AND c.sequence_number = chain.sequence_number + 1
+)
+UPDATE story_chapter c
+SET previous_state_hash = chain.previous_state_hash,
+    state_hash = chain.state_hash
+FROM chain
+WHERE c.id = chain.id
+  AND c.state_hash IS NULL;
+
+-- Not unique: documents may already hold duplicates from before this
+-- migration; append_story_chapter's advisory lock prevents new ones
+CREATE INDEX IF NOT EXISTS story_chapter_document_content_hash_idx
+    ON "story_chapter" ("document_id", "content_hash");
+
+-- Append a chapter unless the document already has one with the same
+-- content; returns the new or existing chapter and whether it was created
+DROP FUNCTION IF EXISTS append_story_chapter(text, text, text, text);
+
+CREATE OR REPLACE FUNCTION append_story_chapter(
+    chapter_id text,
+    doc_id text,
+    chapter_title text,
+    chapter_content text,
+    chapter_content_hash text,
+    chapter_context_task_id text
+)
+RETURNS TABLE (
+    id text,
+    sequence_number integer,
+    content_hash text,
+    previous_state_hash text,
+    state_hash text,
+    context_task_id text,
+    created boolean
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    last_state text;
+    next_sequence integer;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('story_chapter:' || doc_id));
+
+    RETURN QUERY
+    SELECT c.id, c.sequence_number, c.content_hash, c.previous_state_hash, c.state_hash, c.context_task_id, false
+    FROM story_chapter c
+    WHERE c.document_id = doc_id AND c.content_hash = chapter_content_hash
+    ORDER BY c.sequence_number
+    LIMIT 1;
+    IF FOUND THEN
+        RETURN;
+    END IF;
+
+    SELECT c.state_hash, c.sequence_number INTO last_state, next_sequence
+    FROM story_chapter c
+    WHERE c.document_id = doc_id
+    ORDER BY c.sequence_number DESC
+    LIMIT 1;
+
+    last_state := COALESCE(last_state, '');
+    next_sequence := COALESCE(next_sequence, 0) + 1;
+
+    RETURN QUERY
+    INSERT INTO story_chapter AS c (
+        id, document_id, sequence_number, title, content,
+        content_hash, previous_state_hash, state_hash, context_task_id
+    )
+    VALUES (
+        chapter_id, doc_id, next_sequence, chapter_title, chapter_content,
+        chapter_content_hash, last_state,
+        encode(sha256(convert_to(last_state || ':' || chapter_content_hash, 'UTF8')), 'hex'),
+        chapter_context_task_id
+    )
+    RETURNING c.id, c.sequence_number, c.content_hash, c.previous_state_hash, c.state_hash, c.context_task_id, true;
+END;
+$$;
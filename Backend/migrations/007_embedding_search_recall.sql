@@ -0,0 +1,112 @@
+-- Migration 007: keep search_embeddings recall for owners with a small share of rows
+--
+-- The HNSW scan in migration 001 applies the owner filter to a candidate list
+-- of only hnsw.ef_search rows, so a user who owns a small share of a shared
+-- embedding table could get few or no results. search_embeddings now:
+--
+-- * searches exactly when the owner has at most 10000 rows (the created_by
+--   index narrows the scan to the owner's rows)
+-- * otherwise uses the HNSW index with hnsw.iterative_scan
+--
+-- Requires pgvector 0.8.0 or later (ALTER EXTENSION vector UPDATE).
+-- Safe to run more than once.
+
+DO $$
+BEGIN
+    IF string_to_array((SELECT extversion FROM pg_extension WHERE extname = 'vector'), '.')::int[] < ARRAY[0, 8, 0] THEN
+        RAISE EXCEPTION 'search_embeddings needs pgvector 0.8.0 or later for hnsw.iterative_scan; run ALTER EXTENSION vector UPDATE';
+    END IF;
+END
+$$;
+
+-- Vector similarity search for one owner. Owners with few rows are searched
+-- exactly; larger owners use the HNSW index with iterative scans so the owner
+-- filter can't cut the result short. Requires pgvector 0.8.0 or later.
+CREATE OR REPLACE FUNCTION search_embeddings(
+    query_embedding vector,
+    user_id text,
+    match_threshold float DEFAULT 0.7,
+    match_count int DEFAULT 5
+)
+RETURNS TABLE (
+    id text,
+    document_id text,
+    section_id text,
+    metadata json,
+    similarity float
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    -- Owners with at most this many rows are compared row by row
+    exact_search_max_rows CONSTANT int := 10000;
+    owner_row_count int;
+BEGIN
+    -- Bounded count: stops reading the created_by index once the owner is known to be large
+    SELECT count(*) INTO owner_row_count
+    FROM (
+        SELECT 1 FROM embedding e
+        WHERE e.created_by = search_embeddings.user_id
+        LIMIT exact_search_max_rows + 1
+    ) owned;
+
+    IF owner_row_count <= exact_search_max_rows THEN
+        -- Exact search: materializing keeps the planner off the global HNSW
+        -- index, whose candidate list may hold none of this owner's rows
+        RETURN QUERY
+        WITH owner_rows AS MATERIALIZED (
+            SELECT e.id, e.document_id, e.section_id, e.metadata, e.vector
+            FROM embedding e
+            WHERE e.created_by = search_embeddings.user_id
+        )
+        SELECT
+            nearest.id,
+            nearest.document_id,
+            nearest.section_id,
+            nearest.metadata,
+            1 - nearest.distance as similarity
+        FROM (
+            SELECT
+                r.id,
+                r.document_id,
+                r.section_id,
+                r.metadata,
+                r.vector <=> query_embedding as distance
+            FROM owner_rows r
+            ORDER BY distance
+            LIMIT match_count
+        ) nearest
+        WHERE nearest.distance < 1 - match_threshold
+        ORDER BY nearest.distance;
+        RETURN;
+    END IF;
+
+    -- Iterative scans keep walking the HNSW graph until match_count rows pass
+    -- the owner filter (bounded by hnsw.max_scan_tuples); relaxed order is
+    -- re-sorted by the outer query
+    PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    PERFORM set_config('hnsw.ef_search', greatest(40, match_count * 4)::text, true);
+
+    RETURN QUERY
+    SELECT
+        nearest.id,
+        nearest.document_id,
+        nearest.section_id,
+        nearest.metadata,
+        1 - nearest.distance as similarity
+    FROM (
+        SELECT
+            e.id,
+            e.document_id,
+            e.section_id,
+            e.metadata,
+            e.vector <=> query_embedding as distance
+        FROM embedding e
+        WHERE e.created_by = search_embeddings.user_id
+        ORDER BY distance
+        LIMIT match_count
+    ) nearest
+    WHERE nearest.distance < 1 - match_threshold
+    ORDER BY nearest.distance;
+END;
+$$;
@@ -0,0 +1,10 @@
+-- Migration 008: drop agent_task.content_preview
+--
+-- Chapter text moved to "story_chapter" in migration 005, so
+-- story_context_added rows no longer carry result.content and the generated
+-- preview column from migration 004 is always NULL. Chapter previews come
+-- from story_chapter.content_preview instead.
+--
+-- Safe to run more than once.
+
+ALTER TABLE "agent_task" DROP COLUMN IF EXISTS "content_preview";
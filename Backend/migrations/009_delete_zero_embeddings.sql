@@ -0,0 +1,12 @@
+-- Migration 009: remove zero-vector embedding rows
+--
+-- embed_texts used to return a zero vector for texts whose embedding request
+-- failed, and those rows were stored under the chunk's content-hash id. A zero
+-- vector has no cosine similarity, so the chunk never showed up in search, and
+-- later updates saw the id as already embedded and never retried it. Failed
+-- chunks are no longer stored; deleting the old zero rows lets the next
+-- document update embed them again.
+--
+-- Safe to run more than once.
+
+DELETE FROM "embedding" WHERE vector_norm("vector") = 0;
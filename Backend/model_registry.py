@@ -0,0 +1,70 @@
+import os
+import threading
+from typing import Any, Dict, NamedTuple
+
+import google.generativeai as genai
+
+
+class ModelProfile(NamedTuple):
+    model_name: str
+    temperature: float
+    max_output_tokens: int
+    json_output: bool = False  # JSON mode (application/json responses)
+
+
+# One long-lived model per purpose. Interactive paths get the cheapest, fastest
+# model; agent calls that return JSON use JSON mode. Each model name can be
+# overridden with GEMINI_MODEL_<PURPOSE>, e.g. GEMINI_MODEL_SUGGESTIONS.
+MODEL_PROFILES: Dict[str, ModelProfile] = {
+    # /auto_suggest and its stream: short continuations while the user types
+    "suggestions": ModelProfile("gemini-2.0-flash-lite", temperature=0.9, max_output_tokens=512),
+    # /writing_assist and its stream: longer RAG-grounded writing help
+    "writing": ModelProfile("gemini-2.0-flash", temperature=0.8, max_output_tokens=2048),
+    # Story structure, plot improvement, writing quality and feedback analysis
+    "analysis": ModelProfile("gemini-2.0-flash", temperature=0.4, max_output_tokens=2048),
+    # Continuity checks against the story memory
+    "continuity": ModelProfile("gemini-2.0-flash", temperature=0.2, max_output_tokens=4096, json_output=True),
+    # Story element extraction
+    "extraction": ModelProfile("gemini-2.0-flash-lite", temperature=0.1, max_output_tokens=4096, json_output=True),
+    # Rolling summaries of the text before the suggestion prompt window
+    "summary": ModelProfile("gemini-2.0-flash-lite", temperature=0.2, max_output_tokens=512),
+    # Chapter summaries and story bible updates
+    "memory": ModelProfile("gemini-2.0-flash", temperature=0.2, max_output_tokens=4096, json_output=True),
+}
+
+_models: Dict[str, genai.GenerativeModel] = {}
+_lock = threading.Lock()
+
+
+def model_profile(purpose: str) -> ModelProfile:
+    """Profile for a purpose, with any GEMINI_MODEL_<PURPOSE> override applied"""
+    try:
+        profile = MODEL_PROFILES[purpose]
+    except KeyError:
+        raise ValueError(f"Unknown model purpose '{purpose}'")
+    override = os.getenv(f"GEMINI_MODEL_{purpose.upper()}")
+    return profile._replace(model_name=override) if override else profile
+
+
+def get_model(purpose: str) -> genai.GenerativeModel:
+    """Shared GenerativeModel for a purpose, created on first use"""
+    model = _models.get(purpose)
+    if model is None:
+        with _lock:
+            model = _models.get(purpose)
+            if model is None:
+                profile = model_profile(purpose)
+                generation_config: Dict[str, Any] = {
+                    "temperature": profile.temperature,
+                    "max_output_tokens": profile.max_output_tokens
+                }
+                if profile.json_output:
+                    generation_config["response_mime_type"] = "application/json"
+                model = genai.GenerativeModel(profile.model_name, generation_config=generation_config)
+                _models[purpose] = model
+    return model
+
+
+def model_summary() -> Dict[str, Dict[str, Any]]:
+    """Model name and generation settings per purpose, for diagnostics"""
+    return {purpose: model_profile(purpose)._asdict() for purpose in MODEL_PROFILES}
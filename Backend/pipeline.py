@@ -0,0 +1,58 @@
+import asyncio
+import time
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, Iterable, Mapping, NamedTuple, Tuple
+
+
+class Stage(NamedTuple):
+    name: str
+    run: Callable[[Mapping[str, Any]], Awaitable[Any]]  # receives the results of its dependencies by name
+    depends_on: Tuple[str, ...] = ()
+
+
+async def run_stages(stages: Iterable[Stage]) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """Run stages as a dependency graph, starting each one as soon as its dependencies finish.
+
+    Each stage gets a read-only mapping of just its declared dependencies'
+    results, so stages running side by side never see each other's output.
+    Returns (results, durations) keyed by stage name, with durations in
+    milliseconds. If a stage raises, stages still running are cancelled and
+    the exception propagates.
+    """
+    stages = {stage.name: stage for stage in stages}
+    for stage in stages.values():
+        missing = [name for name in stage.depends_on if name not in stages]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {', '.join(missing)}")
+
+    # A cycle would leave its stages waiting on each other forever
+    ordered = set()
+    while len(ordered) < len(stages):
+        ready = [name for name, stage in stages.items() if name not in ordered and set(stage.depends_on) <= ordered]
+        if not ready:
+            raise ValueError("Stage dependencies contain a cycle")
+        ordered.update(ready)
+
+    durations: Dict[str, float] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run(stage: Stage) -> Any:
+        outputs = await asyncio.gather(*(tasks[name] for name in stage.depends_on))
+        inputs = MappingProxyType(dict(zip(stage.depends_on, outputs)))
+        started = time.perf_counter()
+        result = await stage.run(inputs)
+        durations[stage.name] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    for stage in stages.values():
+        tasks[stage.name] = asyncio.ensure_future(run(stage))
+
+    try:
+        outputs = await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+
+    return dict(zip(tasks, outputs)), durations
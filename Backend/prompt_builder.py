@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import os
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from cachetools import LRUCache
+
+from chunking import CHARS_PER_TOKEN
+from llm_client import generate_content
+from model_registry import get_model
+
+# Verbatim editor text sent with each suggestion prompt, before and after the cursor
+SUGGESTION_WINDOW_TOKENS = int(os.getenv("SUGGESTION_WINDOW_TOKENS", "1500"))
+# Part of the window reserved for text after the cursor (infill); unused space goes to the text before it
+SUGGESTION_AFTER_CURSOR_TOKENS = int(os.getenv("SUGGESTION_AFTER_CURSOR_TOKENS", "250"))
+# Summaries cover the text up to a block-aligned boundary so they stay valid while the user types
+SUMMARY_BLOCK_CHARS = int(os.getenv("SUMMARY_BLOCK_CHARS", "2000"))
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "2000"))
+# Most blocks folded into a summary per call, so catching up after an early edit takes bounded calls
+SUMMARY_EXTEND_MAX_BLOCKS = 8
+
+
+class PromptWindow(NamedTuple):
+    before: str   # text before the cursor, inside the window
+    after: str    # text after the cursor, inside the window (for infill)
+    summary: str  # summary of the text before the window; "" if there is none or it isn't ready yet
+    omitted_chars: int  # characters before the window that aren't sent verbatim
+
+
+def snap_back(text: str, position: int, floor: int) -> int:
+    """Move a cut point back to just after the last whitespace in (floor, position], if any"""
+    cut = max(text.rfind(" ", floor, position), text.rfind("\n", floor, position))
+    return cut + 1 if cut >= floor else position
+
+
+def summary_boundary(text: str, position: int) -> int:
+    """Block-aligned cut at or before ``position``; depends only on the text before it"""
+    aligned = (position // SUMMARY_BLOCK_CHARS) * SUMMARY_BLOCK_CHARS
+    if aligned <= 0:
+        return 0
+    return snap_back(text, aligned, aligned - SUMMARY_BLOCK_CHARS)
+
+
+def block_boundaries(text: str, boundary: int) -> List[int]:
+    """Every summary boundary from the first block up to and including ``boundary``"""
+    count = -(-boundary // SUMMARY_BLOCK_CHARS)
+    return [summary_boundary(text, block * SUMMARY_BLOCK_CHARS) for block in range(1, count + 1)]
+
+
+def summary_keys(text: str, boundaries: List[int]) -> List[str]:
+    """Chained cache key per boundary: a hash of the previous key and the block's own text"""
+    keys = []
+    key, start = "", 0
+    for end in boundaries:
+        key = hashlib.sha256(f"{key}\x00{text[start:end]}".encode("utf-8")).hexdigest()
+        keys.append(key)
+        start = end
+    return keys
+
+
+def cursor_window(text: str, cursor_position: Optional[int],
+                  window_tokens: int = SUGGESTION_WINDOW_TOKENS,
+                  after_tokens: int = SUGGESTION_AFTER_CURSOR_TOKENS) -> Tuple[int, int, int]:
+    """Pick the verbatim (start, cursor, end) span of ``text`` for a suggestion prompt.
+
+    ``start`` is a summary boundary, so the text before the window can be
+    summarized once and reused; the window can therefore run up to one
+    SUMMARY_BLOCK_CHARS over the token budget.
+    """
+    cursor = len(text) if cursor_position is None else max(0, min(cursor_position, len(text)))
+
+    end = min(len(text), cursor + after_tokens * CHARS_PER_TOKEN)
+    if end < len(text):
+        end = snap_back(text, end, cursor)
+
+    before_chars = max(0, window_tokens * CHARS_PER_TOKEN - (end - cursor) - SUMMARY_BLOCK_CHARS)
+    start = summary_boundary(text, cursor - before_chars) if cursor > before_chars else 0
+    return start, cursor, end
+
+
+class PromptBuilder:
+    """Builds bounded suggestion prompt windows, with cached summaries of the earlier text.
+
+    Summaries are generated in the background: a request whose summary isn't
+    cached yet gets the window alone, and later requests pick the summary up.
+    Each block's summary is keyed by its own text and the previous block's key,
+    and a new summary extends the latest cached one in the chain, folding in at
+    most SUMMARY_EXTEND_MAX_BLOCKS blocks per call. A growing manuscript is
+    summarized one block at a time, and after an early edit the summary is
+    rebuilt in bounded steps from the last cached one before the edit.
+    """
+
+    def __init__(self, max_size: int = SUMMARY_CACHE_SIZE):
+        self.summaries = LRUCache(maxsize=max_size)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def window(self, text: str, cursor_position: Optional[int]) -> PromptWindow:
+        start, cursor, end = cursor_window(text, cursor_position)
+        summary = ""
+        if start > 0:
+            boundaries = block_boundaries(text, start)
+            keys = summary_keys(text, boundaries)
+            summary = self.summaries.get(keys[-1], "")
+            if summary:
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._schedule(text[:start], boundaries, keys)
+        return PromptWindow(text[start:cursor], text[cursor:end], summary, start)
+
+    def _schedule(self, text: str, boundaries: List[int], keys: List[str]):
+        key = keys[-1]
+        if key in self._in_flight:
+            return
+        task = asyncio.ensure_future(self._summarize(text, boundaries, keys))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+    async def _summarize(self, text: str, boundaries: List[int], keys: List[str]):
+        try:
+            # Start from the latest cached summary in the chain; -1 means none
+            done = next((i for i in range(len(keys) - 1, -1, -1) if keys[i] in self.summaries), -1)
+            summary = self.summaries[keys[done]] if done >= 0 else ""
+            while done < len(keys) - 1:
+                step = min(done + SUMMARY_EXTEND_MAX_BLOCKS, len(keys) - 1)
+                summary = await self._extend(summary, text[boundaries[done] if done >= 0 else 0:boundaries[step]])
+                if not summary:
+                    return
+                self.summaries[keys[step]] = summary
+                done = step
+        except Exception as e:
+            print(f"Error summarizing earlier text: {e}")
+
+    async def _extend(self, previous: str, passage: str) -> str:
+        """Summary of ``passage``, folded into the summary of the text before it when there is one"""
+        if previous:
+            prompt = f"""Update this summary of a piece of writing with the passage that follows it.
+
+SUMMARY SO FAR:
+{previous}
+
+NEXT PASSAGE:
+{passage}
+
+Return only the updated summary, at most 200 words. Keep the names, events, facts and tone a writer would need to continue the text consistently."""
+        else:
+            prompt = f"""Summarize this piece of writing in at most 200 words. Keep the names, events, facts and tone a writer would need to continue the text consistently.
+
+TEXT:
+{passage}
+
+Return only the summary."""
+
+        # Nobody waits on a summary, so it never takes a slot from an interactive request
+        response = await generate_content(get_model("summary"), prompt, background=True)
+        return (response.text or "").strip()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "summaries": len(self.summaries),
+            "in_flight": len(self._in_flight),
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,369 @@
+import asyncio
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from supabase import AsyncClient, acreate_client
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque keyset cursor pointing just past a row, by (created_at, id)"""
+    raw = json.dumps([row["created_at"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return str(created_at), str(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class SupabaseRepository:
+    """Async data-access layer over a single shared Supabase client.
+
+    The async client keeps one pooled HTTP connection set for PostgREST, so all
+    endpoints and agents share connections instead of blocking the event loop
+    on synchronous round trips.
+    """
+
+    def __init__(self, url: str, key: str):
+        self.url = url
+        self.key = key
+        self._client: Optional[AsyncClient] = None
+        self._client_lock: Optional[asyncio.Lock] = None
+
+    async def client(self) -> AsyncClient:
+        """Return the shared async client, creating it on first use"""
+        if self._client is None:
+            if self._client_lock is None:
+                self._client_lock = asyncio.Lock()
+            async with self._client_lock:
+                if self._client is None:
+                    self._client = await acreate_client(self.url, self.key)
+        return self._client
+
+    async def table(self, name: str):
+        """Start a query builder on a table"""
+        client = await self.client()
+        return client.table(name)
+
+    # Users
+
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch a user by id"""
+        table = await self.table("user")
+        result = await table.select("*").eq("id", user_id).execute()
+        return result.data[0] if result.data else None
+
+    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """Fetch a user by email"""
+        table = await self.table("user")
+        result = await table.select("*").eq("email", email).execute()
+        return result.data[0] if result.data else None
+
+    async def insert_user(self, user: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Insert a user row and return the inserted rows"""
+        table = await self.table("user")
+        result = await table.insert(user).execute()
+        return result.data
+
+    # Documents
+
+    async def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch a document by id"""
+        table = await self.table("document")
+        result = await table.select("*").eq("id", document_id).execute()
+        return result.data[0] if result.data else None
+
+    async def list_user_documents(self, user_id: str) -> List[Dict[str, Any]]:
+        """Fetch all documents created by a user"""
+        table = await self.table("document")
+        result = await table.select("*").eq("created_by", user_id).execute()
+        return result.data
+
+    async def insert_document(self, document: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Insert a document row and return the inserted rows"""
+        table = await self.table("document")
+        result = await table.insert(document).execute()
+        return result.data
+
+    async def update_document(self, document_id: str, fields: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Update columns of a document and return the updated rows"""
+        table = await self.table("document")
+        result = await table.update(fields).eq("id", document_id).execute()
+        return result.data
+
+    # Embeddings
+
+    async def insert_embeddings(self, embeddings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Batch insert embedding rows"""
+        table = await self.table("embedding")
+        result = await table.insert(embeddings).execute()
+        return result.data
+
+    async def upsert_embeddings(self, embeddings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Batch insert or replace embedding rows by id"""
+        table = await self.table("embedding")
+        result = await table.upsert(embeddings).execute()
+        return result.data
+
+    async def list_embedding_chunks(self, document_id: str) -> List[Dict[str, Any]]:
+        """Fetch the id, section and chunk hash of a document's own chunk rows (no vectors).
+
+        Story passages embedded by the continuity agent share the document_id but
+        use "story_<task>_chunk_<n>" sections, so they are left out.
+        """
+        table = await self.table("embedding")
+        query = table.select("id, section_id, chunk_hash:metadata->>chunk_hash").eq("document_id", document_id)
+        result = await query.like("section_id", "chunk_%").execute()
+        return result.data
+
+    async def list_story_embedding_sections(self, document_id: str, source_task_id: str) -> List[str]:
+        """Section ids of the story passages already embedded for one story_context_added task"""
+        table = await self.table("embedding")
+        query = table.select("section_id").eq("document_id", document_id)
+        result = await query.like("section_id", f"story_{source_task_id}_chunk_%").execute()
+        return [row["section_id"] for row in result.data]
+
+    async def get_embedding_vectors(self, embedding_ids: List[str]) -> Dict[str, Any]:
+        """Fetch stored vectors for the given embedding ids"""
+        if not embedding_ids:
+            return {}
+        table = await self.table("embedding")
+        result = await table.select("id, vector").in_("id", embedding_ids).execute()
+        return {row["id"]: row["vector"] for row in result.data}
+
+    async def delete_embeddings(self, embedding_ids: List[str]) -> int:
+        """Delete embedding rows by id in a single request; returns the number of rows deleted"""
+        if not embedding_ids:
+            return 0
+        table = await self.table("embedding")
+        result = await table.delete().in_("id", embedding_ids).execute()
+        return len(result.data)
+
+    async def list_user_embeddings(self, user_id: str, page_size: int = 1000) -> List[Dict[str, Any]]:
+        """Fetch every embedding row (with vectors) owned by a user, page by page"""
+        table = await self.table("embedding")
+        rows: List[Dict[str, Any]] = []
+        while True:
+            result = await table.select("id, document_id, section_id, metadata, vector").eq("created_by", user_id).order("id").range(len(rows), len(rows) + page_size - 1).execute()
+            rows.extend(result.data)
+            if len(result.data) < page_size:
+                return rows
+
+    async def search_embeddings(self, query_embedding: List[float], user_id: str,
+                                match_threshold: float = 0.7, match_count: int = 5) -> List[Dict[str, Any]]:
+        """Run the pgvector similarity search RPC for a user's embeddings"""
+        client = await self.client()
+        result = await client.rpc(
+            'search_embeddings',
+            {
+                'query_embedding': query_embedding,
+                'user_id': user_id,
+                'match_threshold': match_threshold,
+                'match_count': match_count
+            }
+        ).execute()
+        return result.data if result.data else []
+
+    async def search_document_embeddings(self, query_embedding: List[float], document_id: str, match_count: int = 5,
+                                         exclude_source_task_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Run the per-document similarity search RPC, optionally skipping one source task's passages"""
+        client = await self.client()
+        result = await client.rpc(
+            'search_document_embeddings',
+            {
+                'query_embedding': query_embedding,
+                'doc_id': document_id,
+                'match_count': match_count,
+                'exclude_source_task_id': exclude_source_task_id
+            }
+        ).execute()
+        return result.data if result.data else []
+
+    # Story chapters
+
+    async def append_story_chapter(self, chapter_id: str, document_id: str, title: Optional[str], content: str,
+                                   content_hash: str, context_task_id: str) -> Dict[str, Any]:
+        """Store a chapter after the document's last one, unless one with the same content hash exists.
+
+        Returns the new or existing chapter's id, sequence_number, hashes and
+        context_task_id, plus ``created`` telling which it was.
+        """
+        client = await self.client()
+        result = await client.rpc(
+            'append_story_chapter',
+            {
+                'chapter_id': chapter_id,
+                'doc_id': document_id,
+                'chapter_title': title,
+                'chapter_content': content,
+                'chapter_content_hash': content_hash,
+                'chapter_context_task_id': context_task_id
+            }
+        ).execute()
+        return result.data[0]
+
+    async def get_story_chapter_by_hash(self, document_id: str, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Find a document's chapter by content hash (content excluded)"""
+        table = await self.table("story_chapter")
+        result = await table.select("id, sequence_number, content_hash, previous_state_hash, state_hash, context_task_id").eq("document_id", document_id).eq("content_hash", content_hash).order("sequence_number").limit(1).execute()
+        return result.data[0] if result.data else None
+
+    async def get_story_chapter(self, chapter_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch a chapter, including its full content, by id"""
+        table = await self.table("story_chapter")
+        result = await table.select("*").eq("id", chapter_id).execute()
+        return result.data[0] if result.data else None
+
+    async def page_story_chapters(self, document_id: str, columns: str = "id, sequence_number, title, content_length, content_preview, created_at",
+                                  limit: int = 50, after_sequence: int = 0) -> List[Dict[str, Any]]:
+        """Fetch a document's chapters in order, starting after a sequence number (content excluded by default)"""
+        table = await self.table("story_chapter")
+        result = await table.select(columns).eq("document_id", document_id).gt("sequence_number", after_sequence).order("sequence_number").limit(limit).execute()
+        return result.data
+
+    # Story element aggregates
+
+    async def get_story_element_summary(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch the materialized story element aggregate for a document"""
+        table = await self.table("story_element_summary")
+        result = await table.select("*").eq("document_id", document_id).execute()
+        return result.data[0] if result.data else None
+
+    async def merge_story_element_summary(self, document_id: str, characters: Dict[str, str], locations: Dict[str, str],
+                                          timeline_events: int, plot_threads: int, world_rules: int, relationships: int):
+        """Atomically fold one extraction into a document's story element aggregate"""
+        client = await self.client()
+        await client.rpc(
+            'merge_story_element_summary',
+            {
+                'doc_id': document_id,
+                'new_characters': characters,
+                'new_locations': locations,
+                'new_timeline_events': timeline_events,
+                'new_plot_threads': plot_threads,
+                'new_world_rules': world_rules,
+                'new_relationships': relationships
+            }
+        ).execute()
+
+    async def upsert_story_element_summary(self, summary: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Write a complete story element aggregate row"""
+        table = await self.table("story_element_summary")
+        result = await table.upsert(summary).execute()
+        return result.data
+
+    # Agent tasks
+
+    async def insert_agent_task(self, task: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Insert an agent task row"""
+        table = await self.table("agent_task")
+        result = await table.insert(task).execute()
+        return result.data
+
+    async def upsert_agent_task(self, task: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Insert or replace an agent task row by id"""
+        table = await self.table("agent_task")
+        result = await table.upsert(task).execute()
+        return result.data
+
+    async def get_agent_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch an agent task by id"""
+        table = await self.table("agent_task")
+        result = await table.select("*").eq("id", task_id).execute()
+        return result.data[0] if result.data else None
+
+    async def update_agent_task(self, task_id: str, fields: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Update columns of an agent task and return the updated rows"""
+        table = await self.table("agent_task")
+        result = await table.update(fields).eq("id", task_id).execute()
+        return result.data
+
+    async def claim_agent_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Move a pending agent task to in_progress; returns the row only if this call claimed it"""
+        table = await self.table("agent_task")
+        result = await table.update({
+            "status": "in_progress",
+            "updated_at": datetime.utcnow().isoformat()
+        }).eq("id", task_id).eq("status", "pending").execute()
+        return result.data[0] if result.data else None
+
+    async def touch_agent_task(self, task_id: str) -> bool:
+        """Refresh updated_at on an in_progress task (its lease); returns False if it is no longer in progress"""
+        table = await self.table("agent_task")
+        result = await table.update({
+            "updated_at": datetime.utcnow().isoformat()
+        }).eq("id", task_id).eq("status", "in_progress").execute()
+        return bool(result.data)
+
+    async def release_stale_agent_tasks(self, task_types: List[str], stale_before: str) -> List[Dict[str, Any]]:
+        """Move in_progress tasks not touched since ``stale_before`` back to pending; returns the rows released"""
+        if not task_types:
+            return []
+        table = await self.table("agent_task")
+        result = await table.update({
+            "status": "pending",
+            "updated_at": datetime.utcnow().isoformat()
+        }).eq("status", "in_progress").in_("task_type", task_types).lt("updated_at", stale_before).execute()
+        return result.data
+
+    async def list_agent_tasks_by_status(self, status: str, task_types: List[str]) -> List[Dict[str, Any]]:
+        """Fetch agent tasks of the given types in one status across all documents, oldest first"""
+        if not task_types:
+            return []
+        table = await self.table("agent_task")
+        result = await table.select("*").eq("status", status).in_("task_type", task_types).order("created_at").execute()
+        return result.data
+
+    async def page_agent_tasks(self, document_id: str, columns: str = "*", task_type: Optional[str] = None,
+                               limit: int = 50, cursor: Optional[str] = None,
+                               descending: bool = True) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Fetch one page of a document's agent tasks ordered by (created_at, id).
+
+        ``columns`` is a PostgREST select list and must include created_at and
+        id. Returns the rows and the cursor for the next page, or None on the
+        last page.
+        """
+        table = await self.table("agent_task")
+        query = table.select(columns).eq("document_id", document_id)
+
+        if task_type:
+            query = query.eq("task_type", task_type)
+
+        if cursor:
+            created_at, row_id = decode_cursor(cursor)
+            op = "lt" if descending else "gt"
+            query = query.or_(f'created_at.{op}."{created_at}",and(created_at.eq."{created_at}",id.{op}."{row_id}")')
+
+        # One extra row tells us whether another page follows
+        result = await query.order("created_at", desc=descending).order("id", desc=descending).limit(limit + 1).execute()
+        rows = result.data
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, encode_cursor(rows[-1])
+        return rows, None
+
+    async def list_agent_tasks(self, document_id: str, task_type: Optional[str] = None,
+                               order: Optional[str] = None, descending: bool = False,
+                               limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Fetch agent tasks for a document, optionally filtered by type and ordered by a column"""
+        table = await self.table("agent_task")
+        query = table.select("*").eq("document_id", document_id)
+
+        if task_type:
+            query = query.eq("task_type", task_type)
+
+        if order:
+            query = query.order(order, desc=descending)
+
+        if limit:
+            query = query.limit(limit)
+
+        result = await query.execute()
+        return result.data
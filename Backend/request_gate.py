@@ -0,0 +1,104 @@
+import asyncio
+import itertools
+import os
+from typing import Awaitable, Dict, Optional, Tuple, TypeVar
+
+# Optional server-side debounce for /auto_suggest; 0 disables it
+AUTO_SUGGEST_DEBOUNCE_MS = int(os.getenv("AUTO_SUGGEST_DEBOUNCE_MS", "0"))
+
+T = TypeVar("T")
+
+
+class SupersededError(Exception):
+    """Raised when a newer request for the same key replaced this one"""
+
+
+class Claim:
+    """One request's hold on a key; only the most recent claim for a key is current"""
+
+    def __init__(self, gate: "SupersedeGate", key: str, token: int):
+        self.gate = gate
+        self.key = key
+        self.token = token
+
+    @property
+    def current(self) -> bool:
+        return self.gate.is_current(self.key, self.token)
+
+    def check(self):
+        """Raise SupersededError if a newer claim has replaced this one"""
+        if not self.current:
+            raise SupersededError("Superseded by a newer request")
+
+    async def debounce(self):
+        """Wait out the debounce window and give up if a newer request arrived meanwhile"""
+        if self.gate.debounce_seconds > 0:
+            await asyncio.sleep(self.gate.debounce_seconds)
+        self.check()
+
+    async def run(self, awaitable: Awaitable[T]) -> T:
+        """Await work that a newer claim for the same key will cancel"""
+        if not self.current:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise SupersededError("Superseded by a newer request")
+
+        task = asyncio.ensure_future(awaitable)
+        self.gate._tasks[self.key] = (self.token, task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # Cancelled by a newer claim rather than by our own caller
+            if task.cancelled() and not self.current:
+                raise SupersededError("Superseded by a newer request")
+            raise
+        finally:
+            if self.gate._tasks.get(self.key, (None, None))[1] is task:
+                del self.gate._tasks[self.key]
+
+    def release(self):
+        """Forget this claim if it is still the current one"""
+        self.gate._release(self.key, self.token)
+
+    def __enter__(self) -> "Claim":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class SupersedeGate:
+    """Latest-wins coordination of concurrent requests that share a key (e.g. a session).
+
+    Claiming a key cancels the previous claim's in-flight ``Claim.run`` work and
+    makes it non-current, so a stale request stops at its next step: it skips
+    generation once retrieval is superseded, and a stream stops reading.
+    Gemini calls use the SDK's async API, so cancelling one cancels the
+    request and releases its LLM concurrency slot immediately.
+
+    Claims are tracked per process. With several workers behind a load
+    balancer, requests for one session only supersede each other when they
+    reach the same worker (use session affinity to get that).
+    """
+
+    def __init__(self, debounce_seconds: float = 0):
+        self.debounce_seconds = debounce_seconds
+        self._tokens = itertools.count(1)
+        self._current: Dict[str, int] = {}
+        self._tasks: Dict[str, Tuple[int, asyncio.Task]] = {}
+
+    def claim(self, key: str) -> Claim:
+        token = next(self._tokens)
+        self._current[key] = token
+
+        running: Optional[Tuple[int, asyncio.Task]] = self._tasks.pop(key, None)
+        if running is not None and not running[1].done():
+            running[1].cancel()
+        return Claim(self, key, token)
+
+    def is_current(self, key: str, token: int) -> bool:
+        return self._current.get(key) == token
+
+    def _release(self, key: str, token: int):
+        if self._current.get(key) == token:
+            del self._current[key]
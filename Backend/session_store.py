@@ -0,0 +1,68 @@
+import json
+import os
+from typing import Any, Dict, Optional
+
+from cachetools import TTLCache
+
+# Sessions expire after this long without use; every read slides the expiry
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(8 * 3600)))
+# Most sessions held by the in-process backend
+SESSION_STORE_MAX_SIZE = int(os.getenv("SESSION_STORE_MAX_SIZE", "100000"))
+# "redis" shares sessions across workers and hosts; "memory" keeps them per process
+SESSION_STORE = os.getenv("SESSION_STORE", "redis" if os.getenv("REDIS_URL") else "memory")
+
+
+class MemorySessionStore:
+    """Per-process session store with sliding TTL eviction"""
+
+    def __init__(self, ttl_seconds: int = SESSION_TTL_SECONDS, max_size: int = SESSION_STORE_MAX_SIZE):
+        self.sessions = TTLCache(maxsize=max_size, ttl=ttl_seconds)
+
+    async def create(self, session: Dict[str, Any]):
+        self.sessions[session["id"]] = session
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        session = self.sessions.get(session_id)
+        if session is not None:
+            # Re-inserting restarts the entry's TTL
+            self.sessions[session_id] = session
+        return session
+
+    async def delete(self, session_id: str):
+        self.sessions.pop(session_id, None)
+
+
+class RedisSessionStore:
+    """Session store shared by every worker through Redis, with sliding expiry"""
+
+    def __init__(self, redis_url: str, ttl_seconds: int = SESSION_TTL_SECONDS):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(redis_url)
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def key(session_id: str) -> str:
+        return f"session:{session_id}"
+
+    async def create(self, session: Dict[str, Any]):
+        await self.redis.set(self.key(session["id"]), json.dumps(session, default=str), ex=self.ttl_seconds)
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        # GETEX reads and refreshes the expiry in one round trip
+        value = await self.redis.getex(self.key(session_id), ex=self.ttl_seconds)
+        return json.loads(value) if value is not None else None
+
+    async def delete(self, session_id: str):
+        await self.redis.delete(self.key(session_id))
+
+
+def create_session_store(backend: str = SESSION_STORE):
+    """Build the configured session backend"""
+    if backend == "redis":
+        redis_url = os.getenv("REDIS_URL")
+        if not redis_url:
+            raise ValueError("SESSION_STORE=redis requires REDIS_URL")
+        return RedisSessionStore(redis_url)
+    if backend == "memory":
+        return MemorySessionStore()
+    raise ValueError(f"Unknown SESSION_STORE '{backend}'")
@@ -0,0 +1,234 @@
+import json
+import re
+import unicodedata
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from agent_schemas import ChapterMemoryUpdate
+from model_registry import get_model
+from structured_output import StructuredOutputError, generate_structured
+
+# Chapter summaries kept verbatim in continuity prompts; older chapters are
+# folded into the story bible's arc summary.
+RECENT_CHAPTER_SUMMARIES = 5
+
+
+def empty_bible() -> Dict[str, Any]:
+    """Story bible for a document with no chapters yet"""
+    return {
+        "arc_summary": "",
+        "characters": [],
+        "locations": [],
+        "world_rules": [],
+        "plot_threads": []
+    }
+
+
+def normalize_entity_name(name: str) -> str:
+    """Normalize a character or location name for deduplication ("The  Lighthouse!" -> "lighthouse")"""
+    name = unicodedata.normalize("NFKC", name or "").casefold()
+    name = re.sub(r"[^\w\s'-]", " ", name)
+    name = " ".join(name.split())
+    if name.startswith("the "):
+        name = name[4:]
+    return name
+
+
+def element_aggregate(elements: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce one story element extraction to the fields tracked in story_element_summary"""
+    def names(items) -> Dict[str, str]:
+        found: Dict[str, str] = {}
+        for item in items or []:
+            name = (item.get("name") or "").strip() if isinstance(item, dict) else ""
+            key = normalize_entity_name(name)
+            if key:
+                found.setdefault(key, name)
+        return found
+
+    return {
+        "characters": names(elements.get("characters")),
+        "locations": names(elements.get("locations")),
+        "timeline_events": len(elements.get("timeline_events") or []),
+        "plot_threads": len(elements.get("plot_threads") or []),
+        "world_rules_count": len(elements.get("world_rules") or []),
+        "relationships_count": len(elements.get("relationships") or [])
+    }
+
+
+class StoryMemory:
+    """Hierarchical, incrementally updated memory of a story.
+
+    Each chapter gets a short summary, and a rolling "story bible" (arc summary,
+    characters, locations, world rules, plot threads) is updated as chapters are
+    added. Continuity checks send this compact state instead of every previous
+    chapter, so prompt size stays bounded as a manuscript grows.
+
+    Both live in agent_task: one "chapter_summary" row per chapter and a single
+    "story_bible" row per document with a deterministic id.
+    """
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    @staticmethod
+    def bible_task_id(document_id: str) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"story_bible:{document_id}"))
+
+    @staticmethod
+    def summary_task_id(chapter_id: str) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"chapter_summary:{chapter_id}"))
+
+    async def load(self, document_id: str) -> Dict[str, Any]:
+        """Load the story bible and the most recent chapter summaries"""
+        bible_task = await self.repository.get_agent_task(self.bible_task_id(document_id))
+        bible_result = (bible_task or {}).get("result") or {}
+
+        summary_tasks = await self.repository.list_agent_tasks(
+            document_id, task_type="chapter_summary", order="created_at", descending=True, limit=RECENT_CHAPTER_SUMMARIES
+        )
+        recent_summaries = [
+            {
+                "chapter_title": task["result"].get("chapter_title"),
+                "summary": task["result"].get("summary", "")
+            }
+            for task in reversed(summary_tasks) if task.get("result")
+        ]
+
+        return {
+            "bible": bible_result.get("bible") or empty_bible(),
+            "chapters_covered": bible_result.get("chapters_covered", 0),
+            "recent_summaries": recent_summaries
+        }
+
+    async def add_chapter(self, document_id: str, chapter_title: Optional[str], content: str,
+                          source_task_id: Optional[str] = None, chapter_id: Optional[str] = None) -> Dict[str, Any]:
+        """Summarize a new chapter and fold it into the story bible with one LLM call.
+
+        With a ``chapter_id`` the chapter is folded in once: a retry returns the
+        current memory, or only redoes a summary that fell back. ``complete`` is
+        False when the model output was unusable and the previous bible was kept.
+        """
+        summary_id = self.summary_task_id(chapter_id) if chapter_id else str(uuid.uuid4())
+        existing = await self.repository.get_agent_task(summary_id) if chapter_id else None
+        memory = await self.load(document_id)
+        if existing and existing["status"] == "completed":
+            return dict(memory, complete=True)
+
+        update = await self._summarize_and_update(memory, chapter_title, content)
+        complete = update is not None
+        if update is None:
+            # Keep the previous bible and fall back to the chapter opening as its summary
+            update = {"chapter_summary": content[:500], "bible": memory["bible"]}
+        now = datetime.utcnow().isoformat()
+
+        await self.repository.upsert_agent_task({
+            "id": summary_id,
+            "document_id": document_id,
+            "task_type": "chapter_summary",
+            "status": "completed" if complete else "failed",
+            "result": {
+                "chapter_title": chapter_title,
+                "summary": update["chapter_summary"],
+                "source_task_id": source_task_id,
+                "chapter_id": chapter_id,
+                "length": len(content),
+                "timestamp": now
+            },
+            # Keep the chapter's place in the summary order when a fallback is redone
+            "created_at": existing["created_at"] if existing else now,
+            "updated_at": now
+        })
+
+        chapters_covered = memory["chapters_covered"] + (0 if existing else 1)
+        await self.repository.upsert_agent_task({
+            "id": self.bible_task_id(document_id),
+            "document_id": document_id,
+            "task_type": "story_bible",
+            "status": "completed",
+            "result": {
+                "bible": update["bible"],
+                "chapters_covered": chapters_covered,
+                "timestamp": now
+            },
+            "created_at": now,
+            "updated_at": now
+        })
+
+        return {
+            "bible": update["bible"],
+            "chapters_covered": chapters_covered,
+            "recent_summaries": (memory["recent_summaries"] + [
+                {"chapter_title": chapter_title, "summary": update["chapter_summary"]}
+            ])[-RECENT_CHAPTER_SUMMARIES:],
+            "complete": complete
+        }
+
+    async def _summarize_and_update(self, memory: Dict[str, Any], chapter_title: Optional[str], content: str) -> Optional[Dict[str, Any]]:
+        """Chapter summary and updated bible from one LLM call; None if the output is unusable"""
+        prompt = f"""You maintain the story bible for a novel in progress.
+
+CURRENT STORY BIBLE (JSON):
+{json.dumps(memory["bible"], ensure_ascii=False)}
+
+RECENT CHAPTER SUMMARIES:
+{self._format_summaries(memory["recent_summaries"]) or "None yet."}
+
+NEW CHAPTER ({chapter_title or "Untitled"}):
+{content}
+
+Update the story bible with everything the new chapter establishes or changes, and summarize the new chapter.
+Keep every entry to one sentence, merge duplicates, and keep "arc_summary" under 200 words by folding older events into it.
+
+Respond with JSON only, in this format:
+{{
+    "chapter_summary": "3-5 sentence summary of the new chapter",
+    "bible": {{
+        "arc_summary": "The story so far",
+        "characters": [{{"name": "name", "description": "age, appearance, traits, role, current state"}}],
+        "locations": [{{"name": "name", "description": "key established facts"}}],
+        "world_rules": [{{"rule": "rule", "description": "how it works"}}],
+        "plot_threads": [{{"thread": "thread", "status": "introduced/ongoing/resolved", "details": "context"}}]
+    }}
+}}"""
+
+        try:
+            update = await generate_structured(get_model("memory"), prompt, ChapterMemoryUpdate)
+            return {
+                "chapter_summary": update.chapter_summary,
+                "bible": update.bible.model_dump()
+            }
+        except StructuredOutputError:
+            return None
+
+    @staticmethod
+    def _format_summaries(summaries: List[Dict[str, Any]]) -> str:
+        return "\n".join(
+            f"=== {summary.get('chapter_title') or 'Chapter'} ===\n{summary.get('summary', '')}"
+            for summary in summaries
+        )
+
+    @classmethod
+    def format_context(cls, memory: Dict[str, Any], relevant_passages: Optional[List[str]] = None) -> str:
+        """Render memory (and any retrieved passages) as the compact context for a continuity prompt"""
+        bible = memory["bible"]
+        sections = [f"STORY SO FAR:\n{bible.get('arc_summary') or 'No earlier chapters.'}"]
+
+        def entries(title: str, items: List[Dict[str, Any]], name_key: str, detail_key: str):
+            if items:
+                lines = "\n".join(f"- {item.get(name_key, '')}: {item.get(detail_key, '')}" for item in items)
+                sections.append(f"{title}:\n{lines}")
+
+        entries("CHARACTERS", bible.get("characters", []), "name", "description")
+        entries("LOCATIONS", bible.get("locations", []), "name", "description")
+        entries("WORLD RULES", bible.get("world_rules", []), "rule", "description")
+        entries("PLOT THREADS", bible.get("plot_threads", []), "thread", "details")
+
+        if memory["recent_summaries"]:
+            sections.append(f"RECENT CHAPTERS:\n{cls._format_summaries(memory['recent_summaries'])}")
+
+        if relevant_passages:
+            passages = "\n\n".join(f"--- {passage}" for passage in relevant_passages)
+            sections.append(f"RELEVANT EARLIER PASSAGES:\n{passages}")
+
+        return "\n\n".join(sections)
@@ -0,0 +1,69 @@
+import json
+from typing import Optional, Type, TypeVar
+
+import google.generativeai as genai
+from pydantic import BaseModel, ValidationError
+
+from llm_client import generate_content
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class StructuredOutputError(Exception):
+    """Raised when a response still fails validation after the repair retry"""
+
+    def __init__(self, message: str, raw_text: str):
+        super().__init__(message)
+        self.raw_text = raw_text
+
+
+def parse_structured(text: str, schema: Type[T]) -> T:
+    """Parse and validate a JSON response, tolerating code fences or prose around the object"""
+    text = text.strip()
+    try:
+        return schema.model_validate_json(text)
+    except ValidationError as e:
+        # Only retry the tolerant path when the text wasn't valid JSON at all
+        if not any(error["type"] == "json_invalid" for error in e.errors()):
+            raise
+
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("Response contains no JSON object")
+    return schema.model_validate(json.loads(text[start:end + 1]))
+
+
+async def generate_structured(model: genai.GenerativeModel, prompt: str, schema: Type[T],
+                              timeout: Optional[float] = None) -> T:
+    """Generate output from a JSON-mode model and validate it against a Pydantic model.
+
+    If the response does not validate, one short repair call is made with just
+    the invalid JSON and the errors (not the original prompt). Raises
+    StructuredOutputError if that also fails.
+    """
+    response = await generate_content(model, prompt, timeout=timeout)
+    text = response.text
+
+    try:
+        return parse_structured(text, schema)
+    except ValueError as e:  # includes JSON decode and validation errors
+        error = e
+
+    repair_prompt = f"""The JSON below does not match the required schema.
+
+ERRORS:
+{error}
+
+JSON SCHEMA:
+{json.dumps(schema.model_json_schema())}
+
+INVALID JSON:
+{text}
+
+Return only the corrected JSON object. Keep all content that fits the schema and do not add new information."""
+
+    repaired = await generate_content(model, repair_prompt, timeout=timeout)
+    try:
+        return parse_structured(repaired.text, schema)
+    except ValueError as e:
+        raise StructuredOutputError(f"Structured output failed validation after repair: {e}", repaired.text or text)
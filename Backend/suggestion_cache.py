@@ -0,0 +1,98 @@
+import os
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from cachetools import TTLCache
+
+SUGGESTION_CACHE_TTL_SECONDS = int(os.getenv("SUGGESTION_CACHE_TTL_SECONDS", "600"))
+SUGGESTION_CACHE_MAX_SESSIONS = int(os.getenv("SUGGESTION_CACHE_MAX_SESSIONS", "10000"))
+# Recent requests remembered per session (the editor sends one per paragraph)
+SUGGESTION_CACHE_ENTRIES_PER_SESSION = 8
+# Retrieval context is reused while the text has grown by at most this many characters
+SUGGESTION_CONTEXT_REUSE_CHARS = int(os.getenv("SUGGESTION_CONTEXT_REUSE_CHARS", "400"))
+
+
+class SuggestionCache:
+    """Per-session cache of recent auto-suggestion results, matched by text prefix.
+
+    When new text extends a cached request's text, the characters typed since
+    then are compared with the cached suggestions: if the user is typing one of
+    them, the rest of it is returned without any model call. Otherwise the
+    cached retrieval context can be reused so only the Gemini call is repeated.
+    """
+
+    def __init__(self, ttl_seconds: int = SUGGESTION_CACHE_TTL_SECONDS, max_sessions: int = SUGGESTION_CACHE_MAX_SESSIONS):
+        self.sessions = TTLCache(maxsize=max_sessions, ttl=ttl_seconds)
+        self.completion_hits = 0
+        self.context_hits = 0
+        self.misses = 0
+
+    def lookup(self, session_id: str, text: str) -> Optional[Tuple[Dict[str, Any], str]]:
+        """Find the cached request whose text is the longest prefix of ``text``; returns (entry, typed_since)"""
+        best = None
+        for entry in self.sessions.get(session_id, ()):
+            if text.startswith(entry["text"]) and (best is None or len(entry["text"]) > len(best["text"])):
+                best = entry
+        if best is None:
+            return None
+        return best, text[len(best["text"]):]
+
+    @staticmethod
+    def completions(entry: Dict[str, Any], typed: str) -> List[str]:
+        """Remainders of the cached suggestions that start with what was typed since.
+
+        Only whole words count: the editor inserts a suggestion after a space, so a
+        remainder that begins mid-word ("the" + "re was...") is never offered.
+        """
+        typed = typed.lstrip()
+        if not typed:
+            return []
+        remainders = []
+        for suggestion in entry["suggestions"]:
+            if not suggestion.startswith(typed):
+                continue
+            rest = suggestion[len(typed):]
+            if rest.strip() and (typed[-1].isspace() or rest[0].isspace()):
+                remainders.append(rest.strip())
+        return remainders
+
+    def get(self, session_id: str, text: str, cursor_position: Optional[int] = None) -> Optional[Tuple[Dict[str, Any], List[str]]]:
+        """Cached request to reuse for ``text``, with any completions of its suggestions.
+
+        Returns (entry, completions) when the user is typing one of the cached
+        suggestions, (entry, []) when only the retrieval context can be reused,
+        and None on a miss; each outcome is counted for stats(). Only requests
+        with the cursor at the end of the text are matched.
+        """
+        at_end = cursor_position is None or cursor_position >= len(text)
+        cached = self.lookup(session_id, text) if at_end else None
+        if cached is not None:
+            entry, typed = cached
+            completions = self.completions(entry, typed)
+            if completions:
+                self.completion_hits += 1
+                return entry, completions
+            # Small edits don't change what retrieval would return
+            if len(typed) <= SUGGESTION_CONTEXT_REUSE_CHARS:
+                self.context_hits += 1
+                return entry, []
+        self.misses += 1
+        return None
+
+    def store(self, session_id: str, text: str, context_text: str, suggestions: List[str]):
+        """Remember a request's text, retrieval context and suggestions"""
+        entries = deque(
+            (entry for entry in self.sessions.get(session_id, ()) if entry["text"] != text),
+            maxlen=SUGGESTION_CACHE_ENTRIES_PER_SESSION
+        )
+        entries.append({"text": text, "context_text": context_text, "suggestions": suggestions})
+        # Re-inserting also refreshes the session's TTL
+        self.sessions[session_id] = entries
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self.sessions),
+            "completion_hits": self.completion_hits,
+            "context_hits": self.context_hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,43 @@
+from typing import List, Optional, Tuple
+
+
+def parse_suggestion_line(line: str) -> Optional[str]:
+    """Return the suggestion from a numbered line such as '1. ...', or None"""
+    line = line.strip()
+    # Look for numbered suggestions
+    if line and (line.startswith('1.') or line.startswith('2.') or line.startswith('3.')):
+        # Remove the number prefix
+        suggestion = line[2:].strip()
+        if suggestion:
+            return suggestion
+    return None
+
+
+class SuggestionStreamParser:
+    """Incrementally parse numbered suggestions from a streamed Gemini response"""
+
+    def __init__(self, max_suggestions: int = 3):
+        self.max_suggestions = max_suggestions
+        self.text = ""
+        self.suggestions: List[str] = []
+        self._pending_line = ""
+
+    def feed(self, chunk: str) -> List[Tuple[int, str]]:
+        """Add a streamed chunk and return (index, suggestion) for each line it completes"""
+        self.text += chunk
+        *lines, self._pending_line = (self._pending_line + chunk).split('\n')
+        return self._collect(lines)
+
+    def close(self) -> List[Tuple[int, str]]:
+        """Flush the final, unterminated line once the stream has ended"""
+        lines, self._pending_line = [self._pending_line], ""
+        return self._collect(lines)
+
+    def _collect(self, lines: List[str]) -> List[Tuple[int, str]]:
+        found = []
+        for line in lines:
+            suggestion = parse_suggestion_line(line)
+            if suggestion and len(self.suggestions) < self.max_suggestions:
+                found.append((len(self.suggestions), suggestion))
+                self.suggestions.append(suggestion)
+        return found
@@ -29,8 +29,10 @@ CREATE INDEX IF NOT EXISTS "document_type_idx" ON "document" ("type");
 CREATE INDEX IF NOT EXISTS "user_email_idx" ON "user" ("email");
 CREATE INDEX IF NOT EXISTS "embedding_document_id_idx" ON "embedding" ("document_id");
 CREATE INDEX IF NOT EXISTS "embedding_section_id_idx" ON "embedding" ("section_id");
+-- embedding_created_by_idx and embedding_vector_hnsw_idx: see migrations/001_embedding_ann_search.sql
+-- agent_task pagination indexes: see migrations/004_agent_task_pagination.sql (its content_preview column is dropped again by 008)
 
--- Enable pgvector extension for vector operations
+-- Enable pgvector extension for vector operations (0.8.0 or later for search_embeddings)
 CREATE EXTENSION IF NOT EXISTS vector;
 
 -- RLS (Row Level Security) policies
@@ -106,7 +108,13 @@ CREATE TRIGGER update_document_updated_at BEFORE UPDATE ON "document"
 
 -- Note: Trigger for embedding table would be added here if the table was created by this script
 
--- Vector similarity search function
+-- Embedding owner column, owner trigger and HNSW vector index live in
+-- migrations/001_embedding_ann_search.sql; run the migrations in order after
+-- this script (007 replaces the search_embeddings defined by 001).
+
+-- Vector similarity search for one owner. Owners with few rows are searched
+-- exactly; larger owners use the HNSW index with iterative scans so the owner
+-- filter can't cut the result short. Requires pgvector 0.8.0 or later.
 CREATE OR REPLACE FUNCTION search_embeddings(
     query_embedding vector,
     user_id text,
@@ -122,19 +130,253 @@ RETURNS TABLE (
 )
 LANGUAGE plpgsql
 AS $$
+DECLARE
+    -- Owners with at most this many rows are compared row by row
+    exact_search_max_rows CONSTANT int := 10000;
+    owner_row_count int;
 BEGIN
+    -- Bounded count: stops reading the created_by index once the owner is known to be large
+    SELECT count(*) INTO owner_row_count
+    FROM (
+        SELECT 1 FROM embedding e
+        WHERE e.created_by = search_embeddings.user_id
+        LIMIT exact_search_max_rows + 1
+    ) owned;
+
+    IF owner_row_count <= exact_search_max_rows THEN
+        -- Exact search: materializing keeps the planner off the global HNSW
+        -- index, whose candidate list may hold none of this owner's rows
+        RETURN QUERY
+        WITH owner_rows AS MATERIALIZED (
+            SELECT e.id, e.document_id, e.section_id, e.metadata, e.vector
+            FROM embedding e
+            WHERE e.created_by = search_embeddings.user_id
+        )
+        SELECT
+            nearest.id,
+            nearest.document_id,
+            nearest.section_id,
+            nearest.metadata,
+            1 - nearest.distance as similarity
+        FROM (
+            SELECT
+                r.id,
+                r.document_id,
+                r.section_id,
+                r.metadata,
+                r.vector <=> query_embedding as distance
+            FROM owner_rows r
+            ORDER BY distance
+            LIMIT match_count
+        ) nearest
+        WHERE nearest.distance < 1 - match_threshold
+        ORDER BY nearest.distance;
+        RETURN;
+    END IF;
+
+    -- Iterative scans keep walking the HNSW graph until match_count rows pass
+    -- the owner filter (bounded by hnsw.max_scan_tuples); relaxed order is
+    -- re-sorted by the outer query
+    PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    PERFORM set_config('hnsw.ef_search', greatest(40, match_count * 4)::text, true);
+
     RETURN QUERY
-    SELECT 
-        e.id,
-        e.document_id,
-        e.section_id,
-        e.metadata,
-        1 - (e.vector <=> query_embedding) as similarity
-    FROM embedding e
-    INNER JOIN document d ON e.document_id = d.id
-    WHERE d.created_by = user_id
-    AND 1 - (e.vector <=> query_embedding) > match_threshold
-    ORDER BY e.vector <=> query_embedding
+    SELECT
+        nearest.id,
+        nearest.document_id,
+        nearest.section_id,
+        nearest.metadata,
+        1 - nearest.distance as similarity
+    FROM (
+        SELECT
+            e.id,
+            e.document_id,
+            e.section_id,
+            e.metadata,
+            e.vector <=> query_embedding as distance
+        FROM embedding e
+        WHERE e.created_by = search_embeddings.user_id
+        ORDER BY distance
+        LIMIT match_count
+    ) nearest
+    WHERE nearest.distance < 1 - match_threshold
+    ORDER BY nearest.distance;
+END;
+$$;
+
+-- Per-document passage search used by the continuity agent
+CREATE OR REPLACE FUNCTION search_document_embeddings(
+    query_embedding vector,
+    doc_id text,
+    match_count int DEFAULT 5,
+    exclude_source_task_id text DEFAULT NULL
+)
+RETURNS TABLE (
+    id text,
+    document_id text,
+    section_id text,
+    metadata json,
+    similarity float
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Exact search over one document's rows: the document_id index narrows the
+    -- scan, and materializing keeps the planner off the global HNSW index,
+    -- which could drop matches when post-filtering by document
+    RETURN QUERY
+    WITH document_rows AS MATERIALIZED (
+        SELECT e.id, e.document_id, e.section_id, e.metadata, e.vector
+        FROM embedding e
+        WHERE e.document_id = doc_id
+        AND (exclude_source_task_id IS NULL OR e.metadata->>'source_task_id' IS DISTINCT FROM exclude_source_task_id)
+    )
+    SELECT
+        nearest.id,
+        nearest.document_id,
+        nearest.section_id,
+        nearest.metadata,
+        1 - nearest.distance as similarity
+    FROM (
+        SELECT
+            r.id,
+            r.document_id,
+            r.section_id,
+            r.metadata,
+            r.vector <=> query_embedding as distance
+        FROM document_rows r
+    ) nearest
+    ORDER BY nearest.distance
     LIMIT match_count;
 END;
-$$;
\ No newline at end of file
+$$;
+
+-- Per-document story element aggregate maintained by the continuity agent
+CREATE TABLE IF NOT EXISTS "story_element_summary" (
+    "document_id" TEXT PRIMARY KEY REFERENCES "document"("id") ON DELETE CASCADE,
+    "characters" JSONB NOT NULL DEFAULT '{}'::jsonb,
+    "locations" JSONB NOT NULL DEFAULT '{}'::jsonb,
+    "timeline_events" INTEGER NOT NULL DEFAULT 0,
+    "plot_threads" INTEGER NOT NULL DEFAULT 0,
+    "world_rules_count" INTEGER NOT NULL DEFAULT 0,
+    "relationships_count" INTEGER NOT NULL DEFAULT 0,
+    "analysis_tasks_completed" INTEGER NOT NULL DEFAULT 0,
+    "updated_at" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- Merge one extraction into the aggregate in a single statement, so
+-- concurrent extractions for the same document never lose updates
+CREATE OR REPLACE FUNCTION merge_story_element_summary(
+    doc_id text,
+    new_characters jsonb,
+    new_locations jsonb,
+    new_timeline_events int,
+    new_plot_threads int,
+    new_world_rules int,
+    new_relationships int
+)
+RETURNS void
+LANGUAGE sql
+AS $$
+    INSERT INTO story_element_summary AS s (
+        document_id, characters, locations, timeline_events, plot_threads,
+        world_rules_count, relationships_count, analysis_tasks_completed, updated_at
+    )
+    VALUES (
+        doc_id, new_characters, new_locations, new_timeline_events, new_plot_threads,
+        new_world_rules, new_relationships, 1, NOW()
+    )
+    ON CONFLICT (document_id) DO UPDATE SET
+        -- Existing keys win, so the first-seen display name is kept
+        characters = EXCLUDED.characters || s.characters,
+        locations = EXCLUDED.locations || s.locations,
+        timeline_events = s.timeline_events + EXCLUDED.timeline_events,
+        plot_threads = s.plot_threads + EXCLUDED.plot_threads,
+        world_rules_count = s.world_rules_count + EXCLUDED.world_rules_count,
+        relationships_count = s.relationships_count + EXCLUDED.relationships_count,
+        analysis_tasks_completed = s.analysis_tasks_completed + 1,
+        updated_at = NOW();
+$$;
+
+-- Story chapters added through the continuity agent, stored once per chapter
+CREATE TABLE IF NOT EXISTS "story_chapter" (
+    "id" TEXT PRIMARY KEY,
+    "document_id" TEXT NOT NULL REFERENCES "document"("id") ON DELETE CASCADE,
+    "sequence_number" INTEGER NOT NULL,
+    "title" TEXT,
+    "content" TEXT NOT NULL,
+    "content_length" INTEGER GENERATED ALWAYS AS (char_length("content")) STORED,
+    "content_preview" TEXT GENERATED ALWAYS AS (left("content", 200)) STORED,
+    "content_hash" TEXT,
+    "previous_state_hash" TEXT,
+    "state_hash" TEXT,
+    "context_task_id" TEXT,
+    "created_at" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    "updated_at" TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    -- Also the index for reading a document's chapters in order
+    UNIQUE ("document_id", "sequence_number")
+);
+
+CREATE INDEX IF NOT EXISTS story_chapter_document_content_hash_idx
+    ON "story_chapter" ("document_id", "content_hash");
+
+-- Append a chapter unless the document already has one with the same
+-- content; returns the new or existing chapter and whether it was created
+CREATE OR REPLACE FUNCTION append_story_chapter(
+    chapter_id text,
+    doc_id text,
+    chapter_title text,
+    chapter_content text,
+    chapter_content_hash text,
+    chapter_context_task_id text
+)
+RETURNS TABLE (
+    id text,
+    sequence_number integer,
+    content_hash text,
+    previous_state_hash text,
+    state_hash text,
+    context_task_id text,
+    created boolean
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    last_state text;
+    next_sequence integer;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('story_chapter:' || doc_id));
+
+    RETURN QUERY
+    SELECT c.id, c.sequence_number, c.content_hash, c.previous_state_hash, c.state_hash, c.context_task_id, false
+    FROM story_chapter c
+    WHERE c.document_id = doc_id AND c.content_hash = chapter_content_hash
+    ORDER BY c.sequence_number
+    LIMIT 1;
+    IF FOUND THEN
+        RETURN;
+    END IF;
+
+    SELECT c.state_hash, c.sequence_number INTO last_state, next_sequence
+    FROM story_chapter c
+    WHERE c.document_id = doc_id
+    ORDER BY c.sequence_number DESC
+    LIMIT 1;
+
+    last_state := COALESCE(last_state, '');
+    next_sequence := COALESCE(next_sequence, 0) + 1;
+
+    RETURN QUERY
+    INSERT INTO story_chapter AS c (
+        id, document_id, sequence_number, title, content,
+        content_hash, previous_state_hash, state_hash, context_task_id
+    )
+    VALUES (
+        chapter_id, doc_id, next_sequence, chapter_title, chapter_content,
+        chapter_content_hash, last_state,
+        encode(sha256(convert_to(last_state || ':' || chapter_content_hash, 'UTF8')), 'hex'),
+        chapter_context_task_id
+    )
+    RETURNING c.id, c.sequence_number, c.content_hash, c.previous_state_hash, c.state_hash, c.context_task_id, true;
+END;
+$$;
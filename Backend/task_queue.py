@@ -0,0 +1,192 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Background workers per process and the most jobs waiting in memory at once
+AGENT_QUEUE_WORKERS = int(os.getenv("AGENT_QUEUE_WORKERS", "2"))
+AGENT_QUEUE_MAX_SIZE = int(os.getenv("AGENT_QUEUE_MAX_SIZE", "100"))
+# How often waiters re-read a task that is running in another process
+AGENT_QUEUE_POLL_SECONDS = 1.0
+# A running job refreshes its row every third of this; a row not refreshed for this
+# long belonged to a process that died, and is put back in the queue
+AGENT_QUEUE_LEASE_SECONDS = float(os.getenv("AGENT_QUEUE_LEASE_SECONDS", "120"))
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class QueueFullError(Exception):
+    """Raised when a job is enqueued while the in-memory backlog is full"""
+
+
+class AgentTaskQueue:
+    """Background job queue for agent work, persisted in the agent_task table.
+
+    Enqueueing writes a "pending" row holding the job payload and returns its
+    id immediately. Workers claim a row by flipping it to "in_progress" with a
+    conditional update (so only one process runs it), call the handler
+    registered for its task type, and store the handler's result as
+    "completed" or the error as "failed".
+
+    A running job keeps a lease by refreshing its row's updated_at. At start
+    and then every lease period, the queue puts in_progress rows whose lease
+    ran out (their process died) back to pending, and queues any pending rows
+    it doesn't hold yet, such as those left over from a restart. Handlers must
+    therefore be safe to run again for the same job.
+    """
+
+    def __init__(self, repository, workers: int = AGENT_QUEUE_WORKERS, max_size: int = AGENT_QUEUE_MAX_SIZE):
+        self.repository = repository
+        self.workers = workers
+        self.max_size = max_size
+        self.handlers: Dict[str, Handler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._recovery: Optional[asyncio.Task] = None
+        self._done: Dict[str, asyncio.Event] = {}
+
+    def register(self, task_type: str, handler: Handler):
+        """Route jobs of a task type to an async handler that takes the payload and returns a result dict"""
+        self.handlers[task_type] = handler
+
+    async def start(self):
+        """Start the worker pool, requeue jobs left from a previous run and keep recovering stale ones"""
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        await self._recover()
+        self._recovery = asyncio.ensure_future(self._recover_periodically())
+
+    async def stop(self):
+        """Cancel the workers; interrupted jobs are recovered once their lease runs out"""
+        tasks = self._workers + ([self._recovery] if self._recovery else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._recovery = None
+        self._queue = None
+
+    async def _recover(self):
+        """Release jobs whose lease expired and queue pending jobs this process doesn't hold yet"""
+        task_types = list(self.handlers)
+        try:
+            stale_before = (datetime.utcnow() - timedelta(seconds=AGENT_QUEUE_LEASE_SECONDS)).isoformat()
+            released = await self.repository.release_stale_agent_tasks(task_types, stale_before)
+            if released:
+                print(f"Released {len(released)} agent tasks with expired leases")
+
+            requeued = 0
+            for task in await self.repository.list_agent_tasks_by_status("pending", task_types):
+                if self._queue.full():
+                    break
+                if task["id"] in self._done:
+                    continue
+                self._done[task["id"]] = asyncio.Event()
+                self._queue.put_nowait(task["id"])
+                requeued += 1
+            if requeued:
+                print(f"Requeued {requeued} pending agent tasks")
+        except Exception as e:
+            print(f"Error recovering agent tasks: {e}")
+
+    async def _recover_periodically(self):
+        while True:
+            await asyncio.sleep(AGENT_QUEUE_LEASE_SECONDS)
+            await self._recover()
+
+    async def _keep_lease(self, task_id: str):
+        """Refresh a running job's lease until cancelled"""
+        while True:
+            await asyncio.sleep(AGENT_QUEUE_LEASE_SECONDS / 3)
+            try:
+                await self.repository.touch_agent_task(task_id)
+            except Exception as e:
+                print(f"Error refreshing lease for agent task {task_id}: {e}")
+
+    async def enqueue(self, task_type: str, document_id: Optional[str], payload: Dict[str, Any]) -> str:
+        """Persist a pending job and hand it to the workers; returns the agent_task id"""
+        if task_type not in self.handlers:
+            raise ValueError(f"No handler registered for task type '{task_type}'")
+        if self._queue is None:
+            await self.start()
+        if self._queue.full():
+            raise QueueFullError("Agent task queue is full")
+
+        task_id = str(uuid.uuid4())
+        now = datetime.utcnow().isoformat()
+        await self.repository.insert_agent_task({
+            "id": task_id,
+            "document_id": document_id,
+            "task_type": task_type,
+            "status": "pending",
+            "result": {"payload": payload, "timestamp": now},
+            "created_at": now,
+            "updated_at": now
+        })
+
+        self._done[task_id] = asyncio.Event()
+        self._queue.put_nowait(task_id)
+        return task_id
+
+    async def wait(self, task_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait up to ``timeout`` seconds for a job to finish, then return its current row"""
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        event = self._done.get(task_id)
+
+        while True:
+            task = await self.repository.get_agent_task(task_id)
+            remaining = deadline - loop.time()
+            if task is None or task["status"] in ("completed", "failed") or remaining <= 0:
+                return task
+
+            if event is not None:
+                # Running in this process: wake up as soon as it finishes
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+                event = None
+            else:
+                await asyncio.sleep(min(AGENT_QUEUE_POLL_SECONDS, remaining))
+
+    async def _worker(self):
+        while True:
+            task_id = await self._queue.get()
+            try:
+                await self._run(task_id)
+            except Exception as e:
+                print(f"Error running agent task {task_id}: {e}")
+            finally:
+                event = self._done.pop(task_id, None)
+                if event is not None:
+                    event.set()
+                self._queue.task_done()
+
+    async def _run(self, task_id: str):
+        # Claim the job; another process may already have taken it
+        task = await self.repository.claim_agent_task(task_id)
+        if task is None:
+            return
+
+        payload = (task.get("result") or {}).get("payload") or {}
+        lease = asyncio.ensure_future(self._keep_lease(task_id))
+        try:
+            result = await self.handlers[task["task_type"]](payload)
+            status = "completed"
+        except Exception as e:
+            result = {"error": str(e)}
+            status = "failed"
+        finally:
+            lease.cancel()
+
+        now = datetime.utcnow().isoformat()
+        result["timestamp"] = now
+        await self.repository.update_agent_task(task_id, {
+            "status": status,
+            "result": result,
+            "updated_at": now
+        })
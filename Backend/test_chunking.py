@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the sentence-aware chunker (no server needed)
+Run with: python -m pytest test_chunking.py
+"""
+from chunking import CHARS_PER_TOKEN, batched, estimate_tokens, iter_chunks
+
+SENTENCES = [f"Sentence number {i} is here." for i in range(40)]
+TEXT = " ".join(SENTENCES)
+
+
+def test_estimate_tokens_rounds_up():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+
+def test_offsets_point_back_into_the_source():
+    chunks = list(iter_chunks(TEXT, max_tokens=30, overlap_tokens=10))
+    assert len(chunks) > 1
+    for i, chunk in enumerate(chunks):
+        assert chunk.index == i
+        assert TEXT[chunk.start:chunk.end] == chunk.text
+
+
+def test_chunks_respect_the_budget_and_end_on_sentences():
+    max_tokens = 30
+    for chunk in iter_chunks(TEXT, max_tokens=max_tokens, overlap_tokens=10):
+        assert len(chunk.text) <= max_tokens * CHARS_PER_TOKEN
+        assert chunk.text.endswith(".")
+
+
+def test_consecutive_chunks_overlap_by_whole_sentences():
+    chunks = list(iter_chunks(TEXT, max_tokens=30, overlap_tokens=10))
+    for previous, current in zip(chunks, chunks[1:]):
+        # The next chunk starts inside the previous one, at a sentence start
+        assert previous.start < current.start < previous.end
+        assert TEXT[current.start:].startswith("Sentence")
+        assert previous.end - current.start <= 10 * CHARS_PER_TOKEN
+
+
+def test_no_overlap_requested():
+    chunks = list(iter_chunks(TEXT, max_tokens=30, overlap_tokens=0))
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.start >= previous.end
+    # Every sentence lands in exactly one chunk
+    assert " ".join(chunk.text for chunk in chunks) == TEXT
+
+
+def test_no_overlap_across_paragraph_breaks():
+    first = " ".join(SENTENCES[:6])
+    second = " ".join(SENTENCES[6:12])
+    text = f"{first}\n\n{second}"
+    chunks = list(iter_chunks(text, max_tokens=60, overlap_tokens=20))
+    assert [chunk.text for chunk in chunks] == [first, second]
+
+
+def test_long_sentence_is_split_at_whitespace():
+    text = " ".join(["word"] * 100) + "."
+    chunks = list(iter_chunks(text, max_tokens=10, overlap_tokens=0))
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk.text) <= 10 * CHARS_PER_TOKEN
+        assert not chunk.text.startswith(" ") and "wor d" not in chunk.text
+
+
+def test_empty_and_whitespace_text():
+    assert list(iter_chunks("")) == []
+    assert list(iter_chunks("   \n\n  ")) == []
+
+
+def test_short_text_is_one_chunk():
+    chunks = list(iter_chunks("  Just one sentence.  "))
+    assert len(chunks) == 1
+    assert chunks[0].text == "Just one sentence."
+    assert (chunks[0].start, chunks[0].end) == (2, 20)
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(batched([], 3)) == []
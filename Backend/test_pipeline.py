@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the stage dependency runner (no server needed)
+Run with: python -m pytest test_pipeline.py
+"""
+import asyncio
+
+import pytest
+
+from pipeline import Stage, run_stages
+
+
+def value(result, delay: float = 0.0, log=None, name=None):
+    async def run(results):
+        if log is not None:
+            log.append(f"start {name}")
+        await asyncio.sleep(delay)
+        if log is not None:
+            log.append(f"end {name}")
+        return result
+    return run
+
+
+def test_results_and_dependencies():
+    async def total(results):
+        return results["a"] + results["b"]
+
+    results, durations = asyncio.run(run_stages([
+        Stage("a", value(1)),
+        Stage("b", value(2)),
+        Stage("sum", total, depends_on=("a", "b"))
+    ]))
+    assert results == {"a": 1, "b": 2, "sum": 3}
+    assert set(durations) == {"a", "b", "sum"}
+    assert all(duration >= 0 for duration in durations.values())
+
+
+def test_independent_stages_run_concurrently():
+    log = []
+    asyncio.run(run_stages([
+        Stage("slow", value(None, 0.05, log, "slow")),
+        Stage("fast", value(None, 0.0, log, "fast")),
+        Stage("after", value(None, 0.0, log, "after"), depends_on=("slow",))
+    ]))
+    # Both independent stages start before either finishes; the dependent one waits
+    assert log.index("start fast") < log.index("end slow")
+    assert log.index("start slow") < log.index("end fast")
+    assert log.index("start after") > log.index("end slow")
+
+
+def test_cycle_is_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        asyncio.run(run_stages([
+            Stage("a", value(1), depends_on=("b",)),
+            Stage("b", value(2), depends_on=("a",))
+        ]))
+
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError, match="unknown"):
+        asyncio.run(run_stages([Stage("a", value(1), depends_on=("missing",))]))
+
+
+def test_failure_propagates_and_cancels_running_stages():
+    cancelled = []
+
+    async def fail(results):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("stage failed")
+
+    async def slow(results):
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append("slow")
+            raise
+
+    ran_dependent = []
+
+    async def dependent(results):
+        ran_dependent.append(True)
+
+    with pytest.raises(RuntimeError, match="stage failed"):
+        asyncio.run(run_stages([
+            Stage("fail", fail),
+            Stage("slow", slow),
+            Stage("dependent", dependent, depends_on=("fail",))
+        ]))
+    assert cancelled == ["slow"]
+    assert ran_dependent == []
+
+
+def test_stages_only_see_their_own_dependencies():
+    seen = {}
+
+    def record(name):
+        async def run(results):
+            seen[name] = dict(results)
+            with pytest.raises(TypeError):
+                results["injected"] = True
+            return name
+        return run
+
+    results, _ = asyncio.run(run_stages([
+        Stage("a", record("a")),
+        Stage("b", record("b")),
+        Stage("c", record("c"), depends_on=("a",))
+    ]))
+    assert results == {"a": "a", "b": "b", "c": "c"}
+    assert seen == {"a": {}, "b": {}, "c": {"a": "a"}}
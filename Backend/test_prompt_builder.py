@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Unit tests for cursor-windowed suggestion prompts (no server or API key needed)
+Run with: python -m pytest test_prompt_builder.py
+"""
+import asyncio
+
+import prompt_builder
+from chunking import CHARS_PER_TOKEN
+from prompt_builder import (SUMMARY_BLOCK_CHARS, SUMMARY_EXTEND_MAX_BLOCKS, PromptBuilder, block_boundaries,
+                            cursor_window, summary_boundary, summary_keys)
+
+WINDOW_TOKENS = 500
+AFTER_TOKENS = 100
+TEXT = "word " * 10000  # 50k characters
+
+
+def test_short_text_is_sent_whole():
+    assert cursor_window("Once upon a time.", None) == (0, 17, 17)
+    assert cursor_window("Once upon a time.", 5) == (0, 5, 17)
+
+
+def test_cursor_is_clamped():
+    assert cursor_window("abc", 99)[1] == 3
+    assert cursor_window("abc", -5)[1] == 0
+
+
+def test_window_stays_within_budget_plus_one_block():
+    for cursor in (None, 20000, 49000, 0):
+        start, at, end = cursor_window(TEXT, cursor, WINDOW_TOKENS, AFTER_TOKENS)
+        assert start <= at <= end <= len(TEXT)
+        assert end - at <= AFTER_TOKENS * CHARS_PER_TOKEN
+        assert end - start <= WINDOW_TOKENS * CHARS_PER_TOKEN + SUMMARY_BLOCK_CHARS
+
+
+def test_window_includes_text_after_cursor_cut_at_whitespace():
+    start, at, end = cursor_window(TEXT, 20000, WINDOW_TOKENS, AFTER_TOKENS)
+    assert end > at
+    assert TEXT[end - 1] == " "
+
+
+def test_window_starts_on_a_summary_boundary():
+    start, _, _ = cursor_window(TEXT, None, WINDOW_TOKENS, AFTER_TOKENS)
+    assert start > 0
+    assert summary_boundary(TEXT, start) == start
+
+
+def test_summary_boundary_is_stable_while_typing():
+    # Appending text never moves a boundary that is already behind the cursor
+    boundary = summary_boundary(TEXT, 30000)
+    assert summary_boundary(TEXT + "more words", 30000) == boundary
+    assert 0 < boundary <= 30000
+    assert TEXT[boundary - 1].isspace()
+    assert summary_boundary(TEXT, SUMMARY_BLOCK_CHARS - 1) == 0
+
+
+def test_block_boundaries_end_at_the_boundary():
+    boundary = summary_boundary(TEXT, 30000)
+    boundaries = block_boundaries(TEXT, boundary)
+    assert boundaries[-1] == boundary
+    assert boundaries == sorted(set(boundaries))
+    assert all(summary_boundary(TEXT, b) == b for b in boundaries)
+
+
+def test_summary_keys_chain_from_the_first_changed_block():
+    boundaries = block_boundaries(TEXT, summary_boundary(TEXT, 30000))
+    edited = TEXT[:5000] + "Word" + TEXT[5004:]  # same length, so block boundaries don't move
+    keys = summary_keys(TEXT, boundaries)
+    edited_keys = summary_keys(edited, boundaries)
+    changed = [i for i, (a, b) in enumerate(zip(keys, edited_keys)) if a != b]
+    # Blocks before the edit keep their keys; the edited block and everything after it change
+    assert changed == list(range(changed[0], len(keys)))
+    assert boundaries[changed[0] - 1] <= 5000 < boundaries[changed[0]]
+
+
+def fake_summaries(monkeypatch):
+    prompts = []
+    calls = []
+
+    class Response:
+        text = "A summary."
+
+    async def generate_content(model, prompt, timeout=None, background=False):
+        prompts.append(prompt)
+        calls.append(background)
+        return Response()
+
+    monkeypatch.setattr(prompt_builder, "generate_content", generate_content)
+    monkeypatch.setattr(prompt_builder, "get_model", lambda purpose: None)
+    return prompts, calls
+
+
+async def settle(builder: PromptBuilder):
+    while builder._in_flight:
+        await asyncio.gather(*builder._in_flight.values())
+
+
+def test_builder_summarizes_in_background_and_reuses_the_summary(monkeypatch):
+    prompts, calls = fake_summaries(monkeypatch)
+
+    async def run():
+        builder = PromptBuilder()
+        first = builder.window(TEXT, None)
+        assert first.summary == "" and first.omitted_chars > 0
+        await settle(builder)
+
+        # Each call folds in at most SUMMARY_EXTEND_MAX_BLOCKS blocks, extending the previous summary
+        blocks = len(block_boundaries(TEXT, first.omitted_chars))
+        assert len(prompts) == -(-blocks // SUMMARY_EXTEND_MAX_BLOCKS)
+        assert all("SUMMARY SO FAR" in prompt for prompt in prompts[1:])
+        assert all(calls)  # summaries use the background slot budget
+
+        second = builder.window(TEXT + "typing", None)
+        assert second.summary == "A summary."
+        assert second.before.endswith("typing")
+        assert builder.stats()["hits"] == 1 and builder.stats()["misses"] == 1
+
+        # A later boundary extends the cached summary instead of re-reading everything
+        before = len(prompts)
+        builder.window(TEXT + "word " * 600, None)
+        await settle(builder)
+        assert len(prompts) == before + 1
+        assert "SUMMARY SO FAR" in prompts[-1]
+
+    asyncio.run(run())
+
+
+def test_early_edit_is_caught_up_from_the_changed_block(monkeypatch):
+    prompts, _ = fake_summaries(monkeypatch)
+
+    async def run():
+        builder = PromptBuilder()
+        start = builder.window(TEXT, None).omitted_chars
+        await settle(builder)
+        cached = len(prompts)
+
+        edited = TEXT[:30000] + "Word" + TEXT[30004:]
+        builder.window(edited, None)
+        await settle(builder)
+
+        # Resumes from the last cached summary before the edit instead of starting over
+        from_scratch = -(-len(block_boundaries(edited, start)) // SUMMARY_EXTEND_MAX_BLOCKS)
+        assert 0 < len(prompts) - cached < from_scratch
+        assert "SUMMARY SO FAR" in prompts[cached]
+        assert builder.window(edited, None).summary == "A summary."
+
+    asyncio.run(run())
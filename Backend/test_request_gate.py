@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Unit tests for latest-wins request coordination (no server needed)
+Run with: python -m pytest test_request_gate.py
+"""
+import asyncio
+
+import pytest
+
+from request_gate import SupersedeGate, SupersededError
+
+
+def test_newer_claim_supersedes_older():
+    gate = SupersedeGate()
+    first = gate.claim("session")
+    assert first.current
+    second = gate.claim("session")
+    assert not first.current and second.current
+    with pytest.raises(SupersededError):
+        first.check()
+    second.check()
+
+
+def test_keys_are_independent():
+    gate = SupersedeGate()
+    a = gate.claim("a")
+    gate.claim("b")
+    assert a.current
+
+
+def test_release_only_forgets_the_current_claim():
+    gate = SupersedeGate()
+    first = gate.claim("session")
+    second = gate.claim("session")
+    first.release()
+    assert second.current
+    with second:
+        pass
+    assert not gate.is_current("session", second.token)
+
+
+def test_run_returns_the_result():
+    async def work():
+        return 42
+
+    async def main():
+        return await SupersedeGate().claim("session").run(work())
+
+    assert asyncio.run(main()) == 42
+
+
+def test_new_claim_cancels_running_work():
+    cancelled = []
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        gate = SupersedeGate()
+        first = gate.claim("session")
+        running = asyncio.ensure_future(first.run(slow()))
+        await started.wait()
+        gate.claim("session")
+        with pytest.raises(SupersededError):
+            await running
+
+    asyncio.run(main())
+    assert cancelled == [True]
+
+
+def test_run_on_a_stale_claim_does_not_start_the_work():
+    started = []
+
+    async def work():
+        started.append(True)
+
+    async def main():
+        gate = SupersedeGate()
+        stale = gate.claim("session")
+        gate.claim("session")
+        with pytest.raises(SupersededError):
+            await stale.run(work())
+
+    asyncio.run(main())
+    assert started == []
+
+
+def test_caller_cancellation_is_not_reported_as_superseded():
+    async def main():
+        claim = SupersedeGate().claim("session")
+        running = asyncio.ensure_future(claim.run(asyncio.sleep(1)))
+        await asyncio.sleep(0)
+        running.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await running
+
+    asyncio.run(main())
+
+
+def test_debounce_gives_up_when_a_newer_request_arrives():
+    async def main():
+        gate = SupersedeGate(debounce_seconds=0.02)
+        first = gate.claim("session")
+        waiting = asyncio.ensure_future(first.debounce())
+        await asyncio.sleep(0)
+        second = gate.claim("session")
+        with pytest.raises(SupersededError):
+            await waiting
+        await second.debounce()
+
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Unit tests for schema-validated LLM output parsing and repair (no server or API key needed)
+Run with: python -m pytest test_structured_output.py
+"""
+import asyncio
+from typing import List
+
+import pytest
+from pydantic import BaseModel, ValidationError
+
+import structured_output
+from structured_output import StructuredOutputError, generate_structured, parse_structured
+
+
+class Item(BaseModel):
+    name: str
+    tags: List[str] = []
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def fake_generate(responses: List[str], prompts: List[str]):
+    async def generate_content(model, prompt, timeout=None):
+        prompts.append(prompt)
+        return FakeResponse(responses.pop(0))
+    return generate_content
+
+
+def test_parse_plain_json():
+    assert parse_structured('{"name": "Luna", "tags": ["pilot"]}', Item) == Item(name="Luna", tags=["pilot"])
+
+
+def test_parse_json_in_code_fence_or_prose():
+    assert parse_structured('```json\n{"name": "Luna"}\n```', Item).name == "Luna"
+    assert parse_structured('Here you go: {"name": "Luna"} Hope that helps.', Item).name == "Luna"
+
+
+def test_parse_without_json_object():
+    with pytest.raises(ValueError, match="no JSON object"):
+        parse_structured("I could not find anything.", Item)
+
+
+def test_valid_json_with_wrong_shape_is_a_validation_error():
+    # Not retried through the tolerant path: the JSON parsed, it just doesn't fit
+    with pytest.raises(ValidationError):
+        parse_structured('{"tags": ["pilot"]}', Item)
+
+
+def test_generate_structured_without_repair(monkeypatch):
+    prompts = []
+    monkeypatch.setattr(structured_output, "generate_content", fake_generate(['{"name": "Luna"}'], prompts))
+
+    assert asyncio.run(generate_structured(None, "extract", Item)).name == "Luna"
+    assert prompts == ["extract"]
+
+
+def test_generate_structured_repairs_once(monkeypatch):
+    prompts = []
+    responses = ['{"tags": "pilot"}', '{"name": "Luna", "tags": ["pilot"]}']
+    monkeypatch.setattr(structured_output, "generate_content", fake_generate(responses, prompts))
+
+    assert asyncio.run(generate_structured(None, "extract", Item)) == Item(name="Luna", tags=["pilot"])
+    assert len(prompts) == 2
+    # The repair call carries the invalid JSON and schema, not the original prompt
+    assert '{"tags": "pilot"}' in prompts[1]
+    assert '"name"' in prompts[1]
+    assert "extract" not in prompts[1]
+
+
+def test_generate_structured_fails_after_repair(monkeypatch):
+    prompts = []
+    monkeypatch.setattr(structured_output, "generate_content", fake_generate(["not json", "still not json"], prompts))
+
+    with pytest.raises(StructuredOutputError) as error:
+        asyncio.run(generate_structured(None, "extract", Item))
+    assert error.value.raw_text == "still not json"
+    assert len(prompts) == 2
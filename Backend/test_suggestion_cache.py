@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the prefix-aware auto-suggestion cache (no server needed)
+Run with: python -m pytest test_suggestion_cache.py
+"""
+from suggestion_cache import SuggestionCache
+
+SUGGESTIONS = ["there was a king.", "She turned to go.", "The rain stopped."]
+
+
+def cache_with(text: str, suggestions=SUGGESTIONS) -> SuggestionCache:
+    cache = SuggestionCache()
+    cache.store("session", text, "context", list(suggestions))
+    return cache
+
+
+def test_lookup_returns_longest_cached_prefix():
+    cache = SuggestionCache()
+    cache.store("session", "Once upon a time.", "short", SUGGESTIONS)
+    cache.store("session", "Once upon a time. The end", "long", SUGGESTIONS)
+
+    entry, typed = cache.lookup("session", "Once upon a time. The end came")
+    assert entry["context_text"] == "long"
+    assert typed == " came"
+
+
+def test_lookup_misses_unrelated_text_and_other_sessions():
+    cache = cache_with("Once upon a time.")
+    assert cache.lookup("session", "A different story") is None
+    assert cache.lookup("other", "Once upon a time. More") is None
+
+
+def test_store_replaces_entry_for_same_text():
+    cache = cache_with("Once upon a time.")
+    cache.store("session", "Once upon a time.", "new context", ["Again."])
+
+    entry, typed = cache.lookup("session", "Once upon a time.")
+    assert entry["context_text"] == "new context"
+    assert typed == ""
+    assert len(cache.sessions["session"]) == 1
+
+
+def test_completions_at_word_boundary():
+    entry, typed = cache_with("Once upon a time. ").lookup("session", "Once upon a time. there was")
+    assert SuggestionCache.completions(entry, typed) == ["a king."]
+
+
+def test_completions_after_trailing_space():
+    entry, typed = cache_with("Once upon a time. ").lookup("session", "Once upon a time. there ")
+    assert SuggestionCache.completions(entry, typed) == ["was a king."]
+
+
+def test_no_completions_mid_word():
+    # "the" + "re was a king." would be inserted as "the re was a king."
+    entry, typed = cache_with("Once upon a time. ").lookup("session", "Once upon a time. the")
+    assert SuggestionCache.completions(entry, typed) == []
+
+
+def test_no_completions_before_punctuation():
+    entry, typed = cache_with("Done. ", ["Well, he said."]).lookup("session", "Done. Well")
+    assert SuggestionCache.completions(entry, typed) == []
+
+
+def test_no_completions_without_new_text_or_when_fully_typed():
+    cache = cache_with("Once upon a time. ")
+    entry, typed = cache.lookup("session", "Once upon a time. ")
+    assert SuggestionCache.completions(entry, typed) == []
+
+    entry, typed = cache.lookup("session", "Once upon a time. there was a king.")
+    assert SuggestionCache.completions(entry, typed) == []
+
+
+def test_completions_ignore_leading_whitespace_typed():
+    entry, typed = cache_with("Once upon a time.").lookup("session", "Once upon a time. She turned")
+    assert SuggestionCache.completions(entry, typed) == ["to go."]
+
+
+def test_get_counts_completion_hits_context_hits_and_misses():
+    cache = cache_with("Once upon a time, ")
+
+    entry, completions = cache.get("session", "Once upon a time, there ")
+    assert completions == ["was a king."]
+    assert cache.get("session", "Once upon a time, a dragon") == (entry, [])
+    assert cache.get("session", "A different story") is None
+    # A cursor before the end of the text is never matched
+    assert cache.get("session", "Once upon a time, there ", cursor_position=4) is None
+
+    stats = cache.stats()
+    assert (stats["completion_hits"], stats["context_hits"], stats["misses"]) == (1, 1, 2)
+
+
+def test_get_misses_when_too_much_was_typed():
+    cache = cache_with("Once upon a time, ")
+    assert cache.get("session", "Once upon a time, " + "x" * 1000) is None
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Unit tests for streamed suggestion parsing (no server needed)
+Run with: python -m pytest test_suggestion_parsing.py
+"""
+from suggestion_parsing import SuggestionStreamParser, parse_suggestion_line
+
+
+def test_parse_suggestion_line():
+    assert parse_suggestion_line("  2. She turned to go.  ") == "She turned to go."
+    assert parse_suggestion_line("4. Out of range") is None
+    assert parse_suggestion_line("1.") is None
+    assert parse_suggestion_line("Here are some ideas:") is None
+
+
+def test_one_chunk_completing_two_lines_gets_distinct_indexes():
+    parser = SuggestionStreamParser()
+    assert parser.feed("1. First idea.\n2. Second idea.\n3. Th") == [(0, "First idea."), (1, "Second idea.")]
+    assert parser.close() == [(2, "Th")]
+
+
+def test_lines_split_across_chunks():
+    parser = SuggestionStreamParser()
+    found = []
+    for chunk in ["1. Fir", "st idea.\n", "Intro text\n2.", " Second idea.\n3. Third", " idea."]:
+        found += parser.feed(chunk)
+    found += parser.close()
+    assert found == [(0, "First idea."), (1, "Second idea."), (2, "Third idea.")]
+    assert parser.suggestions == ["First idea.", "Second idea.", "Third idea."]
+    assert parser.text == "1. First idea.\nIntro text\n2. Second idea.\n3. Third idea."
+
+
+def test_stops_at_max_suggestions():
+    parser = SuggestionStreamParser(max_suggestions=2)
+    assert parser.feed("1. A\n2. B\n3. C\n") == [(0, "A"), (1, "B")]
+    assert parser.close() == []
+
+
+def test_close_without_pending_line():
+    parser = SuggestionStreamParser()
+    assert parser.feed("1. Only one.\n") == [(0, "Only one.")]
+    assert parser.close() == []
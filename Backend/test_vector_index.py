@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the in-process vector indexes (no server or database needed)
+Run with: python -m pytest test_vector_index.py
+"""
+import asyncio
+
+import pytest
+
+import vector_index
+from vector_index import LocalVectorIndex, NumpyVectorIndex
+
+needs_numpy = pytest.mark.skipif(vector_index.np is None, reason="numpy is not installed")
+
+
+def row(row_id: str, vector, document_id: str = "doc"):
+    return {"id": row_id, "document_id": document_id, "section_id": f"chunk_{row_id}", "metadata": {}, "vector": vector}
+
+
+@needs_numpy
+def test_search_orders_by_similarity_and_applies_threshold():
+    index = NumpyVectorIndex(dimensions=2)
+    index.upsert([row("x", [1, 0]), row("diagonal", [1, 1]), row("y", "[0, 1]")])
+    assert len(index) == 3
+
+    results = index.search([2, 0.1], limit=2, match_threshold=0.0)
+    assert [r["id"] for r in results] == ["x", "diagonal"]
+    assert results[0]["similarity"] > results[1]["similarity"]
+    assert set(results[0]) == {"id", "document_id", "section_id", "metadata", "similarity"}
+
+    assert [r["id"] for r in index.search([1, 0], limit=5, match_threshold=0.9)] == ["x"]
+
+
+@needs_numpy
+def test_upsert_replaces_rows_with_the_same_id():
+    index = NumpyVectorIndex(dimensions=2)
+    index.upsert([row("a", [1, 0])])
+    index.upsert([row("a", [0, 1], document_id="moved")])
+    assert len(index) == 1
+    result = index.search([0, 1], limit=1, match_threshold=0.9)
+    assert result[0]["document_id"] == "moved"
+
+
+@needs_numpy
+def test_remove_keeps_positions_consistent():
+    index = NumpyVectorIndex(dimensions=2)
+    index.upsert([row("a", [1, 0]), row("b", [0, 1]), row("c", [-1, 0])])
+    index.remove(["a", "missing"])
+    assert len(index) == 2
+    assert [r["id"] for r in index.search([-1, 0], limit=1, match_threshold=0.0)] == ["c"]
+    index.upsert([row("b", [-1, 0.1])])
+    assert len(index) == 2
+
+
+@needs_numpy
+def test_empty_index_and_zero_query():
+    index = NumpyVectorIndex(dimensions=2)
+    assert index.search([1, 0], limit=5, match_threshold=0.0) == []
+    index.upsert([row("a", [1, 0])])
+    assert index.search([0, 0], limit=5, match_threshold=-1.0) == []
+    assert index.search([1, 0], limit=0, match_threshold=-1.0) == []
+
+
+class FakeIndex:
+    def __init__(self):
+        self.ids = []
+
+    def upsert(self, rows):
+        self.ids += [r["id"] for r in rows if r["id"] not in self.ids]
+
+    def remove(self, ids):
+        self.ids = [i for i in self.ids if i not in ids]
+
+    def search(self, query, limit, match_threshold):
+        return [{"id": i} for i in self.ids[:limit]]
+
+
+class FakeRepository:
+    def __init__(self, rows):
+        self.rows = rows
+        self.loads = 0
+        self.release = None
+
+    async def list_user_embeddings(self, user_id):
+        self.loads += 1
+        if self.release is not None:
+            await self.release.wait()
+        return list(self.rows)
+
+
+def test_concurrent_first_searches_share_one_load():
+    repository = FakeRepository([row("a", [1, 0])])
+
+    async def main():
+        local = LocalVectorIndex(repository, index_factory=FakeIndex)
+        return await asyncio.gather(local.search("user", [1, 0]), local.search("user", [1, 0]))
+
+    assert asyncio.run(main()) == [[{"id": "a"}], [{"id": "a"}]]
+    assert repository.loads == 1
+
+
+def test_stale_index_is_served_while_refreshing_and_keeps_writes():
+    repository = FakeRepository([row("a", [1, 0])])
+
+    async def main():
+        local = LocalVectorIndex(repository, index_factory=FakeIndex, ttl_seconds=0)
+        await local.get("user")
+
+        # The next search sees an expired index: it is served at once and a refresh starts
+        repository.rows.append(row("b", [0, 1]))
+        repository.release = asyncio.Event()
+        stale = await local.get("user")
+        assert stale.ids == ["a"]
+        await asyncio.sleep(0)
+        assert repository.loads == 2
+
+        # A write during the refresh lands on the old index and is replayed onto the new one
+        local.add("user", [row("c", [1, 1])])
+        assert stale.ids == ["a", "c"]
+        repository.release.set()
+        await local._loading["user"]
+        fresh, _ = local._indexes["user"]
+        assert fresh is not stale and fresh.ids == ["a", "b", "c"]
+        assert "user" not in local._replay
+
+    asyncio.run(main())
+
+
+def test_unavailable_without_an_index_backend():
+    async def main():
+        local = LocalVectorIndex(FakeRepository([]))
+        local.index_factory = None
+        return local.available, await local.search("user", [1, 0])
+
+    assert asyncio.run(main()) == (False, [])
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from cachetools import LRUCache
+
+from embeddings import EMBEDDING_DIMENSIONS
+
+try:
+    import numpy as np
+except ImportError:  # the local index is optional
+    np = None
+
+# Serve vector search from in-process indexes instead of the pgvector RPC
+LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "false").lower() in ("1", "true", "yes")
+LOCAL_VECTOR_INDEX_MAX_USERS = int(os.getenv("LOCAL_VECTOR_INDEX_MAX_USERS", "1000"))
+# Indexes are refreshed in the background after this long so writes from other workers show up
+LOCAL_VECTOR_INDEX_TTL_SECONDS = int(os.getenv("LOCAL_VECTOR_INDEX_TTL_SECONDS", "300"))
+
+
+def _parse_vector(vector: Any) -> List[float]:
+    """PostgREST returns pgvector columns as '[0.1,0.2,...]' strings"""
+    if isinstance(vector, str):
+        return json.loads(vector)
+    return vector
+
+
+class NumpyVectorIndex:
+    """Brute-force cosine index: a matrix of normalized vectors searched with one matrix product"""
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+        self.matrix = np.zeros((0, dimensions), dtype=np.float32)
+        self.rows: List[Dict[str, Any]] = []
+        self.positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def upsert(self, rows: Iterable[Dict[str, Any]]):
+        """Add rows, replacing any that are already indexed under the same id"""
+        new_rows = []
+        new_vectors = []
+        for row in rows:
+            vector = np.asarray(_parse_vector(row["vector"]), dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector = vector / norm
+            entry = {key: row.get(key) for key in ("id", "document_id", "section_id", "metadata")}
+
+            position = self.positions.get(row["id"])
+            if position is not None:
+                self.matrix[position] = vector
+                self.rows[position] = entry
+            else:
+                new_rows.append(entry)
+                new_vectors.append(vector)
+
+        if new_rows:
+            for entry in new_rows:
+                self.positions[entry["id"]] = len(self.rows)
+                self.rows.append(entry)
+            self.matrix = np.vstack([self.matrix, np.stack(new_vectors)])
+
+    def remove(self, ids: Iterable[str]):
+        """Drop rows by id"""
+        drop = {self.positions[i] for i in ids if i in self.positions}
+        if not drop:
+            return
+        keep = [position for position in range(len(self.rows)) if position not in drop]
+        self.matrix = self.matrix[keep]
+        self.rows = [self.rows[position] for position in keep]
+        self.positions = {row["id"]: position for position, row in enumerate(self.rows)}
+
+    def search(self, query: List[float], limit: int, match_threshold: float) -> List[Dict[str, Any]]:
+        """Top-k rows by cosine similarity, in the same shape the search_embeddings RPC returns"""
+        if not self.rows or limit <= 0:
+            return []
+
+        query_vector = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if norm == 0:
+            return []
+        similarities = self.matrix @ (query_vector / norm)
+
+        k = min(limit, len(self.rows))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+
+        return [
+            dict(self.rows[position], similarity=float(similarities[position]))
+            for position in top
+            if similarities[position] > match_threshold
+        ]
+
+
+class LocalVectorIndex:
+    """Per-user in-process vector indexes, warm-loaded from the embedding table on first use.
+
+    An index older than ``ttl_seconds`` keeps serving searches while a fresh
+    copy loads in the background, so writes from other workers show up without
+    a search ever waiting on a reload. Only a user's first search waits for
+    the load. Vectors are parsed and indexed off the event loop.
+
+    ``index_factory`` builds the per-user backend; any object with upsert,
+    remove and search methods like NumpyVectorIndex can be plugged in.
+    """
+
+    def __init__(self, repository, index_factory: Optional[Callable[[], Any]] = None,
+                 max_users: int = LOCAL_VECTOR_INDEX_MAX_USERS, ttl_seconds: int = LOCAL_VECTOR_INDEX_TTL_SECONDS):
+        self.repository = repository
+        self.index_factory = index_factory or (NumpyVectorIndex if np is not None else None)
+        self.ttl_seconds = ttl_seconds
+        # user_id -> (index, loaded_at)
+        self._indexes = LRUCache(maxsize=max_users)
+        self._loading: Dict[str, asyncio.Task] = {}
+        # Writes made while a user's index is loading, replayed onto the new index
+        self._replay: Dict[str, List[Tuple[str, Any]]] = {}
+
+    @property
+    def available(self) -> bool:
+        return self.index_factory is not None
+
+    def _build(self, rows: List[Dict[str, Any]]):
+        index = self.index_factory()
+        index.upsert(rows)
+        return index
+
+    async def _load(self, user_id: str):
+        rows = await self.repository.list_user_embeddings(user_id)
+        # Parsing and normalizing every vector is CPU-bound; keep it off the event loop
+        index = await asyncio.to_thread(self._build, rows)
+        for operation, argument in self._replay[user_id]:
+            getattr(index, operation)(argument)
+        self._indexes[user_id] = (index, time.monotonic())
+        return index
+
+    def _start_load(self, user_id: str) -> asyncio.Task:
+        task = self._loading.get(user_id)
+        if task is None:
+            self._replay[user_id] = []
+            task = asyncio.ensure_future(self._load(user_id))
+            self._loading[user_id] = task
+            task.add_done_callback(lambda _: self._finish_load(user_id))
+        return task
+
+    def _finish_load(self, user_id: str):
+        self._loading.pop(user_id, None)
+        self._replay.pop(user_id, None)
+
+    async def get(self, user_id: str):
+        """Return the user's index, loading it once even if several requests ask at the same time"""
+        entry = self._indexes.get(user_id)
+        if entry is None:
+            return await self._start_load(user_id)
+
+        index, loaded_at = entry
+        if time.monotonic() - loaded_at > self.ttl_seconds and user_id not in self._loading:
+            # Serve the stale index now; the refreshed one replaces it when ready. Restarting
+            # the clock means a failed refresh is retried after another TTL, not on every search
+            self._indexes[user_id] = (index, time.monotonic())
+            self._start_load(user_id).add_done_callback(self._log_refresh_error)
+        return index
+
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error refreshing local vector index: {task.exception()}")
+
+    def add(self, user_id: str, rows: List[Dict[str, Any]]):
+        """Keep an already loaded (or loading) index in sync with newly written embedding rows"""
+        self._apply(user_id, "upsert", rows)
+
+    def remove(self, user_id: str, ids: List[str]):
+        """Keep an already loaded (or loading) index in sync with deleted embedding rows"""
+        self._apply(user_id, "remove", ids)
+
+    def _apply(self, user_id: str, operation: str, argument: Any):
+        entry = self._indexes.get(user_id)
+        if entry is not None:
+            getattr(entry[0], operation)(argument)
+        if user_id in self._replay:
+            self._replay[user_id].append((operation, argument))
+
+    async def search(self, user_id: str, query_embedding: List[float], limit: int = 5,
+                     match_threshold: float = 0.7) -> List[Dict[str, Any]]:
+        """Top-k cosine search over a user's embeddings"""
+        if not self.available:
+            return []
+        index = await self.get(user_id)
+        return index.search(query_embedding, limit, match_threshold)
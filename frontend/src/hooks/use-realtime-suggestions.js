@@ -61,6 +61,7 @@ export function useRealtimeSuggestions(userId, sessionId) {
 
       } catch (err) {
         if (err.name === 'AbortError') return // Ignore aborted requests
+        if (err.status === 409) return // Superseded server-side by a newer request
         
         console.error('Error fetching suggestions:', err)
         setError(err.message)
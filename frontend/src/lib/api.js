@@ -15,9 +15,11 @@ class WritingAPI {
 
     if (!response.ok) {
       const errorText = await response.text()
-      throw new Error(
+      const error = new Error(
         `API request failed: ${response.statusText} - ${errorText}`,
       )
+      error.status = response.status
+      throw error
     }
 
     return response.json()